@@ -0,0 +1,295 @@
+"""
+Application-level (ad hoc) lock primitives for concurrent trace replay.
+
+The applications coordinate many of their transactions with locks that
+live outside the database: scmsuite's Java synchronized methods,
+Broadleaf's in-JVM cart lock around do_filter_internal_unless_ignored,
+and the Redis lock Mastodon takes in show_media_attachment. A
+LockPrimitive describes how such a lock behaves:
+
+    scope             "process": each application node has its own copy
+                      (synchronized, in-JVM maps); "cluster": one lock
+                      shared by all nodes (a lock service such as Redis)
+    acquire_latency   time to take a free lock (a lock service round trip)
+    release_latency   time to release it
+    lease             after this long the lock expires even if its holder
+                      is still running (None: held until released)
+    retry_interval    waiters poll the lock at this interval instead of
+                      being handed it on release (None: FIFO handoff)
+
+DECLARED maps each transaction type to the AdHocLock that wraps it: the
+primitive and what it locks (the type itself, a named object, or the row
+of one table the transaction touches). simulate() runs the traces on
+closed-loop clients spread over application nodes, with database
+operations timed by latency.CostModel but not locked, and reports
+throughput, latency and how often mutual exclusion failed: a transaction
+entering a critical section another client is still in, because the
+lock was per-process or its lease ran out during a pause.
+
+### EXAMPLE OUTPUT ###
+
+Simulating 32 clients over 20000 transactions
+deployment                                txn/s    p99(us)  violations  conflicting  expiries
+1 node, declared locks                     1806     167935           0            0         0
+4 nodes, declared locks                    6989      53247        4568         1785         0
+4 nodes, cluster lease locks               1655     356351         434           97        73
+4 nodes, no ad hoc locks                  19322       8063           0            0         0
+
+Violations by transaction type (4 nodes, declared locks)
+scmsuite.remove_catalog_list                      1411
+scmsuite.copy_catalog_form                        1318
+scmsuite.get_update_sql                            673
+scmsuite.add_supply_order                          581
+scmsuite.internal_save_retail                      576
+broadleaf.update_order                               9
+"""
+
+import heapq
+import random
+from collections import deque
+import workloads
+from latency import CostModel, LatencyHistogram, LatencyReport, key_name
+from transaction import Transaction
+
+#################################
+####     Lock primitives     ####
+#################################
+
+class LockPrimitive:
+    """
+    Behavior of an application-level lock (see the module docstring).
+    Times are in microseconds.
+    """
+    def __init__(self, name: str, scope: str = "process", acquire_latency: int = 1, release_latency: int = 1,
+                 lease: int = None, retry_interval: int = None):
+        if scope not in ("process", "cluster"):
+            raise ValueError(f"unknown scope {scope!r}")
+        self.name = name
+        self.scope = scope
+        self.acquire_latency = acquire_latency
+        self.release_latency = release_latency
+        self.lease = lease
+        self.retry_interval = retry_interval
+
+    def __repr__(self):
+        return f"LockPrimitive({self.name!r}, scope={self.scope!r})"
+
+# Java monitor: per JVM, blocked threads are handed the lock on release
+SYNCHRONIZED = LockPrimitive("synchronized", "process", acquire_latency=1, release_latency=1)
+# Redis SET NX PX lock: one network round trip per attempt, polled, expiring
+REDIS_LOCK = LockPrimitive("redis", "cluster", acquire_latency=500, release_latency=500, lease=30000, retry_interval=1000)
+
+class AdHocLock:
+    """
+    The lock wrapping one transaction type. It locks the row of table
+    that the transaction touches first if table is given, otherwise the
+    object called name (by default the transaction type itself, as a
+    synchronized method does).
+
+    Example usage:
+    >>> lock = AdHocLock(SYNCHRONIZED, table="cart")
+    >>> lock.key("broadleaf.update_order", ["r-cart(6)", "w-order(21)"])
+    'cart(6)'
+    >>> AdHocLock(REDIS_LOCK).key("mastodon.create_marker", [])
+    'mastodon.create_marker'
+    """
+    def __init__(self, primitive: LockPrimitive, table: str = None, name: str = None):
+        self.primitive = primitive
+        self.table = table
+        self.name = name
+
+    def key(self, workload_name: str, trace: list[str]) -> str:
+        if self.table is not None:
+            for op in trace:
+                if key_name(op[2:]) == self.table:
+                    return op[2:]
+        return self.name or workload_name
+
+DECLARED = {
+    "scmsuite.internal_save_retail": AdHocLock(SYNCHRONIZED),
+    "scmsuite.add_supply_order": AdHocLock(SYNCHRONIZED),
+    "scmsuite.get_update_sql": AdHocLock(SYNCHRONIZED),
+    # Both synchronized methods of the catalog manager
+    "scmsuite.copy_catalog_form": AdHocLock(SYNCHRONIZED, name="catalog_manager"),
+    "scmsuite.remove_catalog_list": AdHocLock(SYNCHRONIZED, name="catalog_manager"),
+    "broadleaf.update_order": AdHocLock(SYNCHRONIZED, table="cart"),
+    "mastodon.show_media_attachment": AdHocLock(REDIS_LOCK, table="media_attachments"),
+}
+
+def with_primitive(locks: dict, primitive: LockPrimitive) -> dict:
+    """
+    The same declarations with every lock replaced by primitive.
+    """
+    return {name: AdHocLock(primitive, lock.table, lock.name) for name, lock in locks.items()}
+
+
+#################################
+####       Simulation        ####
+#################################
+
+class AdHocReport:
+    """
+    Outcome of one simulate() run.
+    """
+    HEADER = f"{'deployment':<38}{'txn/s':>9}{'p99(us)':>11}{'violations':>12}{'conflicting':>13}{'expiries':>10}"
+
+    def __init__(self, latency: LatencyReport, violations: dict, conflicting: int, expiries: int):
+        self.latency = latency
+        self.violations = violations        # transaction type -> critical sections entered while occupied
+        self.conflicting = conflicting      # violations where the overlapping transactions conflict
+        self.expiries = expiries            # leases that ran out while their holder was running
+
+    def row(self, label: str) -> str:
+        return (f"{label:<38}{self.latency.throughput:>9.0f}{self.latency.overall().value_at_percentile(99):>11}"
+                f"{sum(self.violations.values()):>12}{self.conflicting:>13}{self.expiries:>10}")
+
+def simulate(transactions: list[tuple[str, Transaction]], num_clients: int, num_nodes: int = 1,
+             locks: dict = DECLARED, cost_model: CostModel = None, pause_probability: float = 0.01,
+             pause: int = 50000, seed: int = 0) -> AdHocReport:
+    """
+    Run (workload name, Transaction) pairs on num_clients closed-loop
+    clients, client i on application node i % num_nodes. A transaction
+    type listed in locks first takes its ad hoc lock, runs its trace in
+    the critical section and then releases the lock; other types just
+    run. With probability pause_probability a critical section is
+    stretched by a pause (e.g. garbage collection) of pause microseconds,
+    which can outlast a lease.
+    """
+    cost_model = cost_model or CostModel()
+    durations = [sum(cost for _, _, cost in cost_model.plan(t.get_trace(), t.rows)) + cost_model.commit
+                 for _, t in transactions]
+    histograms = {name: LatencyHistogram() for name, _ in transactions}
+    rng = random.Random(seed)
+
+    events = []             # (time, sequence number, client, action)
+    sequence = 0
+    next_txn = 0
+    current = [None] * num_clients
+    started_at = [0] * num_clients
+    identity = [None] * num_clients     # lock the client holds or waits for
+    logical = [None] * num_clients      # what that lock protects, across nodes
+    holders = {}            # lock identity -> (client, lease expiry or None)
+    queues = {}             # lock identity -> clients waiting for a handoff
+    inside = {}             # logical lock -> clients in its critical section
+    violations = {}
+    conflicting = expiries = 0
+    now = 0
+
+    def push(time: int, client: int, action: str):
+        nonlocal sequence
+        sequence += 1
+        heapq.heappush(events, (time, sequence, client, action))
+
+    def grant(client: int, time: int):
+        primitive = locks[transactions[current[client]][0]].primitive
+        expiry = time + primitive.acquire_latency + primitive.lease if primitive.lease is not None else None
+        holders[identity[client]] = (client, expiry)
+        push(time + primitive.acquire_latency, client, "enter")
+
+    for client in range(min(num_clients, len(transactions))):
+        current[client] = next_txn
+        next_txn += 1
+        push(0, client, "begin")
+
+    while events:
+        now, _, client, action = heapq.heappop(events)
+        name, t = transactions[current[client]]
+        lock = locks.get(name)
+
+        if action == "begin":
+            if lock is None:
+                push(now, client, "enter")
+                continue
+            key = lock.key(name, t.get_trace())
+            logical[client] = key
+            identity[client] = key if lock.primitive.scope == "cluster" else (client % num_nodes, key)
+            action = "acquire"
+
+        if action == "acquire":
+            holder = holders.get(identity[client])
+            if holder is not None and holder[1] is not None and holder[1] <= now:
+                # The lease ran out; the lock is free although its holder may still be running
+                if holder[0] in inside.get(logical[client], ()):
+                    expiries += 1
+                holder = None
+            if holder is None:
+                grant(client, now)
+            elif lock.primitive.retry_interval is not None:
+                push(now + lock.primitive.acquire_latency + lock.primitive.retry_interval, client, "acquire")
+            else:
+                queues.setdefault(identity[client], deque()).append(client)
+            continue
+
+        if action == "enter":
+            duration = durations[current[client]]
+            if lock is not None:
+                occupants = inside.setdefault(logical[client], set())
+                if occupants:
+                    violations[name] = violations.get(name, 0) + 1
+                    conflicting += any(t.conflicts_with(transactions[current[other]][1]) for other in occupants)
+                occupants.add(client)
+                if rng.random() < pause_probability:
+                    duration += pause
+            push(now + duration, client, "exit")
+            continue
+
+        # action == "exit"
+        finish = now
+        if lock is not None:
+            inside[logical[client]].discard(client)
+            finish += lock.primitive.release_latency
+            holder = holders.get(identity[client])
+            if holder is not None and holder[0] == client:
+                # Like a Redis lock's token check, only the current holder releases
+                del holders[identity[client]]
+                queue = queues.get(identity[client])
+                if queue:
+                    waiter = queue.popleft()
+                    grant(waiter, now)
+        histograms[name].record(finish - started_at[client])
+        if next_txn < len(transactions):
+            current[client] = next_txn
+            next_txn += 1
+            started_at[client] = finish
+            push(finish, client, "begin")
+
+    return AdHocReport(LatencyReport(histograms, now, 0), violations, conflicting, expiries)
+
+def main():
+    """
+    Compare deployments of the ad hoc locked transactions mixed with
+    the rest of the workloads.
+    """
+    import numpy as np
+    num_txn = 20000
+    num_clients = 32
+    names = workloads.names()
+    np.random.seed(0)
+    # Weight the ad hoc locked types up so that their locks see contention
+    weights = np.array([4.0 if name in DECLARED else 1.0 for name in names])
+    transactions = list(workloads.mix(names, num_txn, weights / weights.sum()))
+
+    deployments = [
+        ("1 node, declared locks", 1, DECLARED),
+        ("4 nodes, declared locks", 4, DECLARED),
+        ("4 nodes, cluster lease locks", 4, with_primitive(DECLARED, REDIS_LOCK)),
+        ("4 nodes, no ad hoc locks", 4, {}),
+    ]
+
+    # Extra space for formatting
+    print()
+    print(f"Simulating {num_clients} clients over {num_txn} transactions")
+    print(AdHocReport.HEADER)
+    reports = {}
+    for label, num_nodes, locks in deployments:
+        reports[label] = simulate(transactions, num_clients, num_nodes, locks)
+        print(reports[label].row(label))
+    print()
+    print("Violations by transaction type (4 nodes, declared locks)")
+    violations = reports["4 nodes, declared locks"].violations
+    for name in sorted(violations, key=violations.get, reverse=True):
+        print(f"{name:<48}{violations[name]:>6}")
+    print()
+
+if __name__ == "__main__":
+    main()
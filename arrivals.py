@@ -0,0 +1,251 @@
+"""
+Open-loop arrival processes for timestamped transaction streams.
+
+The *_stream functions produce transactions back to back, which only
+models closed-loop clients. Here arrival times are drawn independently of
+how fast transactions complete, so a simulated or real database can fall
+behind and show queueing collapse. All processes return a sorted NumPy
+array of arrival times in seconds and are vectorized:
+
+    poisson_arrivals    homogeneous Poisson process
+    mmpp_arrivals       Markov-modulated Poisson process (bursty traffic)
+    diurnal_arrivals    sinusoidal day/night rate via thinning
+    replay_arrivals     piecewise-constant rates from a recorded trace
+
+timestamped() pairs any stream with arrival times, and emit() releases a
+timestamped stream in real time from an asyncio event loop, in batches of
+everything that is due so that it can sustain 100k+ transactions/s.
+
+### EXAMPLE OUTPUT ###
+
+Poisson arrivals at 1000 txn/s
+0.000210 spree.adjustment_update ['r-adjustment-id(70)']
+0.000536 mastodon.show_media_attachment ['r-media_attachments(532)', 'w-media_attachments(532)']
+0.001394 broadleaf.rate_item ['r-summary(35)', 'r-detail(74)', 'w-detail(74)/rating(3)', 'w-summary(35)/rating(3)']
+0.001905 mastodon.create_backup ['w-backup(509)']
+0.003290 spree.remove_line_item ['r-order_id-variant_id((56, 46))']
+
+Emitting 200000 arrivals in real time at 100000 txn/s
+emitted=200000 elapsed=1.997s rate=100130 txn/s max_lag=0.0070s
+"""
+
+import asyncio
+import numpy as np
+import workloads
+
+#################################
+####   Arrival processes     ####
+#################################
+
+def poisson_arrivals(rate: float, num: int, start: float = 0.0) -> np.ndarray:
+    """
+    Return num arrival times of a Poisson process with the given rate
+    (arrivals per second).
+
+    Example usage:
+    >>> np.random.seed(0)
+    >>> poisson_arrivals(10, 3).round(3).tolist()
+    [0.08, 0.205, 0.298]
+    """
+    return start + np.cumsum(np.random.exponential(1.0 / rate, size=num))
+
+def mmpp_arrivals(rates: list[float], mean_dwell: list[float], num: int, start: float = 0.0) -> np.ndarray:
+    """
+    Return num arrival times of a Markov-modulated Poisson process. The
+    process stays in state i for an exponential time with mean
+    mean_dwell[i], producing Poisson arrivals at rates[i], then jumps to a
+    uniformly chosen other state. Two states with a low and a high rate
+    give on/off bursts.
+    """
+    rates = np.asarray(rates, dtype=np.float64)
+    mean_dwell = np.broadcast_to(np.asarray(mean_dwell, dtype=np.float64), rates.shape)
+    num_states = len(rates)
+    # Expected arrivals per sojourn, used to size each batch of sojourns
+    expected = max(float(np.mean(rates * mean_dwell)), 1e-9)
+    chunks = []
+    produced = 0
+    state = np.random.randint(num_states)
+    clock = start
+    while produced < num:
+        batch = int(min(max((num - produced) / expected * 1.2, 16), 1_000_000))
+        # Sequence of states: each jump moves to one of the other states
+        jumps = np.random.randint(1, num_states, size=batch) if num_states > 1 else np.zeros(batch, dtype=np.int64)
+        states = (state + np.concatenate(([0], np.cumsum(jumps[1:])))) % num_states
+        dwell = np.random.exponential(mean_dwell[states])
+        begins = clock + np.concatenate(([0.0], np.cumsum(dwell[:-1])))
+        counts = np.random.poisson(rates[states] * dwell)
+        total = int(counts.sum())
+        offsets = np.random.random(total) * np.repeat(dwell, counts)
+        arrivals = np.repeat(begins, counts) + offsets
+        # Arrivals are sorted within a sojourn and sojourns do not overlap
+        order = np.lexsort((offsets, np.repeat(np.arange(batch), counts)))
+        chunks.append(arrivals[order])
+        produced += total
+        clock = begins[-1] + dwell[-1]
+        state = (states[-1] + (np.random.randint(1, num_states) if num_states > 1 else 0)) % num_states
+    return np.concatenate(chunks)[:num]
+
+def diurnal_arrivals(mean_rate: float, num: int, amplitude: float = 0.5, period: float = 86400.0, phase: float = 0.0, start: float = 0.0) -> np.ndarray:
+    """
+    Return num arrival times of a non-homogeneous Poisson process with
+    rate mean_rate * (1 + amplitude * sin(2 pi (t + phase) / period)),
+    sampled by thinning a homogeneous process at the peak rate.
+
+    Example usage:
+    >>> np.random.seed(0)
+    >>> times = diurnal_arrivals(100, 10000, amplitude=0.9, period=10)
+    >>> day = np.histogram(times % 10, bins=[0, 5, 10])[0]
+    >>> bool(day[0] > 3 * day[1])
+    True
+    """
+    peak = mean_rate * (1 + abs(amplitude))
+    chunks = []
+    produced = 0
+    clock = start
+    while produced < num:
+        batch = int((num - produced) * (1 + abs(amplitude)) * 1.1) + 16
+        candidates = clock + np.cumsum(np.random.exponential(1.0 / peak, size=batch))
+        rate = mean_rate * (1 + amplitude * np.sin(2 * np.pi * (candidates + phase) / period))
+        accepted = candidates[np.random.random(batch) * peak < rate]
+        chunks.append(accepted)
+        produced += len(accepted)
+        clock = candidates[-1]
+    return np.concatenate(chunks)[:num]
+
+def replay_arrivals(rates: np.ndarray, bucket: float, num: int = None, start: float = 0.0) -> np.ndarray:
+    """
+    Return arrival times that follow a recorded rate trace: rates[i] is
+    the arrival rate during [start + i * bucket, start + (i + 1) * bucket).
+    The trace is repeated until num arrivals exist; without num a single
+    pass is returned.
+    """
+    rates = np.asarray(rates, dtype=np.float64)
+    chunks = []
+    produced = 0
+    clock = start
+    while True:
+        counts = np.random.poisson(rates * bucket)
+        begins = clock + bucket * np.arange(len(rates))
+        offsets = np.random.random(int(counts.sum())) * bucket
+        arrivals = np.repeat(begins, counts) + offsets
+        order = np.lexsort((offsets, np.repeat(np.arange(len(rates)), counts)))
+        chunks.append(arrivals[order])
+        produced += len(arrivals)
+        clock += bucket * len(rates)
+        if num is None or produced >= num or not rates.any():
+            break
+    return np.concatenate(chunks)[:num]
+
+def load_rate_trace(path: str) -> np.ndarray:
+    """
+    Read a recorded rate trace with one rate (transactions per bucket
+    second) per line; a CSV's last column is used.
+    """
+    return np.loadtxt(path, delimiter=",", ndmin=2)[:, -1]
+
+
+#################################
+####   Timestamped streams   ####
+#################################
+
+def timestamped(stream, arrival_times: np.ndarray):
+    """
+    Yield (arrival time, item) pairs, pairing the items of any stream with
+    arrival_times in order. Stops at whichever runs out first.
+
+    Example usage:
+    >>> list(timestamped(iter("ab"), np.array([0.5, 1.25, 2.0])))
+    [(0.5, 'a'), (1.25, 'b')]
+    """
+    return zip(arrival_times.tolist(), stream)
+
+def workload_arrivals(workload_names: list[str], arrival_times: np.ndarray, weights: list[float] = None):
+    """
+    Yield (arrival time, workload name, Transaction) for a mix of
+    workloads arriving at arrival_times.
+    """
+    for arrival, (name, t) in timestamped(workloads.mix(workload_names, len(arrival_times), weights), arrival_times):
+        yield arrival, name, t
+
+async def emit(timed, speed: float = 1.0, tick: float = 0.0005, stats: dict = None):
+    """
+    Release a stream of (arrival time, ...) tuples in real time.
+
+    This is an async generator yielding lists of every item whose arrival
+    time has passed (arrival times are relative to the first call and are
+    divided by speed). Between batches it sleeps until the next arrival,
+    but never longer than tick, so the event loop stays responsive. If
+    stats is given, it is filled with the number emitted, the elapsed
+    time and the largest lateness of an item.
+    """
+    loop = asyncio.get_running_loop()
+    origin = loop.time()
+    emitted = 0
+    max_lag = 0.0
+    pending = None
+    timed = iter(timed)
+    try:
+        while True:
+            now = (loop.time() - origin) * speed
+            batch = []
+            if pending is not None:
+                if pending[0] > now:
+                    await asyncio.sleep(min((pending[0] - now) / speed, tick))
+                    continue
+                batch.append(pending)
+                pending = None
+            for item in timed:
+                if item[0] > now:
+                    pending = item
+                    break
+                batch.append(item)
+            if batch:
+                max_lag = max(max_lag, (now - batch[0][0]) / speed)
+                emitted += len(batch)
+                yield batch
+            if pending is None:
+                if not batch:
+                    break
+                # The stream ran dry inside this batch
+                continue
+            await asyncio.sleep(0)
+    finally:
+        if stats is not None:
+            stats.update(emitted=emitted, elapsed=loop.time() - origin, max_lag=max_lag)
+
+
+#######################
+####   Simulation  ####
+#######################
+
+async def _drain(timed, stats: dict):
+    async for _ in emit(timed, stats=stats):
+        pass
+
+def main():
+    """
+    Print a short Poisson-timestamped mix and measure the real-time
+    emitter at 100k transactions per second.
+    """
+    num_txn = 5
+    rate = 1000
+
+    # Extra space for formatting
+    print()
+    print(f"Poisson arrivals at {rate} txn/s")
+    for arrival, name, t in workload_arrivals(workloads.names(), poisson_arrivals(rate, num_txn)):
+        print(f"{arrival:.6f} {name} {t}")
+    print()
+
+    num_emitted = 200000
+    target = 100000
+    print(f"Emitting {num_emitted} arrivals in real time at {target} txn/s")
+    timed = timestamped(range(num_emitted), poisson_arrivals(target, num_emitted))
+    stats = {}
+    asyncio.run(_drain(timed, stats))
+    print(f"emitted={stats['emitted']} elapsed={stats['elapsed']:.3f}s "
+          f"rate={stats['emitted'] / stats['elapsed']:.0f} txn/s max_lag={stats['max_lag']:.4f}s")
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Asyncio streaming API over the workload generators.
+
+The *_stream functions are ordinary (blocking) generators. The async
+generators here drive them from an event loop cooperatively: they produce
+batch_size transactions at a time and then yield control to the loop, so
+several sources and the consumer's own I/O can share one loop without a
+thread per source.
+
+    stream()         async generator of transactions of one workload
+    batches()        the same, yielding lists of up to batch_size
+    BufferedStream   runs a source ahead of its consumer into a bounded
+                     asyncio.Queue (backpressure when the consumer lags)
+    merge()          interleaves several sources as their items arrive
+
+Closing or cancelling any of them closes the underlying generator and
+cancels the background tasks it started.
+
+### EXAMPLE OUTPUT ###
+
+Merging 3 workloads, 20000 transactions each, batch size 64
+saleor.cancel_order            20000
+spree.checkout_controller      20000
+mastodon.create_marker         20000
+total 60000 txn in 5.39s, max event loop stall 64.5 ms
+"""
+
+import asyncio
+import time
+import workloads
+
+async def stream(name: str, num_txn: int, batch_size: int = 64, **kwargs):
+    """
+    Yield num_txn transactions of the named workload, returning control
+    to the event loop after every batch_size of them.
+    """
+    transactions = workloads.stream(name, num_txn, **kwargs)
+    try:
+        for i, t in enumerate(transactions, 1):
+            yield t
+            if i % batch_size == 0:
+                await asyncio.sleep(0)
+    finally:
+        transactions.close()
+
+async def batches(name: str, num_txn: int, batch_size: int = 64, **kwargs):
+    """
+    Yield num_txn transactions of the named workload as lists of up to
+    batch_size, returning control to the event loop between lists.
+    """
+    transactions = workloads.stream(name, num_txn, **kwargs)
+    try:
+        batch = []
+        for t in transactions:
+            batch.append(t)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+                await asyncio.sleep(0)
+        if batch:
+            yield batch
+    finally:
+        transactions.close()
+
+
+class BufferedStream:
+    """
+    Pulls from an async iterable in a background task into a queue of at
+    most maxsize items. Iterate it with async for; leaving the loop early
+    should be followed by aclose() (or use it as an async context
+    manager), which cancels the task.
+
+    Example usage:
+    >>> async def demo():
+    ...     async with BufferedStream(stream("broadleaf.get_offer", 5), maxsize=2) as buffered:
+    ...         return [len(t.trace) async for t in buffered]
+    >>> asyncio.run(demo())
+    [1, 1, 1, 1, 1]
+
+    Errors raised by the source are raised to the consumer:
+    >>> async def failing():
+    ...     yield 1
+    ...     raise ValueError("source failed")
+    >>> async def consume():
+    ...     received = []
+    ...     try:
+    ...         async with BufferedStream(failing()) as buffered:
+    ...             async for item in buffered:
+    ...                 received.append(item)
+    ...     except ValueError as error:
+    ...         return received, error
+    >>> asyncio.run(asyncio.wait_for(consume(), 5))
+    ([1], ValueError('source failed'))
+    """
+    _DONE = object()
+
+    def __init__(self, source, maxsize: int = 1024):
+        self.source = source
+        self.queue = asyncio.Queue(maxsize)
+        self.task = None
+
+    async def _pump(self):
+        try:
+            try:
+                async for item in self.source:
+                    await self.queue.put(item)
+            finally:
+                aclose = getattr(self.source, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+        except asyncio.CancelledError:
+            # The consumer has gone away and nobody drains the queue any more
+            raise
+        except BaseException:
+            # Wake the consumer, which re-raises the error from the task
+            await self.queue.put(self._DONE)
+            raise
+        await self.queue.put(self._DONE)
+
+    def __aiter__(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._pump())
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is self._DONE:
+            # Surface errors raised by the source
+            await self.task
+            raise StopAsyncIteration
+        return item
+
+    async def aclose(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+async def merge(sources: dict, maxsize: int = 1024):
+    """
+    Yield (key, item) pairs from several async iterables, given as a dict
+    keyed by source name, in the order their items become available. Each
+    source runs in its own task, and all of them share one bounded queue.
+    """
+    queue = asyncio.Queue(maxsize)
+    done = object()
+
+    async def pump(key, source):
+        try:
+            async for item in source:
+                await queue.put((key, item))
+        except asyncio.CancelledError:
+            # The consumer has gone away and nobody drains the queue any more
+            raise
+        except BaseException:
+            await queue.put((key, done))
+            raise
+        await queue.put((key, done))
+
+    tasks = [asyncio.get_running_loop().create_task(pump(key, source)) for key, source in sources.items()]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            key, item = await queue.get()
+            if item is done:
+                remaining -= 1
+                continue
+            yield key, item
+        # Surface errors raised by a source
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for source in sources.values():
+            if hasattr(source, "aclose"):
+                await source.aclose()
+
+
+#######################
+####   Simulation  ####
+#######################
+
+async def _run(names: list[str], num_txn: int, batch_size: int):
+    """
+    Merge one async stream per workload while a ticker task measures how
+    long the event loop goes without running it.
+    """
+    stall = 0.0
+    # Import the application modules up front so imports do not count as stalls
+    for name in names:
+        workloads.get(name).module
+
+    async def ticker():
+        nonlocal stall
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stall = max(stall, time.perf_counter() - before - 0.001)
+
+    ticking = asyncio.get_running_loop().create_task(ticker())
+    counts = {name: 0 for name in names}
+    start = time.perf_counter()
+    async for name, _ in merge({name: stream(name, num_txn, batch_size) for name in names}):
+        counts[name] += 1
+    elapsed = time.perf_counter() - start
+    ticking.cancel()
+    return counts, elapsed, stall
+
+def main():
+    """
+    Consume three application workloads concurrently from one event loop.
+    """
+    names = ["saleor.cancel_order", "spree.checkout_controller", "mastodon.create_marker"]
+    num_txn = 20000
+    batch_size = 64
+
+    counts, elapsed, stall = asyncio.run(_run(names, num_txn, batch_size))
+
+    # Extra space for formatting
+    print()
+    print(f"Merging {len(names)} workloads, {num_txn} transactions each, batch size {batch_size}")
+    for name, count in counts.items():
+        print(f"{name:<30}{count:>6}")
+    print(f"total {sum(counts.values())} txn in {elapsed:.2f}s, max event loop stall {stall * 1000:.1f} ms")
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Throughput and memory benchmarks for every transaction generator.
+
+Each workload of the registry (see workloads.py) is timed two ways:
+    stream   its *_stream function, i.e. the generator plus argument
+             sampling, with nothing printed
+    sim      its *_sim driver with stdout discarded
+
+For both, the best of several seeded repetitions gives transactions/s and
+ops/s. A separate run under tracemalloc measures the memory blocks and
+bytes that one retained transaction needs, and the process' peak RSS is
+recorded after every workload (it is a running maximum over the run).
+Startup cost is measured by running a short generate.py job in fresh
+interpreters, with and without NumPy.
+
+Results can be saved as a JSON baseline and compared against later runs;
+any metric that got worse by more than the threshold is reported as a
+regression and makes the command exit with status 1.
+
+Usage:
+    python benchmark.py [workload or application ...] [--num-txn N]
+        [--repeat N] [--save FILE] [--compare FILE] [--threshold 0.1]
+
+### EXAMPLE OUTPUT ###
+
+workload                                    stream txn/s   ops/s  sim txn/s  blocks/txn  bytes/txn  rss(MB)
+scmsuite.internal_save_retail                      69259   83007      79121         5.2        258     37.7
+scmsuite.add_supply_order                         158056  474168     144910         7.0        396     38.9
+...
+saleor.order_fulfill                               13392  218021      10482        20.2       1294     48.7
+...
+mastodon.create_marker                             66662  264313      62012         7.9        431     52.7
+
+startup of a 100 transaction scmsuite.internal_save_retail job: python random 63 ms, numpy 210 ms (empty interpreter 16 ms)
+"""
+
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import platform
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import transaction
+import workloads
+
+# Metrics compared against a baseline, and whether larger values are better
+METRICS = {
+    "stream_txn_per_s": True,
+    "stream_ops_per_s": True,
+    "sim_txn_per_s": True,
+    "blocks_per_txn": False,
+    "bytes_per_txn": False,
+    "interpreter_s": False,
+    "python_random_s": False,
+    "numpy_random_s": False,
+}
+
+# Pseudo-workload under which startup times are stored
+STARTUP = "(startup)"
+
+#################################
+####       Measurements      ####
+#################################
+
+def _run_sim(workload: workloads.Workload, num_txn: int):
+    """
+    Call the workload's sim driver with output discarded. Drivers without
+    a transaction count argument (saleor) produce a fixed number.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        parameters = list(inspect.signature(workload.sim).parameters)
+        if parameters and parameters[0] in ("num_txn", "num_transactions"):
+            workload.sim(num_txn)
+        else:
+            workload.sim()
+
+def _count_sim(workload: workloads.Workload, num_txn: int, seed: int) -> int:
+    """
+    Return the number of transactions one seeded sim run creates, by
+    recording every Transaction constructed during an untimed run.
+    """
+    created = []
+    original_init = transaction.Transaction.__init__
+
+    def recording_init(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        created.append(self)
+
+    transaction.Transaction.__init__ = recording_init
+    try:
+        np.random.seed(seed)
+        _run_sim(workload, num_txn)
+    finally:
+        transaction.Transaction.__init__ = original_init
+    return len(created)
+
+def _best_time(run, repeat: int, seed: int) -> float:
+    """
+    Return the fastest of repeat seeded calls of run, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        np.random.seed(seed)
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def measure(name: str, num_txn: int = 2000, repeat: int = 3, seed: int = 0) -> dict:
+    """
+    Benchmark one workload and return its metrics.
+    """
+    workload = workloads.get(name)
+    ops = []
+    stream_time = _best_time(lambda: ops.append(sum(len(t.trace) for t in workload.stream(num_txn))), repeat, seed)
+    # Fixed-size drivers are called until they produced about num_txn
+    per_call = _count_sim(workload, num_txn, seed)
+    calls = max(1, round(num_txn / per_call)) if per_call < num_txn else 1
+
+    def run_sims():
+        for _ in range(calls):
+            _run_sim(workload, num_txn)
+
+    sim_time = _best_time(run_sims, repeat, seed)
+
+    np.random.seed(seed)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    retained = list(workload.stream(num_txn))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in diff)
+    size = sum(stat.size_diff for stat in diff)
+    del retained
+
+    return {
+        "num_txn": num_txn,
+        "ops_per_txn": ops[-1] / num_txn,
+        "stream_txn_per_s": num_txn / stream_time,
+        "stream_ops_per_s": ops[-1] / stream_time,
+        "sim_txn_per_s": calls * per_call / sim_time,
+        "blocks_per_txn": blocks / num_txn,
+        "bytes_per_txn": size / num_txn,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def _best_process_time(args: list[str], repeat: int) -> float:
+    """
+    Return the fastest wall time of repeat runs of a Python subprocess.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=directory, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def measure_startup(name: str, num_txn: int = 100, repeat: int = 5) -> dict:
+    """
+    Time a short generate.py job for one workload in a fresh interpreter,
+    with the pure-Python random fast path and with NumPy, next to the time
+    of starting an empty interpreter.
+    """
+    job = ["generate.py", name, "-n", str(num_txn), "--seed", "0"]
+    return {
+        "interpreter_s": _best_process_time(["-c", "pass"], repeat),
+        "python_random_s": _best_process_time(job + ["--rng", "python"], repeat),
+        "numpy_random_s": _best_process_time(job + ["--rng", "numpy"], repeat),
+    }
+
+def run(names: list[str], num_txn: int = 2000, repeat: int = 3, seed: int = 0, verbose: bool = True) -> dict:
+    """
+    Benchmark every named workload and return a JSON-serializable result.
+    """
+    results = {}
+    if verbose:
+        print(f"{'workload':<44}{'stream txn/s':>12}{'ops/s':>8}{'sim txn/s':>11}"
+              f"{'blocks/txn':>12}{'bytes/txn':>11}{'rss(MB)':>9}")
+    for name in names:
+        result = measure(name, num_txn, repeat, seed)
+        results[name] = result
+        if verbose:
+            print(f"{name:<44}{result['stream_txn_per_s']:>12.0f}{result['stream_ops_per_s']:>8.0f}"
+                  f"{result['sim_txn_per_s']:>11.0f}{result['blocks_per_txn']:>12.1f}"
+                  f"{result['bytes_per_txn']:>11.0f}{result['peak_rss_mb']:>9.1f}")
+    results[STARTUP] = measure_startup(names[0])
+    if verbose:
+        startup = results[STARTUP]
+        print()
+        print(f"startup of a 100 transaction {names[0]} job: "
+              f"python random {startup['python_random_s'] * 1000:.0f} ms, "
+              f"numpy {startup['numpy_random_s'] * 1000:.0f} ms "
+              f"(empty interpreter {startup['interpreter_s'] * 1000:.0f} ms)")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "num_txn": num_txn,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+#################################
+####       Baselines         ####
+#################################
+
+def save(result: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list[str]:
+    """
+    Return a description of every metric of current that is worse than
+    baseline by more than threshold (a fraction, 0.1 = 10%). Workloads
+    missing from either side are skipped.
+
+    Example usage:
+    >>> base = {"results": {"a.b": {"stream_txn_per_s": 100.0, "bytes_per_txn": 50.0}}}
+    >>> cur = {"results": {"a.b": {"stream_txn_per_s": 80.0, "bytes_per_txn": 52.0}}}
+    >>> compare(base, cur)
+    ['a.b stream_txn_per_s: 100 -> 80 (-20.0%)']
+    """
+    regressions = []
+    for name, metrics in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in metrics or metric not in old or not old[metric]:
+                continue
+            change = (metrics[metric] - old[metric]) / old[metric]
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{name} {metric}: {old[metric]:.4g} -> {metrics[metric]:.4g} ({change:+.1%})")
+    return regressions
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def main(argv: list[str] = None):
+    """
+    Benchmark the selected workloads (all by default), optionally saving
+    a baseline or comparing against one.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the transaction generators.")
+    parser.add_argument("workloads", nargs="*", help="workload or application names (default: all)")
+    parser.add_argument("--num-txn", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown (default 0.1)")
+    args = parser.parse_args(argv)
+
+    names = workloads.resolve(args.workloads) if args.workloads else workloads.names()
+    result = run(names, args.num_txn, args.repeat, args.seed)
+    if args.save:
+        save(result, args.save)
+    if args.compare:
+        regressions = compare(load(args.compare), result, args.threshold)
+        print()
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions beyond {args.threshold:.0%}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
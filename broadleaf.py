@@ -49,14 +49,14 @@ Generating Broadleaf get next id simulation
 ['r-id(11)', 'w-id(11)', 'w-id(11)']
 
 Generating Broadleaf decrement SKU simulation
-['r-quantity(21)', 'w-quantity(21)', 'r-quantity(27)', 'w-quantity(27)', 'r-quantity(63)', 'w-quantity(63)', 'r-quantity(65)', 'w-quantity(65)']
-['r-quantity(27)', 'w-quantity(27)', 'r-quantity(80)', 'w-quantity(80)', 'r-quantity(32)', 'w-quantity(32)', 'r-quantity(6)', 'w-quantity(6)']
-['r-quantity(58)', 'w-quantity(58)', 'r-quantity(93)', 'w-quantity(93)', 'r-quantity(91)', 'w-quantity(91)', 'r-quantity(63)', 'w-quantity(63)']
-['r-quantity(38)', 'w-quantity(38)', 'r-quantity(71)', 'w-quantity(71)', 'r-quantity(19)', 'w-quantity(19)', 'r-quantity(7)', 'w-quantity(7)']
-['r-quantity(57)', 'w-quantity(57)', 'r-quantity(2)', 'w-quantity(2)', 'r-quantity(77)', 'w-quantity(77)', 'r-quantity(61)', 'w-quantity(61)']
+['r-quantity(21, 27, 63, 65)', 'w-quantity(21, 27, 63, 65)']
+['r-quantity(6, 27, 32, 80)', 'w-quantity(6, 27, 32, 80)']
+['r-quantity(58, 63, 91, 93)', 'w-quantity(58, 63, 91, 93)']
+['r-quantity(7, 19, 38, 71)', 'w-quantity(7, 19, 38, 71)']
+['r-quantity(2, 57, 61, 77)', 'w-quantity(2, 57, 61, 77)']
 """
 
-import numpy as np
+from rng import np
 from transaction import Transaction
 
 #################################
@@ -64,7 +64,7 @@ from transaction import Transaction
 #################################
 
 ### Transaction 1 ###
-def do_filter_internal_unless_ignored(request: tuple[int, int], response, chain):
+def do_filter_internal_unless_ignored(request: tuple[int, int], response, chain, new_transaction=Transaction):
     """
     Purpose: Update cart with new order
     Source code: https://github.com/BroadleafCommerce/BroadleafCommerce/blob/develop-7.0.x/core/broadleaf-framework-web/src/main/java/org/broadleafcommerce/core/web/order/security/CartStateFilter.java#L96C1-L126C64
@@ -84,20 +84,14 @@ def do_filter_internal_unless_ignored(request: tuple[int, int], response, chain)
     the cart_id and the second argument is the new order. 
     """
     cart_id, order_id = request[0], request[1]
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"cart({cart_id})")
     t.append_write(f"order({order_id})")
     return t
 
-def update_order_sim(num_transactions: int):
+def update_order_stream(num_transactions: int, new_transaction=Transaction):
     """
-    Example output:
-
-    ['r-cart(23)', 'w-order(87)']
-    ['r-cart(85)', 'w-order(89)']
-    ['r-cart(19)', 'w-order(36)']
-    ['r-cart(96)', 'w-order(9)']
-    ['r-cart(77)', 'w-order(23)']
+    Yield num_transactions transactions sampled the same way as update_order_sim.
     """
     num_carts = 100
     num_orders = 100
@@ -108,11 +102,23 @@ def update_order_sim(num_transactions: int):
     for _ in range(num_transactions):
         cart_id = np.random.choice(cart_ids)
         order_id = np.random.choice(order_ids)
-        transaction = do_filter_internal_unless_ignored((cart_id, order_id), None, None)
-        print(transaction)
+        yield do_filter_internal_unless_ignored((cart_id, order_id), None, None, new_transaction=new_transaction)
+
+def update_order_sim(num_transactions: int):
+    """
+    Example output:
+
+    ['r-cart(23)', 'w-order(87)']
+    ['r-cart(85)', 'w-order(89)']
+    ['r-cart(19)', 'w-order(36)']
+    ['r-cart(96)', 'w-order(9)']
+    ['r-cart(77)', 'w-order(23)']
+    """
+    for t in update_order_stream(num_transactions):
+        print(t)
 
 ### Transaction 2 ###
-def rate_item(item_id, type, customer, rating):
+def rate_item(item_id, type, customer, rating, new_transaction=Transaction):
     """
     Purpose: Add a new rating to item
     Github: https://github.com/BroadleafCommerce/BroadleafCommerce/blob/develop-7.0.x/core/broadleaf-framework/src/main/java/org/broadleafcommerce/core/rating/service/RatingServiceImpl.java#L73C1-L92C6
@@ -133,13 +139,27 @@ def rate_item(item_id, type, customer, rating):
     
     For simplicity, we treat the itemID as the unique identifier for the item. 
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"summary({item_id})")
     t.append_read(f"detail({customer})")
     t.append_write(f"detail({customer})/rating({rating})")
     t.append_write(f"summary({item_id})/rating({rating})")
     return t
 
+def rate_item_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as rate_item_sim.
+    """
+    num_items = 100
+    num_customers = 100
+    ratings = range(10)
+    for _ in range(num_transactions):
+        transaction = rate_item(np.random.choice(range(num_items)),
+                               None,
+                               np.random.choice(range(num_customers)),
+                               np.random.choice(ratings), new_transaction=new_transaction)
+        yield transaction
+
 def rate_item_sim(num_transactions: int):
     """
     Example output:
@@ -150,18 +170,11 @@ def rate_item_sim(num_transactions: int):
     ['r-summary(76)', 'r-detail(1)', 'w-detail(1)/rating(5)', 'w-summary(76)/rating(5)']
     ['r-summary(34)', 'r-detail(43)', 'w-detail(43)/rating(5)', 'w-summary(34)/rating(5)']
     """
-    num_items = 100
-    num_customers = 100
-    ratings = range(10)
-    for _ in range(num_transactions):
-        transaction = rate_item(np.random.choice(range(num_items)),
-                               None,
-                               np.random.choice(range(num_customers)),
-                               np.random.choice(ratings))
-        print(transaction)
+    for t in rate_item_stream(num_transactions):
+        print(t)
 
 ### Transaction 3 ###
-def savePaymentInfo(request, response, model, payment_form, result):
+def savePaymentInfo(request, response, model, payment_form, result, new_transaction=Transaction):
     """
     Purpose: save payment information
     Github: https://github.com/BroadleafCommerce/BroadleafCommerce/blob/develop-7.0.x/core/broadleaf-framework-web/src/main/java/org/broadleafcommerce/core/web/controller/checkout/BroadleafPaymentInfoController.java#L73C1-L104C1
@@ -188,7 +201,7 @@ def savePaymentInfo(request, response, model, payment_form, result):
     """
     cart_id = np.random.choice(1000)
     customer_id = np.random.choice(1000)
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"cart({cart_id})")
     t.append_read(f"customer({customer_id})")
     should_use_customer_payment = bool(np.random.choice(2))
@@ -204,6 +217,14 @@ def savePaymentInfo(request, response, model, payment_form, result):
             t.append_write(f"order_payment({cart_id})")
     return t
 
+def order_payment_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as order_payment_sim.
+    """
+    payment_form = np.random.choice(1000)
+    for _ in range(num_transactions):
+        yield savePaymentInfo(None, None, None, payment_form, None, new_transaction=new_transaction)
+
 def order_payment_sim(num_transactions: int):
     """
     Example output:
@@ -214,13 +235,11 @@ def order_payment_sim(num_transactions: int):
     ['r-cart(961)', 'r-customer(260)', 'w-payment(177)']
     ['r-cart(226)', 'r-customer(439)', 'w-payment(177)', 'r-customer_payment(177)', 'w-order_payment(226)']
     """
-    payment_form = np.random.choice(1000)
-    for _ in range(num_transactions):
-        t = savePaymentInfo(None, None, None, payment_form, None)
+    for t in order_payment_stream(num_transactions):
         print(t)
 
 ### Transaction 4 ###
-def save_offer_code(offer_code):
+def save_offer_code(offer_code, new_transaction=Transaction):
     """
     Purpose: Save offer code
     Github: https://github.com/BroadleafCommerce/BroadleafCommerce/blob/develop-7.0.x/core/broadleaf-framework/src/main/java/org/broadleafcommerce/core/offer/service/OfferServiceImpl.java#L140C1-L145C6
@@ -234,11 +253,19 @@ def save_offer_code(offer_code):
 
     For simplicity, we represent the offer and offerCode with the same index.
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_write(f"offerCode({offer_code})")
     t.append_write(f"offer({offer_code})")
     return t
 
+def save_offer_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as save_offer_sim.
+    """
+    num_offer_codes = 1000
+    for _ in range(num_transactions):
+        yield save_offer_code(np.random.choice(range(num_offer_codes)), new_transaction=new_transaction)
+
 def save_offer_sim(num_transactions: int):
     """
     Example output
@@ -249,13 +276,11 @@ def save_offer_sim(num_transactions: int):
     ['w-offerCode(304)']
     ['w-offerCode(325)']
     """
-    num_offer_codes = 1000
-    for _ in range(num_transactions):
-        transaction = save_offer_code(np.random.choice(range(num_offer_codes)))
-        print(transaction)
+    for t in save_offer_stream(num_transactions):
+        print(t)
 
 ### Transaction 5 ###
-def lookup_offer_by_code(code):
+def lookup_offer_by_code(code, new_transaction=Transaction):
     """
     Purpose: Retrieve offer corresponding to given code
     Github: https://github.com/BroadleafCommerce/BroadleafCommerce/blob/develop-7.0.x/core/broadleaf-framework/src/main/java/org/broadleafcommerce/core/offer/service/OfferServiceImpl.java#L156C4-L163C6
@@ -267,10 +292,18 @@ def lookup_offer_by_code(code):
     SELECT offer FROM offers WHERE offerCode == code
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"offer({code})")
     return t
 
+def get_offer_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as get_offer_sim.
+    """
+    num_offer_codes = 1000
+    for _ in range(num_transactions):
+        yield lookup_offer_by_code(np.random.choice(range(num_offer_codes)), new_transaction=new_transaction)
+
 def get_offer_sim(num_transactions: int):
     """
     Example output:
@@ -281,13 +314,11 @@ def get_offer_sim(num_transactions: int):
     ['r-offer(205)']
     ['r-offer(988)']
     """
-    num_offer_codes = 1000
-    for _ in range(num_transactions):
-        transaction = lookup_offer_by_code(np.random.choice(range(num_offer_codes)))
-        print(transaction)
+    for t in get_offer_stream(num_transactions):
+        print(t)
 
 ### Transaction 6 ###
-def find_next_id(id_type, batch_size):
+def find_next_id(id_type, batch_size, state=None, new_transaction=Transaction):
     """
     Purpose: Generate the next id based on idType and batchSize
     Github: https://github.com/BroadleafCommerce/BroadleafCommerce/blob/develop-7.0.x/common/src/main/java/org/broadleafcommerce/common/id/service/IdGenerationServiceImpl.java#L49C5-L80C6
@@ -304,15 +335,31 @@ def find_next_id(id_type, batch_size):
     id.batchsize--
     UPDATE idMap SET id=id WHERE type=idType
     TRANSACTION COMMIT
+
+    If a DatabaseState is given, the row is missing exactly when no id of
+    this type has been handed out yet, and the id is allocated from it.
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"id({id_type})")
-    if (np.random.choice(2) == 1):
+    if state is not None:
+        missing = state.next_id.get(id_type) == 0
+        state.allocate_id(id_type, batch_size)
+    else:
+        missing = np.random.choice(2) == 1
+    if missing:
         t.append_write(f"id({id_type})")
     t.append_write(f"id({id_type})")
     return t
 
-def get_next_id_sim(num_transactions: int):
+def get_next_id_stream(num_transactions: int, state=None, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as get_next_id_sim.
+    """
+    num_id_types = 100
+    for _ in range(num_transactions):
+        yield find_next_id(np.random.choice(num_id_types), None, state, new_transaction=new_transaction)
+
+def get_next_id_sim(num_transactions: int, state=None):
     """
     Example output:
 
@@ -322,13 +369,11 @@ def get_next_id_sim(num_transactions: int):
     ['r-id(32)', 'w-id(32)']
     ['r-id(88)', 'w-id(88)', 'w-id(88)']
     """
-    num_id_types = 100
-    for _ in range(num_transactions):
-        t = find_next_id(np.random.choice(num_id_types), None)
+    for t in get_next_id_stream(num_transactions, state):
         print(t)
 
 ### Tranasaction 7 ###
-def decrement_sku(sku_quantities, context):
+def decrement_sku(sku_quantities, context, state=None, new_transaction=Transaction):
     """
     Purpose: Decrement SKU counts for each entry
     Github: https://github.com/BroadleafCommerce/BroadleafCommerce/blob/develop-7.0.x/core/broadleaf-framework/src/main/java/org/broadleafcommerce/core/inventory/service/InventoryServiceImpl.java#L203C5-L237C1
@@ -342,27 +387,42 @@ def decrement_sku(sku_quantities, context):
         UPDATE sku SET quantity_available = quantity_available - entry.quantity WHERE sku_id = entry.sku_id
     TRANSACTION COMMIT
 
-    For the simulation, we treat skuQuantities as a list of sku_ids.
+    For the simulation, we treat skuQuantities as a list of sku_ids, and
+    the loop as one bulk read and one bulk write of their quantities.
+    If a DatabaseState is given, each listed sku is decremented by one
+    in a single vectorized update, unless a sku lacks the quantity: then
+    InventoryUnavailableException rolls the transaction back after the
+    read.
     """
-    t = Transaction()
-    for sku_id in sku_quantities:
-        t.append_read(f"quantity({sku_id})")
-        t.append_write(f"quantity({sku_id})")
+    t = new_transaction()
+    t.append_read_many("quantity", sku_quantities)
+    if state is not None:
+        skus, quantities = np.unique(np.asarray(sku_quantities), return_counts=True)
+        if np.any(state.sku_quantity.get_many(skus) < quantities):
+            return t
+        state.sku_quantity.add_many(skus, -quantities)
+    t.append_write_many("quantity", sku_quantities)
     return t
 
-def decrement_SKU_sim(num_transactions: int):
+def decrement_SKU_stream(num_transactions: int, state=None, new_transaction=Transaction):
     """
-    Example output:
-
-    ['r-quantity(88)', 'w-quantity(88)', 'r-quantity(25)', 'w-quantity(25)', 'r-quantity(66)', 'w-quantity(66)', 'r-quantity(57)', 'w-quantity(57)']
-    ['r-quantity(27)', 'w-quantity(27)', 'r-quantity(36)', 'w-quantity(36)', 'r-quantity(60)', 'w-quantity(60)', 'r-quantity(14)', 'w-quantity(14)']
-    ['r-quantity(82)', 'w-quantity(82)', 'r-quantity(28)', 'w-quantity(28)', 'r-quantity(26)', 'w-quantity(26)', 'r-quantity(24)', 'w-quantity(24)']
-    ['r-quantity(47)', 'w-quantity(47)', 'r-quantity(45)', 'w-quantity(45)', 'r-quantity(53)', 'w-quantity(53)', 'r-quantity(94)', 'w-quantity(94)']
-    ['r-quantity(85)', 'w-quantity(85)', 'r-quantity(55)', 'w-quantity(55)', 'r-quantity(77)', 'w-quantity(77)', 'r-quantity(38)', 'w-quantity(38)']
+    Yield num_transactions transactions sampled the same way as decrement_SKU_sim.
     """
     for _ in range(num_transactions):
         sku_quantities = np.random.choice(100, 4)
-        t = decrement_sku(sku_quantities, None)
+        yield decrement_sku(sku_quantities, None, state, new_transaction=new_transaction)
+
+def decrement_SKU_sim(num_transactions: int, state=None):
+    """
+    Example output:
+
+    ['r-quantity(25, 57, 66, 88)', 'w-quantity(25, 57, 66, 88)']
+    ['r-quantity(14, 27, 36, 60)', 'w-quantity(14, 27, 36, 60)']
+    ['r-quantity(24, 26, 28, 82)', 'w-quantity(24, 26, 28, 82)']
+    ['r-quantity(45, 47, 53, 94)', 'w-quantity(45, 47, 53, 94)']
+    ['r-quantity(38, 55, 77, 85)', 'w-quantity(38, 55, 77, 85)']
+    """
+    for t in decrement_SKU_stream(num_transactions, state):
         print(t)
 
 #######################
@@ -0,0 +1,362 @@
+"""
+Buffer-pool cache simulation over the key access streams of workloads.
+
+Every op of a generated transaction accesses one key, and a bulk op
+accesses each of its rows. access_stream() turns a workload mix
+into the sequence of dense key indexes it accesses, and this module
+computes how that stream behaves in a cache of a given size:
+
+    LRU     exact miss-ratio curve for every size at once from the LRU
+            stack distances (Mattson et al.): an access hits in a cache
+            of size c exactly when fewer than c distinct keys were
+            accessed since the previous access of its key
+    CLOCK   second-chance approximation of LRU
+    ARC     adaptive replacement cache (Megiddo and Modha)
+    2Q      2Q with a FIFO probation queue and a ghost list (Johnson and
+            Shasha)
+
+Stack distances are computed offline with NumPy: the number of distinct
+keys between two accesses of a key, at positions p < t, is t - p - 1
+minus the accesses in between whose key is accessed again before t, a
+two-dimensional dominance count answered for all accesses together with
+a wavelet matrix (one cumulative sum and one stable partition per bit
+of the position). CLOCK, ARC and 2Q are not stack algorithms, so they
+are replayed once per size; replay() can sample keys by hash (SHARDS,
+Waldspurger et al.) and shrink the cache by the same rate to keep that
+fast on long streams.
+
+### EXAMPLE OUTPUT ###
+
+saleor: 1000586 accesses of 13650 keys, LRU stack distances in 0.82s (1.2M accesses/s)
+cache keys  % of keys       LRU     CLOCK       ARC        2Q
+        68       0.5%    0.5747    0.5765    0.5767    0.5348
+       136       1.0%    0.5313    0.5331    0.5312    0.4990
+       273       2.0%    0.4843    0.4853    0.4843    0.4489
+       682       5.0%    0.3873    0.3888    0.3857    0.3427
+      1365      10.0%    0.2653    0.2679    0.2648    0.2419
+      2730      20.0%    0.1157    0.1157    0.1097    0.1156
+      6825      50.0%    0.0143    0.0142    0.0140    0.0186
+90% of re-accesses hit in 2772 keys (20.3% of keys)
+99% of re-accesses hit in 4592 keys (33.6% of keys)
+
+spree: 378887 accesses of 11782 keys, LRU stack distances in 0.28s (1.3M accesses/s)
+cache keys  % of keys       LRU     CLOCK       ARC        2Q
+        59       0.5%    0.7788    0.7688    0.7047    0.7046
+       118       1.0%    0.7139    0.7036    0.6720    0.6742
+       236       2.0%    0.6425    0.6362    0.6111    0.6159
+       589       5.0%    0.5040    0.4942    0.4488    0.4645
+      1178      10.0%    0.3182    0.2970    0.2305    0.2724
+      2356      20.0%    0.1326    0.1234    0.1108    0.1183
+      5891      50.0%    0.0723    0.0723    0.0723    0.0760
+90% of re-accesses hit in 2442 keys (20.7% of keys)
+99% of re-accesses hit in 9736 keys (82.6% of keys)
+"""
+
+import time
+from collections import OrderedDict
+import numpy as np
+import workloads
+from encoding import KeyEncoder, key_ids
+
+#################################
+####    Stack distances      ####
+#################################
+
+def reuse(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Position of the previous (-1 if none) and next (len(keys) if none)
+    access of the same key, for every access.
+    """
+    n = len(keys)
+    order = np.argsort(keys, kind="stable")
+    same = keys[order[1:]] == keys[order[:-1]]
+    previous = np.full(n, -1, dtype=np.int64)
+    following = np.full(n, n, dtype=np.int64)
+    previous[order[1:][same]] = order[:-1][same]
+    following[order[:-1][same]] = order[1:][same]
+    return previous, following
+
+def count_below(values: np.ndarray, stops: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """
+    For every query i, the number of j < stops[i] with values[j] <
+    bounds[i], for non-negative values, with a wavelet matrix.
+
+    Example usage:
+    >>> count_below(np.array([5, 1, 4, 2, 3]), np.array([5, 3, 0]), np.array([4, 5, 9]))
+    array([3, 2, 0], dtype=int32)
+    """
+    n = len(values)
+    bits = int(max(values.max(initial=0), bounds.max(initial=0))).bit_length()
+    current = values.astype(np.int32)
+    bounds = bounds.astype(np.int32)
+    low = np.zeros(len(stops), dtype=np.int32)
+    high = stops.astype(np.int32)
+    counts = np.zeros(len(stops), dtype=np.int32)
+    ones = np.zeros(n + 1, dtype=np.int32)
+    for bit in range(bits - 1, -1, -1):
+        mask = (current >> bit) & 1
+        np.cumsum(mask, out=ones[1:])
+        num_zeros = n - int(ones[n])
+        # Queries whose bound has this bit set count the values with a
+        # 0 here and continue among the 1s, the others among the 0s
+        query = (bounds >> bit) & 1
+        ones_low, ones_high = ones[low], ones[high]
+        zeros_low, zeros_high = low - ones_low, high - ones_high
+        counts += query * (zeros_high - zeros_low)
+        low = zeros_low + query * (num_zeros + ones_low - zeros_low)
+        high = zeros_high + query * (num_zeros + ones_high - zeros_high)
+        selected = mask.astype(bool)
+        current = np.concatenate([current[~selected], current[selected]])
+    return counts
+
+def stack_distances(keys: np.ndarray) -> np.ndarray:
+    """
+    LRU stack distance of every access: the number of distinct other
+    keys accessed since the previous access of its key, or -1 for the
+    first access.
+
+    Example usage:
+    >>> stack_distances(np.array([1, 2, 3, 2, 1, 1, 4, 3])).tolist()
+    [-1, -1, -1, 1, 2, 0, -1, 3]
+    """
+    previous, following = reuse(keys)
+    seen = np.cumsum(previous < 0)          # distinct keys among the first t + 1 accesses
+    t = np.nonzero(previous >= 0)[0]
+    p = previous[t]
+    # Accesses before t whose key is accessed again before t, all of them
+    # and those up to p; the difference are the repeats strictly between
+    repeats = t - seen[t - 1]
+    repeats_to_p = count_below(following, p + 1, t)
+    distances = np.full(len(keys), -1, dtype=np.int64)
+    distances[t] = (t - p - 1) - (repeats - repeats_to_p)
+    return distances
+
+def lru_miss_ratios(distances: np.ndarray, sizes: list[int]) -> np.ndarray:
+    """
+    Miss ratio of an LRU cache of every size, from stack_distances().
+    """
+    reused = np.sort(distances[distances >= 0])
+    hits = np.searchsorted(reused, np.asarray(sizes), side="left")
+    return (len(distances) - hits) / max(len(distances), 1)
+
+
+#################################
+####   Replacement policies  ####
+#################################
+
+class LRU:
+    """
+    Least recently used, for checking the stack-distance curve.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def access(self, key) -> bool:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return True
+        if len(self.entries) >= self.size:
+            self.entries.popitem(last=False)
+        self.entries[key] = None
+        return False
+
+class Clock:
+    """
+    CLOCK: a hand sweeps the slots, clearing reference bits, and evicts
+    the first key that was not referenced since the last sweep.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.keys = []
+        self.referenced = []
+        self.slots = {}         # key -> slot
+        self.hand = 0
+
+    def access(self, key) -> bool:
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.referenced[slot] = True
+            return True
+        if len(self.keys) < self.size:
+            self.slots[key] = len(self.keys)
+            self.keys.append(key)
+            self.referenced.append(False)
+            return False
+        referenced = self.referenced
+        while referenced[self.hand]:
+            referenced[self.hand] = False
+            self.hand = (self.hand + 1) % self.size
+        del self.slots[self.keys[self.hand]]
+        self.keys[self.hand] = key
+        self.slots[key] = self.hand
+        self.hand = (self.hand + 1) % self.size
+        return False
+
+class ARC:
+    """
+    Adaptive replacement cache: recency (t1) and frequency (t2) lists
+    with ghost lists (b1, b2) of their recent evictions, which move the
+    target size p of t1.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.p = 0
+        self.t1, self.t2, self.b1, self.b2 = OrderedDict(), OrderedDict(), OrderedDict(), OrderedDict()
+
+    def _replace(self, in_b2: bool):
+        if self.t1 and (len(self.t1) > self.p or (in_b2 and len(self.t1) == self.p) or not self.t2):
+            key, _ = self.t1.popitem(last=False)
+            self.b1[key] = None
+        else:
+            key, _ = self.t2.popitem(last=False)
+            self.b2[key] = None
+
+    def access(self, key) -> bool:
+        t1, t2, b1, b2 = self.t1, self.t2, self.b1, self.b2
+        if key in t1:
+            del t1[key]
+            t2[key] = None
+            return True
+        if key in t2:
+            t2.move_to_end(key)
+            return True
+        if key in b1:
+            self.p = min(self.size, self.p + max(len(b2) // len(b1), 1))
+            self._replace(False)
+            del b1[key]
+            t2[key] = None
+            return False
+        if key in b2:
+            self.p = max(0, self.p - max(len(b1) // len(b2), 1))
+            self._replace(True)
+            del b2[key]
+            t2[key] = None
+            return False
+        if len(t1) + len(b1) == self.size:
+            if len(t1) < self.size:
+                b1.popitem(last=False)
+                self._replace(False)
+            else:
+                t1.popitem(last=False)
+        elif len(t1) + len(t2) + len(b1) + len(b2) >= self.size:
+            if len(t1) + len(t2) + len(b1) + len(b2) == 2 * self.size:
+                b2.popitem(last=False)
+            self._replace(False)
+        t1[key] = None
+        return False
+
+class TwoQ:
+    """
+    2Q: new keys enter a FIFO (a1in, a quarter of the cache); keys
+    accessed again after leaving it, while remembered in the ghost list
+    a1out, are promoted to the LRU main queue (am).
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.in_size = max(1, size // 4)
+        self.out_size = max(1, size // 2)
+        self.a1in, self.a1out, self.am = OrderedDict(), OrderedDict(), OrderedDict()
+
+    def _reclaim(self):
+        if len(self.am) + len(self.a1in) < self.size:
+            return
+        if len(self.a1in) > self.in_size or not self.am:
+            key, _ = self.a1in.popitem(last=False)
+            self.a1out[key] = None
+            if len(self.a1out) > self.out_size:
+                self.a1out.popitem(last=False)
+        else:
+            self.am.popitem(last=False)
+
+    def access(self, key) -> bool:
+        if key in self.am:
+            self.am.move_to_end(key)
+            return True
+        if key in self.a1in:
+            return True
+        if key in self.a1out:
+            del self.a1out[key]
+            self._reclaim()
+            self.am[key] = None
+            return False
+        self._reclaim()
+        self.a1in[key] = None
+        return False
+
+POLICIES = {"LRU": LRU, "CLOCK": Clock, "ARC": ARC, "2Q": TwoQ}
+
+def replay(policy, keys: np.ndarray, sizes: list[int], sample_rate: float = 1.0) -> np.ndarray:
+    """
+    Miss ratio of a cache of every size under policy (a class from
+    POLICIES). With sample_rate < 1, only the keys whose hash falls in
+    that fraction are replayed, on caches scaled down by the same rate.
+
+    Example usage:
+    >>> keys = np.random.RandomState(0).zipf(1.5, 5000) % 300
+    >>> sizes = [10, 50, 200]
+    >>> bool(np.allclose(replay(LRU, keys, sizes), lru_miss_ratios(stack_distances(keys), sizes)))
+    True
+    """
+    if sample_rate < 1.0:
+        hashes = (keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(40)
+        keys = keys[hashes < np.uint64(sample_rate * (1 << 24))]
+    stream = keys.tolist()
+    ratios = []
+    for size in sizes:
+        cache = policy(max(1, round(size * sample_rate)))
+        hits = sum(map(cache.access, stream))
+        ratios.append(1 - hits / max(len(stream), 1))
+    return np.array(ratios)
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def access_stream(names: list[str], num_txn: int, seed: int = 0) -> np.ndarray:
+    """
+    Dense key index (0 to number of keys - 1) of every row accessed by
+    num_txn transactions of the named workloads, in order.
+    """
+    np.random.seed(seed)
+    encoder = KeyEncoder()
+    ops = np.concatenate([encoder.encode_rows(t) for _, t in workloads.mix(names, num_txn)])
+    _, keys = np.unique(key_ids(ops), return_inverse=True)
+    return keys
+
+def main():
+    """
+    Miss-ratio curves of the Saleor and Spree access streams.
+    """
+    num_txn = 100000
+    fractions = [0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5]
+
+    # Extra space for formatting
+    print()
+    for app in ("saleor", "spree"):
+        keys = access_stream(workloads.resolve([app]), num_txn)
+        num_keys = int(keys.max()) + 1
+        start = time.perf_counter()
+        distances = stack_distances(keys)
+        elapsed = time.perf_counter() - start
+        print(f"{app}: {len(keys)} accesses of {num_keys} keys, LRU stack distances in {elapsed:.2f}s "
+              f"({len(keys) / elapsed / 1e6:.1f}M accesses/s)")
+
+        sizes = [max(1, round(num_keys * fraction)) for fraction in fractions]
+        curves = {"LRU": lru_miss_ratios(distances, sizes)}
+        for name in ("CLOCK", "ARC", "2Q"):
+            curves[name] = replay(POLICIES[name], keys, sizes)
+        print(f"{'cache keys':>10}{'% of keys':>11}" + "".join(f"{name:>10}" for name in curves))
+        for i, size in enumerate(sizes):
+            print(f"{size:>10}{fractions[i]:>11.1%}" + "".join(f"{curves[name][i]:>10.4f}" for name in curves))
+
+        # Hot set: the LRU cache that catches 90% and 99% of the reuses
+        reused = np.sort(distances[distances >= 0])
+        for share in (0.9, 0.99):
+            size = int(reused[int(share * (len(reused) - 1))]) + 1
+            print(f"{share:.0%} of re-accesses hit in {size} keys ({size / num_keys:.1%} of keys)")
+        print()
+
+if __name__ == "__main__":
+    main()
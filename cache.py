@@ -0,0 +1,250 @@
+"""
+Content-addressed disk cache of generated workloads.
+
+A cache entry holds num_txn transactions drawn by workloads.mix() for a
+list of workload names, mixture weights and seed. Its key is a SHA-256
+over those parameters and over the source files the transactions depend
+on (the application modules of the workloads, transaction.py, state.py,
+workloads.py, rng.py and encoding.py, which lays out the stored op
+records), so editing a generator invalidates its entries automatically:
+they are never hit again and age out of the cache.
+
+Entries are stored as NumPy files (see encoding.py for the op records):
+
+    ops.npy       uint64 op records of all transactions, concatenated
+    offsets.npy   int64 start of every transaction in ops (plus the end)
+    labels.npy    int32 index into the entry's workload names per txn
+    key_ids.npy   sorted uint64 key ids, with keys.json the key strings
+
+and loaded memory-mapped, so a hit costs a few file opens regardless of
+size. The cache is bounded by max_bytes; when an insert exceeds it, the
+least recently used entries (by the mtime a hit refreshes) are evicted.
+
+### EXAMPLE OUTPUT ###
+
+20000 transactions of 37 workloads, seed 0
+miss: 1.302s
+hit:  0.004s (1.39 MB on disk)
+identical: True
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import workloads
+from encoding import KeyEncoder
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "transaction-sim")
+
+def source_hash(names: list[str]) -> str:
+    """
+    Hash the source files that the transactions of names depend on.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    files = sorted({f"{workloads.get(name).app}.py" for name in names} | {"transaction.py", "state.py", "workloads.py", "rng.py", "encoding.py"})
+    digest = hashlib.sha256()
+    for filename in files:
+        digest.update(filename.encode())
+        with open(os.path.join(directory, filename), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def cache_key(names: list[str], num_txn: int, seed: int, weights: list[float] = None) -> str:
+    """
+    Return the content address of a generated workload.
+    """
+    spec = {
+        "workloads": list(names),
+        "weights": None if weights is None else [float(w) for w in weights],
+        "seed": seed,
+        "num_txn": num_txn,
+        "source": source_hash(names),
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+class CachedWorkload:
+    """
+    Transactions of one cache entry, backed by (memory-mapped) arrays.
+    Indexing returns a trace; iterating yields (workload name, trace).
+    """
+    def __init__(self, names: list[str], ops: np.ndarray, offsets: np.ndarray, labels: np.ndarray,
+                 key_ids: np.ndarray, keys: list[str]):
+        self.names = names
+        self.ops = ops
+        self.offsets = offsets
+        self.labels = labels
+        self.key_ids = key_ids
+        self.keys = keys
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def records(self, i: int) -> np.ndarray:
+        """
+        Op records of transaction i (a view, no decoding).
+        """
+        return self.ops[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, i: int) -> list[str]:
+        records = self.records(i)
+        positions = np.searchsorted(self.key_ids, records >> np.uint64(1)).tolist()
+        return [("w-" if op & 1 else "r-") + self.keys[p] for op, p in zip(records.tolist(), positions)]
+
+    def __iter__(self):
+        for i, label in enumerate(self.labels.tolist()):
+            yield self.names[label], self[i]
+
+    def save(self, directory: str):
+        np.save(os.path.join(directory, "ops.npy"), self.ops)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "labels.npy"), self.labels)
+        np.save(os.path.join(directory, "key_ids.npy"), self.key_ids)
+        with open(os.path.join(directory, "keys.json"), "w") as f:
+            json.dump({"names": self.names, "keys": self.keys}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "CachedWorkload":
+        with open(os.path.join(directory, "keys.json")) as f:
+            strings = json.load(f)
+        arrays = [np.load(os.path.join(directory, f"{part}.npy"), mmap_mode="r")
+                  for part in ("ops", "offsets", "labels", "key_ids")]
+        return cls(strings["names"], *arrays, strings["keys"])
+
+    @classmethod
+    def generate(cls, names: list[str], num_txn: int, seed: int, weights: list[float] = None) -> "CachedWorkload":
+        """
+        Draw the transactions of an entry.
+        """
+        np.random.seed(seed)
+        encoder = KeyEncoder()
+        index = {name: i for i, name in enumerate(names)}
+        labels = np.empty(num_txn, dtype=np.int32)
+        lengths = np.empty(num_txn, dtype=np.int64)
+        chunks = []
+        for i, (name, t) in enumerate(workloads.mix(names, num_txn, weights)):
+            labels[i] = index[name]
+            lengths[i] = len(t.trace)
+            chunks.append(encoder.encode(t.trace))
+        offsets = np.zeros(num_txn + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ops = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint64)
+        key_ids = np.array(sorted(encoder.keys), dtype=np.uint64)
+        keys = [encoder.keys[k] for k in key_ids.tolist()]
+        return cls(list(names), ops, offsets, labels, key_ids, keys)
+
+
+class WorkloadCache:
+    """
+    Directory of cache entries bounded to max_bytes.
+
+    Example usage:
+    >>> cache = WorkloadCache(tempfile.mkdtemp())
+    >>> first = cache.get(["broadleaf.get_next_id"], 3, seed=0)
+    >>> second = cache.get(["broadleaf.get_next_id"], 3, seed=0)
+    >>> cache.misses, cache.hits, list(first) == list(second)
+    (1, 1, True)
+    >>> second[0]
+    ['r-id(44)', 'w-id(44)', 'w-id(44)']
+    """
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_bytes: int = 1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, names: list[str], num_txn: int, seed: int, weights: list[float] = None) -> CachedWorkload:
+        """
+        Return the transactions for these parameters, from disk if cached,
+        otherwise generated and stored.
+        """
+        key = cache_key(names, num_txn, seed, weights)
+        path = os.path.join(self.directory, key)
+        if os.path.isdir(path):
+            self.hits += 1
+            os.utime(path)
+            return CachedWorkload.load(path)
+        self.misses += 1
+        entry = CachedWorkload.generate(names, num_txn, seed, weights)
+        staging = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        entry.save(staging)
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict(keep=path)
+        return CachedWorkload.load(path)
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        """
+        Return (last use, size in bytes, path) of every entry.
+        """
+        result = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            result.append((os.stat(path).st_mtime, size, path))
+        return result
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep: str = None):
+        """
+        Remove least recently used entries until the cache fits max_bytes.
+        The entry at keep (the one just stored) is never removed.
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def main():
+    """
+    Generate a mixed workload twice through a fresh cache.
+    """
+    num_txn = 20000
+    seed = 0
+    names = workloads.names()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = WorkloadCache(directory)
+        start = time.perf_counter()
+        generated = cache.get(names, num_txn, seed)
+        miss = time.perf_counter() - start
+        start = time.perf_counter()
+        cached = cache.get(names, num_txn, seed)
+        hit = time.perf_counter() - start
+
+        # Extra space for formatting
+        print()
+        print(f"{num_txn} transactions of {len(names)} workloads, seed {seed}")
+        print(f"miss: {miss:.3f}s")
+        print(f"hit:  {hit:.3f}s ({cache.size() / 1e6:.2f} MB on disk)")
+        print(f"identical: {list(generated) == list(cached)}")
+        print()
+
+if __name__ == "__main__":
+    main()
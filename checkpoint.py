@@ -0,0 +1,162 @@
+"""
+Resumable generation of long workload runs.
+
+generate() writes num_txn transactions of a workload mix to a text file,
+one "<workload> <trace>" line each, and every checkpoint_every
+transactions records a checkpoint next to it (<output>.ckpt): the
+transaction index, the byte offset of the output at that point and the
+full states of NumPy's global random generator and of the generator that
+picks the transaction types. The output is flushed and
+fsynced before the checkpoint is atomically replaced, so a checkpoint
+never points past data that is on disk.
+
+With resume=True, generation truncates the output to the checkpointed
+offset, restores the random states and continues from the checkpointed
+index. Transaction types are chosen from a separate generator seeded with
+seed, one checkpoint interval at a time, so memory does not grow with
+num_txn, and each transaction is drawn from a fresh one-transaction
+stream, so nothing but the global random state carries over between
+transactions and the resumed output is byte-identical to an
+uninterrupted run, also when the resume runs in a new process.
+
+This is not quite the workload mix() draws. mix() keeps one stream per
+type, and a few streams draw a value once for all their transactions
+(saleor.payment_order's amount, broadleaf.order_payment's payment form).
+Here every transaction redraws it, so those types vary more across a run
+than they do under mix().
+
+### EXAMPLE OUTPUT ###
+
+Generating 20000 saleor and spree transactions, checkpoint every 1000
+uninterrupted: 3687077 bytes
+interrupted after 12345 transactions, resumed from transaction 12000
+resumed:       3687077 bytes, identical: True
+"""
+
+import json
+import multiprocessing
+import os
+import tempfile
+import numpy as np
+import workloads
+
+def _encode_state(state: tuple) -> dict:
+    name, keys, pos, has_gauss, cached_gaussian = state
+    return {"name": name, "keys": keys.tolist(), "pos": int(pos),
+            "has_gauss": int(has_gauss), "cached_gaussian": float(cached_gaussian)}
+
+def _decode_state(data: dict) -> tuple:
+    return (data["name"], np.array(data["keys"], dtype=np.uint32), data["pos"],
+            data["has_gauss"], data["cached_gaussian"])
+
+def checkpoint_path(output: str) -> str:
+    return output + ".ckpt"
+
+def save_checkpoint(output: str, spec: dict, index: int, offset: int, label_rng: np.random.RandomState):
+    """
+    Atomically write the checkpoint of output at transaction index.
+    """
+    data = dict(spec, index=index, offset=offset, rng_state=_encode_state(np.random.get_state()),
+                label_state=_encode_state(label_rng.get_state()))
+    directory = os.path.dirname(os.path.abspath(output))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".ckpt-")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, checkpoint_path(output))
+
+def load_checkpoint(output: str) -> dict:
+    with open(checkpoint_path(output)) as f:
+        return json.load(f)
+
+def generate(names: list[str], num_txn: int, output: str, seed: int = 0, weights: list[float] = None,
+             checkpoint_every: int = 1000, resume: bool = False, stop_after: int = None) -> int:
+    """
+    Write num_txn transactions of the named workloads to output. Returns
+    the index generation started from (0 unless resuming). stop_after
+    ends the run early after that many transactions, without a final
+    checkpoint, as a crash would.
+    """
+    spec = {"names": list(names), "num_txn": num_txn, "seed": seed,
+            "weights": None if weights is None else [float(w) for w in weights]}
+    label_rng = np.random.RandomState(seed)
+
+    start = 0
+    if resume and os.path.exists(checkpoint_path(output)):
+        checkpoint = load_checkpoint(output)
+        if any(checkpoint[key] != value for key, value in spec.items()):
+            raise ValueError(f"checkpoint of {output} was written for different parameters")
+        start = checkpoint["index"]
+        np.random.set_state(_decode_state(checkpoint["rng_state"]))
+        label_rng.set_state(_decode_state(checkpoint["label_state"]))
+        with open(output, "r+b") as f:
+            f.truncate(checkpoint["offset"])
+    else:
+        np.random.seed(seed)
+        open(output, "wb").close()
+        save_checkpoint(output, spec, 0, 0, label_rng)
+
+    with open(output, "ab") as f:
+        for index in range(start, num_txn):
+            if stop_after is not None and index - start == stop_after:
+                return start
+            if index % checkpoint_every == 0:
+                # Types up to the next checkpoint, which stores the generator's state after them
+                labels = label_rng.choice(len(names), size=min(checkpoint_every, num_txn - index), p=weights).tolist()
+            name = names[labels[index % checkpoint_every]]
+            t = next(workloads.stream(name, 1))
+            f.write(f"{name} {t}\n".encode())
+            if (index + 1) % checkpoint_every == 0 or index + 1 == num_txn:
+                f.flush()
+                os.fsync(f.fileno())
+                save_checkpoint(output, spec, index + 1, f.tell(), label_rng)
+    return start
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def _generate_in_process(names: list[str], num_txn: int, output: str, **kwargs):
+    """
+    Run generate() in a fresh interpreter, as a restarted job would.
+    """
+    process = multiprocessing.get_context("spawn").Process(target=generate, args=(names, num_txn, output), kwargs=kwargs)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"generate() exited with code {process.exitcode}")
+
+def main():
+    """
+    Compare an uninterrupted run with one that is cut off and resumed,
+    each in a process of its own.
+    """
+    names = workloads.resolve(["saleor", "spree"])
+    num_txn = 20000
+    checkpoint_every = 1000
+    crash_at = 12345
+
+    # Extra space for formatting
+    print()
+    print(f"Generating {num_txn} saleor and spree transactions, checkpoint every {checkpoint_every}")
+    with tempfile.TemporaryDirectory() as directory:
+        full = os.path.join(directory, "full.txt")
+        _generate_in_process(names, num_txn, full, checkpoint_every=checkpoint_every)
+        with open(full, "rb") as f:
+            expected = f.read()
+        print(f"uninterrupted: {len(expected)} bytes")
+
+        partial = os.path.join(directory, "partial.txt")
+        _generate_in_process(names, num_txn, partial, checkpoint_every=checkpoint_every, stop_after=crash_at)
+        resumed_from = load_checkpoint(partial)["index"]
+        _generate_in_process(names, num_txn, partial, checkpoint_every=checkpoint_every, resume=True)
+        with open(partial, "rb") as f:
+            actual = f.read()
+        print(f"interrupted after {crash_at} transactions, resumed from transaction {resumed_from}")
+        print(f"resumed:       {len(actual)} bytes, identical: {actual == expected}")
+    print()
+
+if __name__ == "__main__":
+    main()
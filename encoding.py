@@ -0,0 +1,93 @@
+"""
+Compact numeric encoding of transaction traces.
+
+Every operation is encoded as one 64-bit op record:
+
+    bits 63..1   stable 63-bit hash of the key ("goods_shelf(26)")
+    bit  0       1 for a write, 0 for a read
+
+The hash is a BLAKE2b digest, so the same key has the same id in every
+process and every run, which lets producers and analyzers in different
+processes agree on keys without exchanging a dictionary. A trace becomes a
+NumPy uint64 array that can be copied into shared memory or a file as is.
+
+Example usage:
+>>> encoder = KeyEncoder()
+>>> ops = encoder.encode(["r-goods_shelf(26)", "w-goods_shelf(26)"])
+>>> ops.dtype, is_write(ops).tolist()
+(dtype('uint64'), [False, True])
+>>> bool(key_ids(ops)[0] == key_ids(ops)[1])
+True
+>>> encoder.decode(ops)
+['r-goods_shelf(26)', 'w-goods_shelf(26)']
+>>> from transaction import Transaction
+>>> t = Transaction()
+>>> t.append_write_many("stock", [13, 8])
+>>> encoder.decode(encoder.encode_rows(t))
+['w-stock(8)', 'w-stock(13)']
+"""
+
+import hashlib
+import numpy as np
+
+WRITE_BIT = np.uint64(1)
+
+def key_id(key: str) -> int:
+    """
+    Return the stable 63-bit id of key.
+    """
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") >> 1
+
+class KeyEncoder:
+    """
+    Encodes traces into op records. Key ids are memoized, and the keys
+    seen by this encoder are remembered so its own output can be decoded.
+    """
+    def __init__(self):
+        self.ids = {}       # key -> id
+        self.keys = {}      # id -> key
+
+    def op(self, op: str) -> int:
+        """
+        Return the op record of one "r-key"/"w-key" string.
+        """
+        key = op[2:]
+        ident = self.ids.get(key)
+        if ident is None:
+            ident = key_id(key)
+            self.ids[key] = ident
+            self.keys[ident] = key
+        return (ident << 1) | (op[0] == "w")
+
+    def encode(self, trace: list[str]) -> np.ndarray:
+        """
+        Return the op records of trace as a uint64 array.
+        """
+        return np.fromiter((self.op(op) for op in trace), dtype=np.uint64, count=len(trace))
+
+    def encode_rows(self, t) -> np.ndarray:
+        """
+        Return the op records of a Transaction's trace with every bulk
+        operation expanded into one record per row (see Transaction.rows).
+        """
+        return np.array([self.op(op[:2] + row) for op in t.get_trace() for row in t.rows(op[2:])], dtype=np.uint64)
+
+    def decode(self, ops: np.ndarray) -> list[str]:
+        """
+        Turn op records back into a trace. Only keys this encoder has
+        encoded can be decoded.
+        """
+        return [("w-" if op & 1 else "r-") + self.keys[op >> 1] for op in ops.tolist()]
+
+def is_write(ops: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of the write records in ops.
+    """
+    return (ops & WRITE_BIT).astype(bool)
+
+def key_ids(ops: np.ndarray) -> np.ndarray:
+    """
+    Key ids of the records in ops.
+    """
+    return ops >> WRITE_BIT
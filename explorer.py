@@ -0,0 +1,359 @@
+"""
+Exhaustive interleaving explorer for small concurrent scenarios.
+
+Explorer runs a handful of transactions over a key-value store in every
+interleaving of their operations that can lead to a different result,
+and reports the ones that are not serializable or break an invariant.
+Operations follow the read-modify-write pattern of the traces: a read
+returns the current value of its key (0 initially) and a write stores
+one more than the value the transaction last saw for that key, or one
+more than the current value if it never read it (UPDATE ... SET x = x +
+1). An execution's outcome is the final store plus the values every
+transaction read; it is serializable if some serial order of the
+transactions produces the same outcome.
+
+Enumerating interleavings naively is hopeless beyond a few short
+transactions, so the search is pruned in three ways:
+
+    persistent sets   at each state only a set of transactions whose next
+                      ops no other transaction's remaining ops depend on
+                      is scheduled; ops of different transactions on
+                      disjoint keys (or both reads) commute
+    sleep sets        an op already explored from an equivalent earlier
+                      branch is not explored again after independent ops
+    state hashing     a state reached before (same program counters,
+                      store and values seen) with a subset of the
+                      current sleep set is not explored again
+
+Since the transactions' ops are known up front, persistent sets are
+computed from each transaction's remaining ops, which keeps the three
+reductions sound together and reaches every distinct outcome.
+
+### EXAMPLE OUTPUT ###
+
+Scenario                     txns  ops    interleavings  schedules   states    outcomes  non-serializable    time
+find_next_id x2                 2    4                6          4       10           3                 1   0.00s
+single-use voucher x2           2   10              252          8       42           5                 3   0.00s
+find_next_id x4, markers x2     6   16         3.03e+09        878     3540         373               349   0.14s
+saleor order mix x6             6   70         1.25e+48         40      524           7                 5   0.05s
+saleor order_fulfill x4         4   47         4.28e+25       1608    16357         136               130   0.87s
+
+find_next_id x2: 1 non-serializable outcome
+  unique_ids violated by 1, e.g. T0 r-id(3), T1 r-id(3), T0 w-id(3), T1 w-id(3)
+single-use voucher x2: 3 non-serializable outcomes
+  single_use violated by 1, e.g. T0 r-code_is_active(5), T0 r-code_used(5), T0 r-voucher(72), T1 r-code_is_active(5), T1 r-code_used(5), T1 r-voucher(72), T0 w-code_used(5), T1 w-code_used(5), T0 w-code_is_active(5), T1 w-code_is_active(5)
+find_next_id x4, markers x2: 349 non-serializable outcomes
+  unique_ids violated by 257, e.g. T4 r-markers(294), T4 w-markers(294), T4 r-markers(665), T4 w-markers(665), T5 r-markers(176), T5 w-markers(176), T0 r-id(3), T0 w-id(3), T1 r-id(3), T1 w-id(3), ...
+saleor order_fulfill x4: 130 non-serializable outcomes
+  no_lost_stock violated by 106, e.g. T0 r-order_id(19), T0 r-line_id(72), T0 r-warehouse_id(0), T0 r-r-fulfillment, T1 r-order_id(93), T1 r-line_id(41), T1 r-line_id(10), T1 r-warehouse_id(21), T1 r-warehouse_id(96), T1 r-r-fulfillment, ...
+"""
+
+import itertools
+import math
+import time
+import workloads
+from latency import key_name
+from transaction import Transaction
+
+#################################
+####        Outcomes         ####
+#################################
+
+class Outcome:
+    """
+    Result of one complete execution: the final store and, per
+    transaction, the (key, value) pairs it read in order.
+    """
+    __slots__ = ("store", "reads", "schedule")
+
+    def __init__(self, store: dict, reads: tuple, schedule: list):
+        self.store = store
+        self.reads = reads
+        self.schedule = schedule        # (transaction, op label) in execution order
+
+    def key(self) -> tuple:
+        return tuple(sorted(self.store.items())), self.reads
+
+def unique_reads(table: str):
+    """
+    Invariant: no two transactions read the same value of the same row
+    of table, e.g. an id handed out or a single-use code redeemed twice.
+    """
+    def check(outcome: Outcome) -> bool:
+        seen = set()
+        for reads in outcome.reads:
+            values = {(key, value) for key, value in reads if key_name(key) == table}
+            if values & seen:
+                return False
+            seen |= values
+        return True
+    return check
+
+def counts_every_write(table: str, ops: list[list[tuple]]):
+    """
+    Invariant: every row of table ends up incremented once per write to
+    it by the transactions with the given operations(), i.e. no update
+    was lost.
+    """
+    expected = {}
+    for txn_ops in ops:
+        for kind, keys, _ in txn_ops:
+            if kind == "w":
+                for key in keys:
+                    if key_name(key) == table:
+                        expected[key] = expected.get(key, 0) + 1
+    def check(outcome: Outcome) -> bool:
+        return all(outcome.store.get(key, 0) == count for key, count in expected.items())
+    return check
+
+
+#################################
+####        Explorer         ####
+#################################
+
+def operations(t: Transaction) -> list[tuple]:
+    """
+    (kind, keys, label) for every op of t, bulk operations expanded to
+    the rows they touch.
+
+    Example usage:
+    >>> t = Transaction()
+    >>> t.append_read("id(3)")
+    >>> t.append_write_many("stock", [8, 13])
+    >>> operations(t)
+    [('r', ('id(3)',), 'r-id(3)'), ('w', ('stock(8)', 'stock(13)'), 'w-stock(8, 13)')]
+    """
+    return [(op[0], tuple(t.rows(op[2:])), op) for op in t.get_trace()]
+
+def _dependent(a: tuple, b: tuple) -> bool:
+    return (a[0] == "w" or b[0] == "w") and not set(a[1]).isdisjoint(b[1])
+
+class Explorer:
+    """
+    Explores the interleavings of transactions (see the module
+    docstring). invariants maps a name to a function of an Outcome that
+    returns False when the invariant is broken. With reduction=False
+    every interleaving is executed, for comparison.
+
+    Example usage:
+    >>> a, b = Transaction(), Transaction()
+    >>> for t in (a, b):
+    ...     t.append_read("id(3)")
+    ...     t.append_write("id(3)")
+    >>> report = Explorer([a, b], {"unique_ids": unique_reads("id")}).run()
+    >>> report.interleavings, len(report.outcomes), report.non_serializable
+    (6, 3, 1)
+    >>> report.violations["unique_ids"][0]
+    1
+    >>> Explorer([a, b], reduction=False).run().schedules
+    6
+    """
+    def __init__(self, transactions: list[Transaction], invariants: dict = None, reduction: bool = True):
+        self.ops = [operations(t) for t in transactions]
+        self.invariants = invariants or {}
+        self.reduction = reduction
+
+    def _execute(self, order: list[int]) -> tuple:
+        """
+        Run the ops in order (a list of transaction indexes) and return
+        the outcome key.
+        """
+        store, local, reads, pcs = {}, [{} for _ in self.ops], [[] for _ in self.ops], [0] * len(self.ops)
+        for i in order:
+            self._step(i, pcs, store, local, reads)
+        return tuple(sorted(store.items())), tuple(map(tuple, reads))
+
+    def _step(self, i: int, pcs: list, store: dict, local: list, reads: list):
+        kind, keys, _ = self.ops[i][pcs[i]]
+        pcs[i] += 1
+        seen = local[i]
+        for key in keys:
+            if kind == "r":
+                value = store.get(key, 0)
+                reads[i].append((key, value))
+            else:
+                value = seen.get(key, store.get(key, 0)) + 1
+                store[key] = value
+            seen[key] = value
+
+    def _persistent(self, pcs: list) -> set:
+        """
+        Smallest persistent set found by closing each enabled transaction
+        over the transactions whose remaining ops depend on a member's
+        next op.
+        """
+        enabled = [i for i, ops in enumerate(self.ops) if pcs[i] < len(ops)]
+        best = set(enabled)
+        for seed in enabled:
+            members, frontier = {seed}, [seed]
+            while frontier and len(members) < len(best):
+                t = frontier.pop()
+                op = self.ops[t][pcs[t]]
+                for q in enabled:
+                    if q not in members and any(_dependent(op, other) for other in self.ops[q][pcs[q]:]):
+                        members.add(q)
+                        frontier.append(q)
+            if len(members) < len(best):
+                best = members
+        return best
+
+    def run(self) -> "ExplorationReport":
+        serial = {self._execute([i for i in order for _ in self.ops[i]])
+                  for order in itertools.permutations(range(len(self.ops)))}
+        report = ExplorationReport(self.ops, list(self.invariants))
+        visited = {}            # state -> sleep set it was explored with
+        store, local, reads, pcs, schedule = {}, [{} for _ in self.ops], [[] for _ in self.ops], [0] * len(self.ops), []
+        total = sum(len(ops) for ops in self.ops)
+        start = time.perf_counter()
+
+        def explore(sleep: frozenset):
+            if len(schedule) == total:
+                report.schedules += 1
+                outcome = Outcome(dict(store), tuple(map(tuple, reads)), list(schedule))
+                key = outcome.key()
+                if key in report.outcomes:
+                    return
+                report.outcomes[key] = outcome
+                if key not in serial:
+                    report.non_serializable += 1
+                for name, check in self.invariants.items():
+                    if not check(outcome):
+                        count, example = report.violations.get(name, (0, outcome))
+                        report.violations[name] = (count + 1, example)
+                return
+            if self.reduction:
+                state = (tuple(pcs), tuple(sorted(store.items())), tuple(map(tuple, reads)),
+                         tuple(tuple(sorted(seen.items())) for seen in local))
+                previous = visited.get(state)
+                if previous is not None and previous <= sleep:
+                    report.pruned += 1
+                    return
+                visited[state] = sleep if previous is None else previous & sleep
+                candidates = sorted(self._persistent(pcs) - sleep)
+            else:
+                candidates = [i for i, ops in enumerate(self.ops) if pcs[i] < len(ops)]
+            report.states += 1
+            done = set()
+            for i in candidates:
+                op = self.ops[i][pcs[i]]
+                child_sleep = frozenset(q for q in sleep | done if not _dependent(self.ops[q][pcs[q]], op))
+                saved = (dict(store), dict(local[i]), len(reads[i]))
+                self._step(i, pcs, store, local, reads)
+                schedule.append((i, op[2]))
+                explore(child_sleep)
+                schedule.pop()
+                pcs[i] -= 1
+                store.clear()
+                store.update(saved[0])
+                local[i] = saved[1]
+                del reads[i][saved[2]:]
+                if self.reduction:
+                    done.add(i)
+
+        explore(frozenset())
+        report.elapsed = time.perf_counter() - start
+        return report
+
+class ExplorationReport:
+    """
+    Result of one Explorer.run(). outcomes maps each distinct outcome key
+    to the first Outcome reaching it; violations maps an invariant name
+    to (number of distinct outcomes breaking it, example Outcome).
+    """
+    HEADER = f"{'Scenario':<27}{'txns':>6}{'ops':>5}{'interleavings':>17}{'schedules':>11}{'states':>9}{'outcomes':>12}{'non-serializable':>18}{'time':>8}"
+
+    def __init__(self, ops: list, invariants: list[str]):
+        self.ops = ops
+        self.invariants = invariants
+        self.schedules = 0      # complete executions reached
+        self.states = 0         # states expanded
+        self.pruned = 0         # states skipped by state hashing
+        self.outcomes = {}
+        self.non_serializable = 0
+        self.violations = {}
+        self.elapsed = 0.0
+
+    @property
+    def interleavings(self) -> int:
+        """
+        Number of interleavings a naive enumeration would execute.
+        """
+        lengths = [len(ops) for ops in self.ops]
+        return math.factorial(sum(lengths)) // math.prod(math.factorial(n) for n in lengths)
+
+    def row(self, label: str) -> str:
+        interleavings = self.interleavings
+        shown = f"{interleavings}" if interleavings < 10 ** 9 else f"{float(interleavings):.2e}"
+        return (f"{label:<27}{len(self.ops):>6}{sum(len(ops) for ops in self.ops):>5}{shown:>17}"
+                f"{self.schedules:>11}{self.states:>9}{len(self.outcomes):>12}{self.non_serializable:>18}{self.elapsed:>7.2f}s")
+
+def format_schedule(schedule: list, limit: int = None) -> str:
+    steps = [f"T{i} {label}" for i, label in schedule]
+    if limit is not None and len(steps) > limit:
+        steps = steps[:limit] + ["..."]
+    return ", ".join(steps)
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def _voucher_redemption(code: int, voucher_id: int) -> Transaction:
+    """
+    saleor _increase_voucher_code_usage_value on a single-use code, with
+    one key per column it touches (the generator's trace names keys by
+    value, which hides the race).
+    """
+    t = Transaction()
+    t.append_read(f"code_is_active({code})")
+    t.append_read(f"code_used({code})")
+    t.append_read(f"voucher({voucher_id})")
+    t.append_write(f"code_used({code})")
+    t.append_write(f"code_is_active({code})")
+    return t
+
+def main():
+    """
+    Explore the find_next_id and single-use voucher races and larger
+    scenarios of sampled transactions.
+    """
+    import numpy as np
+    import broadleaf
+    workloads.get("saleor.order_fulfill").module
+    np.random.seed(3)
+
+    next_ids = [broadleaf.find_next_id(3, None) for _ in range(4)]
+    orders = [t for t in workloads.stream("saleor.order_fulfill", 50) if 10 <= len(t.get_trace()) <= 20]
+    lines = [t for t in workloads.stream("saleor.order_lines_create", 50) if 10 <= len(t.get_trace()) <= 20]
+    payments = list(workloads.stream("saleor.stripe_handle_authorized_payment_intent", 2))
+    markers = list(workloads.stream("mastodon.create_marker", 2))
+    fulfillments = orders[:4]
+    scenarios = [
+        ("find_next_id x2", next_ids[:2], {"unique_ids": unique_reads("id")}),
+        ("single-use voucher x2", [_voucher_redemption(5, 72), _voucher_redemption(5, 72)],
+         {"single_use": unique_reads("code_used")}),
+        ("find_next_id x4, markers x2", next_ids + markers, {"unique_ids": unique_reads("id")}),
+        ("saleor order mix x6", orders[:2] + lines[:2] + payments, {}),
+        ("saleor order_fulfill x4", fulfillments,
+         {"no_lost_stock": counts_every_write("stock", [operations(t) for t in fulfillments])}),
+    ]
+
+    # Extra space for formatting
+    print()
+    print(ExplorationReport.HEADER)
+    reports = []
+    for label, transactions, invariants in scenarios:
+        report = Explorer(transactions, invariants).run()
+        reports.append((label, report))
+        print(report.row(label))
+    print()
+    for label, report in reports:
+        if not report.violations:
+            continue
+        print(f"{label}: {report.non_serializable} non-serializable outcome{'s' if report.non_serializable != 1 else ''}")
+        for name, (count, example) in report.violations.items():
+            print(f"  {name} violated by {count}, e.g. {format_schedule(example.schedule, 10)}")
+    print()
+
+if __name__ == "__main__":
+    main()
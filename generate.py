@@ -0,0 +1,62 @@
+"""
+Lightweight command line entry point for short generation jobs.
+
+Workload names are resolved through the registry in workloads.py, and only
+the application modules of the requested workloads are imported. Runs of
+at most FAST_PATH_MAX_TXN transactions sample with the pure-Python
+rng.PythonRandom and never import NumPy; longer runs (or --rng numpy) use
+NumPy's generator, which reproduces the *_sim output for the same seed.
+
+Usage:
+    python generate.py <workload or application> ... [-n NUM_TXN]
+        [--seed SEED] [--rng auto|python|numpy]
+
+### EXAMPLE OUTPUT ###
+
+$ python generate.py broadleaf.get_next_id mastodon.create_backup -n 2 --seed 1
+broadleaf.get_next_id ['r-id(17)', 'w-id(17)']
+broadleaf.get_next_id ['r-id(32)', 'w-id(32)']
+mastodon.create_backup ['w-backup(507)']
+mastodon.create_backup ['w-backup(779)']
+"""
+
+import argparse
+import rng
+import workloads
+
+# Largest run that uses the pure-Python random fast path by default
+FAST_PATH_MAX_TXN = 1000
+
+def generate(names: list[str], num_txn: int, seed: int = None, rng_mode: str = "auto"):
+    """
+    Yield (workload name, Transaction) for num_txn transactions of each
+    named workload (or application). rng_mode picks the random source:
+    "python", "numpy", or "auto" to use Python's random module for runs of
+    up to FAST_PATH_MAX_TXN transactions.
+    """
+    names = workloads.resolve(names)
+    if rng_mode == "auto":
+        rng_mode = "python" if num_txn * len(names) <= FAST_PATH_MAX_TXN else "numpy"
+    if rng_mode == "python":
+        rng.use_python_random(seed)
+    elif rng_mode == "numpy":
+        rng.use_numpy_random(seed)
+    else:
+        raise ValueError(f"unknown rng mode {rng_mode!r}")
+    for name in names:
+        for t in workloads.stream(name, num_txn):
+            yield name, t
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Print sampled transaction traces.")
+    parser.add_argument("workloads", nargs="+", help="workload or application names")
+    parser.add_argument("-n", "--num-txn", type=int, default=10)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--rng", choices=["auto", "python", "numpy"], default="auto")
+    args = parser.parse_args(argv)
+
+    for name, t in generate(args.workloads, args.num_txn, args.seed, args.rng):
+        print(f"{name} {t}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Invariant checker for ad hoc transactions under concurrency.
+
+Tang et al. show that the ad hoc transactions in these applications break
+invariants once requests interleave: stock is oversold by Spree, Broadleaf
+and Saleor, single-use vouchers are redeemed twice, and broadleaf's
+find_next_id hands the same id to two callers. This module re-runs the
+read/check/write logic of those transactions as interleaved executions
+over a DatabaseState and checks the invariants after every commit.
+
+Each transaction is a Python generator that performs one database
+operation per step, mirroring the pseudocode of its *_generator. The
+scheduler picks a random client for every step, so with one client the
+execution is serial and no invariant can break. Reads see the latest
+value (READ COMMITTED without the ad hoc lock), writes are applied when
+their statement runs, and only the rows a transaction touched are
+re-checked when it commits.
+
+Invariants:
+    non_negative_stock   saleor stock quantity never drops below zero
+    stock_conservation   spree/broadleaf stock equals initial + restocked - sold
+    usage_limit          saleor voucher code usage never exceeds its limit
+    single_use           a single-use saleor voucher code is redeemed once
+    unique_ids           broadleaf find_next_id never returns an id twice
+
+### EXAMPLE OUTPUT ###
+
+Checking broadleaf_find_next_id invariants
+clients=1    commits=20000 violations=0    rate=0.0000 ops/s=3104445
+clients=4    commits=20000 violations=180  rate=0.0090 ops/s=2576838
+clients=16   commits=20000 violations=922  rate=0.0461 ops/s=2435241
+clients=64   commits=20000 violations=3497 rate=0.1749 ops/s=3003461
+clients=256  commits=20000 violations=9131 rate=0.4566 ops/s=3031068
+clients=1024 commits=20000 violations=15303 rate=0.7651 ops/s=2110549
+"""
+
+import time
+import numpy as np
+from state import DatabaseState
+
+#################################
+####   Invariant programs    ####
+#################################
+
+class InvariantChecker:
+    """
+    Interleaved executor over a DatabaseState.
+
+    Table contents are copied into plain Python lists on construction so
+    that a step costs a list index rather than a NumPy scalar access, and
+    are copied back by write_back(). Once a violation is counted, the
+    expected value of the row is reset so each race is reported once.
+
+    Example usage:
+    >>> np.random.seed(0)
+    >>> checker = InvariantChecker(DatabaseState(num_id_types=2))
+    >>> report = checker.run("broadleaf_find_next_id", num_clients=1, num_txn=100)
+    >>> report.violations
+    0
+    >>> checker = InvariantChecker(DatabaseState(num_skus=1, initial_sku_quantity=1))
+    >>> for _ in checker.broadleaf_decrement_sku([0, 0]):
+    ...     pass
+    >>> checker.sku_quantity, checker.sku_expected
+    ([1], [1])
+    """
+    def __init__(self, state: DatabaseState):
+        self.state = state
+        state.flush()
+        self.stock_count_on_hand = state.stock_count_on_hand.values.tolist()
+        self.sku_quantity = state.sku_quantity.values.tolist()
+        self.stock_quantity = state.stock_quantity.values.tolist()
+        self.voucher_usage_limit = state.voucher_usage_limit.values.tolist()
+        self.voucher_single_use = state.voucher_single_use.values.tolist()
+        self.code_used = state.code_used.values.tolist()
+        self.code_is_active = state.code_is_active.values.tolist()
+        self.code_voucher_id = state.code_voucher_id.values.tolist()
+        self.next_id = state.next_id.values.tolist()
+
+        # Bookkeeping of what a serial execution would have produced
+        self.stock_expected = list(self.stock_count_on_hand)
+        self.sku_expected = list(self.sku_quantity)
+        self.code_redemptions = [0] * len(self.code_used)
+        # Codes that already exceed their limit in the starting state are
+        # only reported if their usage grows further.
+        self.code_allowed_usage = [
+            max(self.voucher_usage_limit[self.code_voucher_id[code]], used)
+            for code, used in enumerate(self.code_used)
+        ]
+        self.issued_ids = [set() for _ in self.next_id]
+
+        self.violations = {
+            "non_negative_stock": 0,
+            "stock_conservation": 0,
+            "usage_limit": 0,
+            "single_use": 0,
+            "unique_ids": 0,
+        }
+
+    def write_back(self):
+        """
+        Copy the simulated table contents back into the DatabaseState.
+        """
+        self.state.stock_count_on_hand.values[:] = self.stock_count_on_hand
+        self.state.sku_quantity.values[:] = self.sku_quantity
+        self.state.stock_quantity.values[:] = self.stock_quantity
+        self.state.code_used.values[:] = self.code_used
+        self.state.code_is_active.values[:] = self.code_is_active
+        self.state.next_id.values[:] = self.next_id
+
+    ### Transaction programs ###
+
+    def spree_stock_item_update(self, stock_item_id: int, value: int):
+        """
+        spree adjust_count_on_hand without the FOR UPDATE lock.
+
+        SELECT count_on_hand FROM stock_items WHERE id = stock_item.id
+        if count_on_hand + value < 0: TRANSACTION COMMIT (insufficient stock)
+        UPDATE stock_items SET count_on_hand = new_count WHERE id = stock_item.id
+        """
+        count_on_hand = self.stock_count_on_hand[stock_item_id]
+        yield
+        new_count = count_on_hand + value
+        if new_count < 0:
+            return None
+        self.stock_count_on_hand[stock_item_id] = new_count
+        self.stock_expected[stock_item_id] += value
+        yield
+        if self.stock_count_on_hand[stock_item_id] != self.stock_expected[stock_item_id]:
+            self.stock_expected[stock_item_id] = self.stock_count_on_hand[stock_item_id]
+            return "stock_conservation"
+        return None
+
+    def broadleaf_decrement_sku(self, sku_ids: list[int]):
+        """
+        broadleaf decrement_sku, one read and one absolute write per sku.
+
+        for entry in skuQuantities.entries:
+            SELECT quantity_available FROM sku WHERE sku_id = entry.sku_id
+            if quantity_available < 1: TRANSACTION ABORT
+            UPDATE sku SET quantity_available = quantity_available - 1
+
+        An abort rolls back the decrements already made.
+        """
+        applied = []
+        for sku_id in sku_ids:
+            quantity = self.sku_quantity[sku_id]
+            yield
+            if quantity < 1:
+                # Roll back the decrements of the skus before this one
+                for done in applied:
+                    self.sku_quantity[done] += 1
+                    self.sku_expected[done] += 1
+                return None
+            self.sku_quantity[sku_id] = quantity - 1
+            self.sku_expected[sku_id] -= 1
+            applied.append(sku_id)
+            yield
+        violated = None
+        for sku_id in sku_ids:
+            if self.sku_quantity[sku_id] != self.sku_expected[sku_id]:
+                self.sku_expected[sku_id] = self.sku_quantity[sku_id]
+                violated = "stock_conservation"
+        return violated
+
+    def saleor_order_fulfill(self, stock_id: int, quantity: int):
+        """
+        saleor order fulfillment without select_for_update on Stock. A
+        negative quantity returns stock, as saleor_cancel_order does.
+
+        stock = SELECT * FROM Stock WHERE id = allocation.stock_id
+        if stock.quantity < quantity: TRANSACTION ABORT
+        UPDATE Stock SET quantity = quantity - quantity WHERE id = stock.pk
+        """
+        available = self.stock_quantity[stock_id]
+        yield
+        if available < quantity:
+            return None
+        self.stock_quantity[stock_id] -= quantity
+        yield
+        if self.stock_quantity[stock_id] < 0:
+            return "non_negative_stock"
+        return None
+
+    def saleor_checkout_voucher_code(self, code: int):
+        """
+        saleor _increase_voucher_code_usage_value without the code lock.
+
+        code = SELECT * FROM voucher_codes WHERE code = :code AND is_active
+        voucher = SELECT * FROM vouchers WHERE id = code.voucher_id
+        if code.used >= voucher.usage_limit: TRANSACTION COMMIT
+        UPDATE voucher_codes SET used = used + 1 WHERE code = :code
+        if voucher.single_use:
+            UPDATE voucher_codes SET is_active = False WHERE code = :code
+        """
+        is_active = self.code_is_active[code]
+        used = self.code_used[code]
+        yield
+        if not is_active:
+            return None
+        voucher_id = self.code_voucher_id[code]
+        usage_limit = self.voucher_usage_limit[voucher_id]
+        yield
+        if used >= usage_limit:
+            return None
+        self.code_used[code] += 1
+        self.code_redemptions[code] += 1
+        yield
+        if self.voucher_single_use[voucher_id]:
+            self.code_is_active[code] = 0
+            yield
+            if self.code_redemptions[code] > 1:
+                return "single_use"
+        if self.code_used[code] > self.code_allowed_usage[code]:
+            self.code_allowed_usage[code] = self.code_used[code]
+            return "usage_limit"
+        return None
+
+    def broadleaf_find_next_id(self, id_type: int):
+        """
+        broadleaf find_next_id without the id table lock.
+
+        id = SELECT id FROM idMap WHERE type = idType
+        UPDATE idMap SET id = id + 1 WHERE type = idType
+        """
+        allocated = self.next_id[id_type]
+        yield
+        self.next_id[id_type] = allocated + 1
+        yield
+        issued = self.issued_ids[id_type]
+        if allocated in issued:
+            return "unique_ids"
+        issued.add(allocated)
+        return None
+
+    ### Scheduler ###
+
+    def run(self, workload: str, num_clients: int, num_txn: int) -> "InvariantReport":
+        """
+        Run num_txn transactions of the given workload on num_clients
+        concurrent clients. Each client executes its transactions back to
+        back; at every step a uniformly random busy client runs one op.
+        """
+        program, sample = WORKLOADS[workload]
+        program = getattr(self, program)
+        args = sample(self, num_txn)
+
+        clients = []
+        started = 0
+        committed = 0
+        violations = dict.fromkeys(self.violations, 0)
+        ops = 0
+        start = time.perf_counter()
+        while committed < num_txn:
+            while len(clients) < num_clients and started < num_txn:
+                clients.append(program(*args[started]))
+                started += 1
+            picks = (np.random.random(4096) * len(clients)).astype(np.int64).tolist()
+            for pick in picks:
+                if pick >= len(clients):
+                    continue
+                try:
+                    next(clients[pick])
+                    ops += 1
+                except StopIteration as commit:
+                    ops += 1
+                    committed += 1
+                    if commit.value is not None:
+                        violations[commit.value] += 1
+                    if started < num_txn:
+                        clients[pick] = program(*args[started])
+                        started += 1
+                    else:
+                        clients[pick] = clients[-1]
+                        clients.pop()
+        elapsed = time.perf_counter() - start
+        for invariant, count in violations.items():
+            self.violations[invariant] += count
+        return InvariantReport(workload, num_clients, committed, violations, ops, elapsed)
+
+
+class InvariantReport:
+    """
+    Result of one InvariantChecker.run call. violations_by_invariant
+    counts the commits that broke each invariant.
+    """
+    def __init__(self, workload: str, num_clients: int, commits: int, violations_by_invariant: dict[str, int], ops: int, elapsed: float):
+        self.workload = workload
+        self.num_clients = num_clients
+        self.commits = commits
+        self.violations_by_invariant = violations_by_invariant
+        self.violations = sum(violations_by_invariant.values())
+        self.ops = ops
+        self.elapsed = elapsed
+
+    @property
+    def violation_rate(self) -> float:
+        """
+        Fraction of commits that left one of their rows in violation.
+        """
+        return self.violations / self.commits if self.commits else 0.0
+
+    @property
+    def ops_per_second(self) -> float:
+        return self.ops / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"clients={self.num_clients:<4} commits={self.commits} violations={self.violations:<4} "
+                f"rate={self.violation_rate:.4f} ops/s={self.ops_per_second:.0f}")
+
+
+#################################
+####   Parameter sampling    ####
+#################################
+
+def _sample_spree_stock_item_update(checker: InvariantChecker, num_txn: int) -> list[tuple]:
+    stock_item_ids = np.random.randint(1, len(checker.stock_count_on_hand), size=num_txn)
+    # Mostly unstock single units, occasionally restock like spree_stock_item_update_sim
+    values = np.where(np.random.rand(num_txn) < 0.2, np.random.randint(0, 10, size=num_txn), -np.random.randint(1, 3, size=num_txn))
+    return list(zip(stock_item_ids.tolist(), values.tolist()))
+
+def _sample_broadleaf_decrement_sku(checker: InvariantChecker, num_txn: int) -> list[tuple]:
+    sku_ids = np.random.choice(len(checker.sku_quantity), (num_txn, 4))
+    return [(row,) for row in sku_ids.tolist()]
+
+def _sample_saleor_order_fulfill(checker: InvariantChecker, num_txn: int) -> list[tuple]:
+    stock_ids = np.random.choice(len(checker.stock_quantity), num_txn)
+    quantities = np.where(np.random.rand(num_txn) < 0.2, -np.random.randint(1, 20, size=num_txn), np.random.randint(1, 5, size=num_txn))
+    return list(zip(stock_ids.tolist(), quantities.tolist()))
+
+def _sample_saleor_checkout_voucher_code(checker: InvariantChecker, num_txn: int) -> list[tuple]:
+    codes = np.random.choice(len(checker.code_used), num_txn)
+    return [(code,) for code in codes.tolist()]
+
+def _sample_broadleaf_find_next_id(checker: InvariantChecker, num_txn: int) -> list[tuple]:
+    id_types = np.random.choice(len(checker.next_id), num_txn)
+    return [(id_type,) for id_type in id_types.tolist()]
+
+# workload name -> (program method, parameter sampler)
+WORKLOADS = {
+    "spree_stock_item_update": ("spree_stock_item_update", _sample_spree_stock_item_update),
+    "broadleaf_decrement_sku": ("broadleaf_decrement_sku", _sample_broadleaf_decrement_sku),
+    "saleor_order_fulfill": ("saleor_order_fulfill", _sample_saleor_order_fulfill),
+    "saleor_checkout_voucher_code": ("saleor_checkout_voucher_code", _sample_saleor_checkout_voucher_code),
+    "broadleaf_find_next_id": ("broadleaf_find_next_id", _sample_broadleaf_find_next_id),
+}
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def sweep(workload: str, client_counts: list[int], num_txn: int, state_factory=DatabaseState) -> list[InvariantReport]:
+    """
+    Run the workload once per client count, each time on a fresh state,
+    and return one report per concurrency level.
+    """
+    reports = []
+    for num_clients in client_counts:
+        checker = InvariantChecker(state_factory())
+        reports.append(checker.run(workload, num_clients, num_txn))
+    return reports
+
+def main():
+    """
+    Report invariant violation rates for every workload while sweeping
+    the number of concurrent clients from 1 to 1024.
+    """
+    num_txn = 20000
+    client_counts = [1, 4, 16, 64, 256, 1024]
+
+    # Extra space for formatting
+    print()
+    for workload in WORKLOADS:
+        print(f"Checking {workload} invariants")
+        for report in sweep(workload, client_counts, num_txn):
+            print(report)
+        print()
+
+if __name__ == "__main__":
+    main()
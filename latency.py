@@ -0,0 +1,419 @@
+"""
+Simulated latency model for interleaved executions of transaction traces.
+
+A CostModel assigns a service time to every operation of a trace: plain
+reads, writes, reads that are later written by the same transaction
+(SELECT ... FOR UPDATE in the pseudocode), table-level operations on keys
+that stand for a whole table or collection (scmsuite's w-catalog_delete,
+saleor's w-product_channel_listing, mastodon's r-poll(*)) and the final
+commit. A bulk operation on many rows costs and locks each of its rows.
+Writes and FOR UPDATE reads take an exclusive lock on their key that is
+held until commit, as in strict two-phase locking; plain reads never
+block.
+
+simulate() runs a closed-loop discrete-event simulation of a mixed
+workload on a number of clients. Lock waits are part of a transaction's
+latency, and a transaction that would close a wait-for cycle is aborted
+and restarted. Latencies are recorded per transaction type in log-bucketed
+LatencyHistograms, which are cheap to record into and can be merged
+across workers.
+
+### EXAMPLE OUTPUT ###
+
+Simulating 32 clients over 20000 transactions
+workload                                          count    p50(us)    p99(us)    max(us)
+broadleaf.decrement_sku                             534       2527       4223       4600
+broadleaf.get_next_id                               547       1215       1215       1800
+mastodon.deliver_votes                              553       5500       5500       5500
+saleor.delete_categories                            519     131071     266239     385100
+saleor.order_fulfill                                554       4607      23551      46700
+scmsuite.copy_catalog_form                          548        903      61439      82900
+scmsuite.remove_catalog_list                        519      15487      82943      99400
+...
+throughput=5742 txn/s aborts=48
+"""
+
+import heapq
+import numpy as np
+import workloads
+from transaction import Transaction
+
+#################################
+####   Latency histogram     ####
+#################################
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of non-negative integer latencies (microseconds).
+
+    Values below 2**significant_bits are counted exactly; larger values
+    fall into log-spaced buckets, each split into 2**(significant_bits - 1)
+    linear sub-buckets, so the relative error of a reported value is below
+    2**-(significant_bits - 1). Histograms with the same parameters can be
+    merged by adding their bucket counts.
+
+    Example usage:
+    >>> h = LatencyHistogram()
+    >>> for value in range(1, 1001):
+    ...     h.record(value)
+    >>> h.count, h.value_at_percentile(50), h.value_at_percentile(99)
+    (1000, 503, 991)
+    >>> other = LatencyHistogram()
+    >>> other.record_many(np.full(1000, 10**6))
+    >>> h.merge(other)
+    >>> h.value_at_percentile(25), h.value_at_percentile(99)
+    (503, 1000000)
+    """
+    def __init__(self, significant_bits: int = 7, max_bits: int = 40):
+        self.significant_bits = significant_bits
+        self.max_bits = max_bits
+        self.sub_bucket_count = 1 << significant_bits
+        self.half_count = self.sub_bucket_count >> 1
+        num_buckets = self.sub_bucket_count + (max_bits - significant_bits) * self.half_count
+        self.counts = np.zeros(num_buckets, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def index_of(self, value: int) -> int:
+        """
+        Return the bucket index of value.
+        """
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.significant_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + (value >> shift) - self.half_count
+
+    def highest_equivalent_value(self, index: int) -> int:
+        """
+        Return the largest value that falls into bucket index.
+        """
+        if index < self.sub_bucket_count:
+            return index
+        shift = (index - self.sub_bucket_count) // self.half_count + 1
+        mantissa = (index - self.sub_bucket_count) % self.half_count + self.half_count
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int):
+        """
+        Record a single latency.
+        """
+        value = int(value)
+        self.counts[self.index_of(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def record_many(self, values: np.ndarray):
+        """
+        Record an array of latencies with vectorized bucket computation.
+        """
+        values = np.asarray(values, dtype=np.int64)
+        if values.size == 0:
+            return
+        _, bit_length = np.frexp(values.astype(np.float64))
+        shift = np.maximum(bit_length - self.significant_bits, 0)
+        index = np.where(
+            values < self.sub_bucket_count,
+            values,
+            self.sub_bucket_count + (shift - 1) * self.half_count + (values >> shift) - self.half_count,
+        )
+        self.counts += np.bincount(index, minlength=self.counts.size)
+        self.count += int(values.size)
+        self.total += int(values.sum())
+        self.max = max(self.max, int(values.max()))
+
+    def merge(self, other: "LatencyHistogram"):
+        """
+        Add the counts of another histogram with the same parameters.
+        """
+        if (other.significant_bits, other.max_bits) != (self.significant_bits, self.max_bits):
+            raise ValueError("cannot merge histograms with different bucket layouts")
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def value_at_percentile(self, percentile: float) -> int:
+        """
+        Return the value below or at which percentile percent of the
+        recorded latencies fall.
+        """
+        if self.count == 0:
+            return 0
+        rank = max(int(np.ceil(percentile / 100 * self.count)), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self.highest_equivalent_value(index), self.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self) -> dict:
+        """
+        Serialize the histogram (non-empty buckets only), e.g. to send it
+        from a worker process.
+        """
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            "significant_bits": self.significant_bits,
+            "max_bits": self.max_bits,
+            "buckets": dict(zip(nonzero.tolist(), self.counts[nonzero].tolist())),
+            "total": self.total,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencyHistogram":
+        """
+        Rebuild a histogram serialized with to_dict.
+        """
+        h = cls(data["significant_bits"], data["max_bits"])
+        for index, count in data["buckets"].items():
+            h.counts[int(index)] = count
+        h.count = int(h.counts.sum())
+        h.total = data["total"]
+        h.max = data["max"]
+        return h
+
+
+#################################
+####       Cost model        ####
+#################################
+
+def key_name(key: str) -> str:
+    """
+    Return the table part of an operation key, e.g. "goods_shelf" for
+    "goods_shelf(26)".
+    """
+    return key.split("(", 1)[0]
+
+# Keys that stand for a whole table or collection in the traces
+TABLE_LEVEL_KEYS = {"catalog_delete", "product_channel_listing", "poll(*)"}
+
+class CostModel:
+    """
+    Service times, in microseconds, for the operations of a trace.
+
+    Operations on table_level_keys cost table_level regardless of their
+    kind. overrides maps a key name (see key_name) to the service time of
+    every operation on it, e.g. {"goods_shelf": 1000}.
+
+    Example usage:
+    >>> from transaction import Transaction
+    >>> t = Transaction()
+    >>> t.append_read("goods_shelf(26)")
+    >>> t.append_write("goods_shelf(26)")
+    >>> t.append_write("catalog_delete")
+    >>> CostModel().plan(t.get_trace())
+    [('goods_shelf(26)', True, 300), ('goods_shelf(26)', True, 200), ('catalog_delete', True, 5000)]
+    >>> u = Transaction()
+    >>> u.append_read_many("sku", [3, 1])
+    >>> u.append_write("sku(3)")
+    >>> CostModel().plan(u.get_trace(), u.rows)
+    [('sku(1)', False, 100), ('sku(3)', True, 300), ('sku(3)', True, 200)]
+    """
+    def __init__(self,
+                 read: int = 100,
+                 write: int = 200,
+                 read_for_update: int = 300,
+                 table_level: int = 5000,
+                 commit: int = 500,
+                 table_level_keys: set[str] = TABLE_LEVEL_KEYS,
+                 overrides: dict[str, int] = None):
+        self.read = read
+        self.write = write
+        self.read_for_update = read_for_update
+        self.table_level = table_level
+        self.commit = commit
+        self.table_level_keys = table_level_keys
+        self.overrides = overrides or {}
+
+    def plan(self, trace: list[str], rows=None) -> list[tuple[str, bool, int]]:
+        """
+        Return (key, takes exclusive lock, service time) for every
+        operation of trace. rows, usually the Transaction.rows of the
+        trace's transaction, maps an operation's key to the single-row
+        keys it touches; a bulk operation is then planned as one
+        operation per row, so it is charged and locked row by row.
+        """
+        ops = []
+        for op in trace:
+            key = op[2:]
+            ops.append((op[0], key, [key] if rows is None else rows(key)))
+        written = {row for kind, _, op_rows in ops if kind == "w" for row in op_rows}
+        plan = []
+        for kind, key, op_rows in ops:
+            name = key_name(key)
+            for row in op_rows:
+                if kind == "w":
+                    exclusive, cost = True, self.write
+                elif row in written:
+                    exclusive, cost = True, self.read_for_update
+                else:
+                    exclusive, cost = False, self.read
+                if key in self.table_level_keys:
+                    cost = self.table_level
+                plan.append((row, exclusive, self.overrides.get(name, cost)))
+        return plan
+
+
+#################################
+####   Latency simulation    ####
+#################################
+
+class LatencyReport:
+    """
+    Per-type latency histograms and totals of one simulate() run.
+    """
+    def __init__(self, histograms: dict[str, LatencyHistogram], makespan: int, aborts: int):
+        self.histograms = histograms
+        self.makespan = makespan
+        self.aborts = aborts
+
+    @property
+    def committed(self) -> int:
+        return sum(h.count for h in self.histograms.values())
+
+    @property
+    def throughput(self) -> float:
+        """
+        Committed transactions per simulated second.
+        """
+        return self.committed / (self.makespan / 1e6) if self.makespan else 0.0
+
+    def overall(self) -> LatencyHistogram:
+        """
+        Merge the per-type histograms into one.
+        """
+        total = LatencyHistogram()
+        for h in self.histograms.values():
+            total.merge(h)
+        return total
+
+    def __str__(self):
+        lines = [f"{'workload':<48}{'count':>7}{'p50(us)':>11}{'p99(us)':>11}{'max(us)':>11}"]
+        for name in sorted(self.histograms):
+            h = self.histograms[name]
+            lines.append(f"{name:<48}{h.count:>7}{h.value_at_percentile(50):>11}{h.value_at_percentile(99):>11}{h.max:>11}")
+        lines.append(f"throughput={self.throughput:.0f} txn/s aborts={self.aborts}")
+        return "\n".join(lines)
+
+def simulate(transactions: list[tuple[str, Transaction]], num_clients: int, cost_model: CostModel = None) -> LatencyReport:
+    """
+    Run (workload name, Transaction) pairs on num_clients closed-loop clients,
+    which take the next transaction from a shared queue whenever they
+    finish one. Returns the latency of every committed transaction,
+    measured from its first start to its commit, retries included.
+    """
+    cost_model = cost_model or CostModel()
+    plans = [(name, cost_model.plan(t.get_trace(), t.rows)) for name, t in transactions]
+    histograms = {name: LatencyHistogram() for name, _ in plans}
+
+    events = []             # (time, sequence number, client)
+    sequence = 0
+    next_txn = 0
+    current = [None] * num_clients      # index into plans
+    position = [0] * num_clients        # next op of the current transaction
+    started_at = [0] * num_clients
+    held = [[] for _ in range(num_clients)]
+    waiting_on = [None] * num_clients
+    owner = {}
+    waiters = {}
+    aborts = 0
+    now = 0
+
+    def release(client: int, time: int):
+        nonlocal sequence
+        for key in held[client]:
+            queue = waiters.get(key)
+            if queue:
+                waiter = queue.pop(0)
+                owner[key] = waiter
+                held[waiter].append(key)
+                waiting_on[waiter] = None
+                sequence += 1
+                heapq.heappush(events, (time, sequence, waiter))
+            else:
+                del owner[key]
+        held[client] = []
+
+    def deadlocks(client: int, holder: int) -> bool:
+        while holder is not None:
+            if holder == client:
+                return True
+            key = waiting_on[holder]
+            holder = owner.get(key) if key is not None else None
+        return False
+
+    for client in range(min(num_clients, len(plans))):
+        current[client] = next_txn
+        next_txn += 1
+        heapq.heappush(events, (0, client, client))
+    sequence = num_clients
+
+    while events:
+        now, _, client = heapq.heappop(events)
+        name, plan = plans[current[client]]
+        pos = position[client]
+        if pos == len(plan):
+            # Commit finished: release locks and pick up the next transaction
+            release(client, now)
+            histograms[name].record(now - started_at[client])
+            if next_txn < len(plans):
+                current[client] = next_txn
+                next_txn += 1
+                position[client] = 0
+                started_at[client] = now
+                sequence += 1
+                heapq.heappush(events, (now, sequence, client))
+            continue
+
+        key, exclusive, cost = plan[pos]
+        if exclusive and owner.get(key, client) != client:
+            holder = owner[key]
+            if deadlocks(client, holder):
+                # Abort the requester and restart it from its first op
+                aborts += 1
+                release(client, now)
+                position[client] = 0
+                sequence += 1
+                heapq.heappush(events, (now + cost_model.commit, sequence, client))
+            else:
+                waiting_on[client] = key
+                waiters.setdefault(key, []).append(client)
+            continue
+        if exclusive and key not in owner:
+            owner[key] = client
+            held[client].append(key)
+        position[client] = pos + 1
+        finish = now + cost + (cost_model.commit if pos + 1 == len(plan) else 0)
+        sequence += 1
+        heapq.heappush(events, (finish, sequence, client))
+
+    return LatencyReport(histograms, now, aborts)
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def main():
+    """
+    Simulate a uniform mix of every workload and print per-type p50/p99.
+    """
+    num_txn = 20000
+    num_clients = 32
+    cost_model = CostModel()
+
+    np.random.seed(0)
+    transactions = list(workloads.mix(workloads.names(), num_txn))
+
+    # Extra space for formatting
+    print()
+    print(f"Simulating {num_clients} clients over {num_txn} transactions")
+    print(simulate(transactions, num_clients, cost_model))
+
+if __name__ == "__main__":
+    main()
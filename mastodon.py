@@ -28,11 +28,11 @@ Generating Mastodon update account simulation
 ['w-account(392)']
 
 Generating Mastodon call simulation
-['w-[account(468), choice(4)]', 'w-[account(468), choice(2)]', 'w-[account(468), choice(1)]', 'w-[account(468), choice(8)]']
-['w-[account(624), choice(7)]', 'w-[account(624), choice(5)]', 'w-[account(624), choice(0)]', 'w-[account(624), choice(1)]']
-['w-[account(664), choice(7)]', 'w-[account(664), choice(0)]', 'w-[account(664), choice(4)]', 'w-[account(664), choice(3)]']
-['w-[account(515), choice(5)]', 'w-[account(515), choice(0)]', 'w-[account(515), choice(6)]']
-['w-[account(393), choice(1)]', 'w-[account(393), choice(0)]', 'w-[account(393), choice(8)]', 'w-[account(393), choice(8)]']
+['w-poll(account=468, choice=4)', 'w-poll(account=468, choice=2)', 'w-poll(account=468, choice=1)', 'w-poll(account=468, choice=8)']
+['w-poll(account=624, choice=7)', 'w-poll(account=624, choice=5)', 'w-poll(account=624, choice=0)', 'w-poll(account=624, choice=1)']
+['w-poll(account=664, choice=7)', 'w-poll(account=664, choice=0)', 'w-poll(account=664, choice=4)', 'w-poll(account=664, choice=3)']
+['w-poll(account=515, choice=5)', 'w-poll(account=515, choice=0)', 'w-poll(account=515, choice=6)']
+['w-poll(account=393, choice=1)', 'w-poll(account=393, choice=0)', 'w-poll(account=393, choice=8)', 'w-poll(account=393, choice=8)']
 
 Generating Mastodon process status simulation
 ['w-status(122)']
@@ -70,7 +70,7 @@ Generating Mastodon create marker simulation
 ['r-markers(924)', 'w-markers(924)', 'r-markers(344)', 'w-markers(344)']
 """
 
-import numpy as np
+from rng import np
 from transaction import Transaction
 
 #################################
@@ -79,7 +79,7 @@ from transaction import Transaction
 
 
 ### Transaction 1 ###
-def increment_counter_cache(poll_id, choice):
+def increment_counter_cache(poll_id, choice, state=None, new_transaction=Transaction):
     """
     Purpose: increment poll counter cache
     Source code: https://github.com/mastodon/mastodon/blob/main/app/models/poll_vote.rb#L34C3-L41C4
@@ -96,17 +96,30 @@ def increment_counter_cache(poll_id, choice):
     TRANSACTION COMMIT
 
     The exception occurs when there is a synchronization error
+
+    If a DatabaseState is given, the tally increment is applied to its
+    poll_tallies table once the transaction commits.
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_write(f"cached_tallies({poll_id}, {choice})")
     err = np.random.choice(2)
     if err:
         t.append_read(f"poll({poll_id})")
         t.append_write(f"cached_tallies({poll_id}, {choice})")
+    if state is not None:
+        state.poll_tallies.add((poll_id, choice), 1)
     return t
 
 
-def increment_counter_cache_sim(num_transactions: int):
+def increment_counter_cache_stream(num_transactions: int, state=None, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as increment_counter_cache_sim.
+    """
+    for _ in range(num_transactions):
+        yield increment_counter_cache(np.random.choice(200), np.random.choice(100), state, new_transaction=new_transaction)
+
+
+def increment_counter_cache_sim(num_transactions: int, state=None):
     """
     Example output:
 
@@ -116,13 +129,12 @@ def increment_counter_cache_sim(num_transactions: int):
     ['w-cached_tallies(188, 42)', 'r-poll(188)', 'w-cached_tallies(188, 42)']
     ['w-cached_tallies(56, 53)']
     """
-    for _ in range(num_transactions):
-        t = increment_counter_cache(np.random.choice(200), np.random.choice(100))
+    for t in increment_counter_cache_stream(num_transactions, state):
         print(t)
 
 
 ### Transaction 2 ###
-def create_account():
+def create_account(new_transaction=Transaction):
     """
     Purpose: create an account
     Source code: https://github.com/mastodon/mastodon/blob/main/app/services/activitypub/process_account_service.rb#L72C3-L85C6
@@ -138,12 +150,20 @@ def create_account():
 
     We represent every account as an integer between 1 and 1000. The read occurs in update_account().
     """
-    t = Transaction()
+    t = new_transaction()
     account_id = np.random.choice(1000)
     t.append_write(f"account({account_id})")
     return t
 
 
+def create_account_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as create_account_sim.
+    """
+    for _ in range(num_transactions):
+        yield create_account(new_transaction=new_transaction)
+
+
 def create_account_sim(num_transactions: int):
     """
     Example output:
@@ -154,13 +174,12 @@ def create_account_sim(num_transactions: int):
     ['w-account(327)']
     ['w-account(847)']
     """
-    for _ in range(num_transactions):
-        t = create_account()
+    for t in create_account_stream(num_transactions):
         print(t)
 
 
 ### Transaction 3 ###
-def update_account():
+def update_account(new_transaction=Transaction):
     """
     Purpose: update an account
     Source code: https://github.com/mastodon/mastodon/blob/main/app/services/activitypub/process_account_service.rb#L87C3-L98C6
@@ -176,13 +195,21 @@ def update_account():
 
     We represent every account as an integer between 1 and 1000.
     """
-    t = Transaction()
+    t = new_transaction()
     account_id = np.random.choice(1000)
     t.append_read(f"account({account_id})")
     t.append_write(f"account({account_id})")
     return t
 
 
+def update_account_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as update_account_sim.
+    """
+    for _ in range(num_transactions):
+        yield update_account(new_transaction=new_transaction)
+
+
 def update_account_sim(num_transactions: int):
     """
     Example output:
@@ -193,13 +220,12 @@ def update_account_sim(num_transactions: int):
     ['r-account(50)', 'w-account(50)']
     ['r-account(4)', 'w-account(4)']
     """
-    for _ in range(num_transactions):
-        t = update_account()
+    for t in update_account_stream(num_transactions):
         print(t)
 
 
 ### Transaction 4 ###
-def call(account, poll, choices):
+def call(account, poll, choices, new_transaction=Transaction):
     """
     Purpose: update vote totals
     Source code: https://github.com/mastodon/mastodon/blob/main/app/services/vote_service.rb#L9C1-L43C10
@@ -212,33 +238,42 @@ def call(account, poll, choices):
     TRANSACTION COMMIT
     # Update values and release lock
     """
-    t = Transaction()
+    t = new_transaction()
     for choice in choices:
-        t.append_write(f"[account({account}), choice({choice})]")
+        t.append_insert("poll", account=account, choice=choice)
     return t
 
 
-def call_sim(num_transactions: int):
+def call_stream(num_transactions: int, new_transaction=Transaction):
     """
-    Example output:
-
-    ['w-[account(138), choice(9)]', 'w-[account(138), choice(0)]']
-    ['w-[account(796), choice(6)]', 'w-[account(796), choice(7)]', 'w-[account(796), choice(6)]']
-    ['w-[account(386), choice(9)]', 'w-[account(386), choice(7)]', 'w-[account(386), choice(3)]']
-    ['w-[account(231), choice(1)]', 'w-[account(231), choice(3)]']
-    ['w-[account(837), choice(9)]', 'w-[account(837), choice(9)]', 'w-[account(837), choice(0)]']
+    Yield num_transactions transactions sampled the same way as call_sim.
     """
     for _ in range(num_transactions):
         t = call(
             np.random.choice(1000),
             None,
             [np.random.choice(10) for _ in range(int(round(np.random.normal(3, 1))))],
+            new_transaction=new_transaction,
         )
+        yield t
+
+
+def call_sim(num_transactions: int):
+    """
+    Example output:
+
+    ['w-poll(account=138, choice=9)', 'w-poll(account=138, choice=0)']
+    ['w-poll(account=796, choice=6)', 'w-poll(account=796, choice=7)', 'w-poll(account=796, choice=6)']
+    ['w-poll(account=386, choice=9)', 'w-poll(account=386, choice=7)', 'w-poll(account=386, choice=3)']
+    ['w-poll(account=231, choice=1)', 'w-poll(account=231, choice=3)']
+    ['w-poll(account=837, choice=9)', 'w-poll(account=837, choice=9)', 'w-poll(account=837, choice=0)']
+    """
+    for t in call_stream(num_transactions):
         print(t)
 
 
 ### Transaction 4.5 ###
-def deliver_votes():
+def deliver_votes(new_transaction=Transaction):
     """
     Deliver vote totals
     Source code: https://github.com/mastodon/mastodon/blob/main/app/services/vote_service.rb#L9C1-L43C10
@@ -250,19 +285,26 @@ def deliver_votes():
 
     This is the associated read for transaction 4.
     """
-    t = Transaction()
-    t.append_read(f"votes")
+    t = new_transaction()
+    t.append_predicate_read("poll")
     return t
 
 
-def deliver_votes_sim(num_transactions):
+def deliver_votes_stream(num_transactions, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as deliver_votes_sim.
+    """
     for _ in range(num_transactions):
-        t = deliver_votes()
+        yield deliver_votes(new_transaction=new_transaction)
+
+
+def deliver_votes_sim(num_transactions):
+    for t in deliver_votes_stream(num_transactions):
         print(t)
 
 
 ### Transaction 5 ###
-def process_status():
+def process_status(new_transaction=Transaction):
     """
     Purpose: Update activity with new status
     Source code: https://github.com/mastodon/mastodon/blob/main/app/lib/activitypub/activity/create.rb#L42C3-L69C6
@@ -276,12 +318,20 @@ def process_status():
     TRANSACTION COMMIT
     # Miscellaneous processing
     """
-    t = Transaction()
+    t = new_transaction()
     new_status = np.random.choice(1000)
     t.append_write(f"status({new_status})")
     return t
 
 
+def process_status_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as process_status_sim.
+    """
+    for _ in range(num_transactions):
+        yield process_status(new_transaction=new_transaction)
+
+
 def process_status_sim(num_transactions: int):
     """
     Example output:
@@ -292,13 +342,12 @@ def process_status_sim(num_transactions: int):
     ['w-status(805)']
     ['w-status(315)']
     """
-    for _ in range(num_transactions):
-        t = process_status()
+    for t in process_status_stream(num_transactions):
         print(t)
 
 
 ### Transaction 5.5 ###
-def find_existing_status():
+def find_existing_status(new_transaction=Transaction):
     """
     Find status that was inserted using Transaction 5. This is the read associated with Transaction 5.
     Source code: https://github.com/mastodon/mastodon/blob/main/app/lib/activitypub/activity/create.rb#L79C1-L83C6
@@ -307,20 +356,27 @@ def find_existing_status():
     In: status, status_id
     SELECT * FROM status WHERE id=status_id
     """
-    t = Transaction()
+    t = new_transaction()
     new_status = np.random.choice(1000)
     t.append_write(f"status({new_status})")
     return t
 
 
-def find_existing_status_sim(num_transactions: int):
+def find_existing_status_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as find_existing_status_sim.
+    """
     for _ in range(num_transactions):
-        t = find_existing_status()
+        yield find_existing_status(new_transaction=new_transaction)
+
+
+def find_existing_status_sim(num_transactions: int):
+    for t in find_existing_status_stream(num_transactions):
         print(t)
 
 
 ### Transaction 6 ###
-def process_emoji(tag):
+def process_emoji(tag, new_transaction=Transaction):
     """
     Purpose: Process emoji
     Source code: https://github.com/mastodon/mastodon/blob/main/app/lib/activitypub/activity/create.rb#L254C1-L272C6
@@ -335,13 +391,21 @@ def process_emoji(tag):
     TRANSACTION COMMIT
     """
     emoji = np.random.choice(1000)
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"emoji{emoji}")
     if np.random.choice(2):
         t.append_write(f"emoji({emoji})")
     return t
 
 
+def process_emoji_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as process_emoji_sim.
+    """
+    for _ in range(num_transactions):
+        yield process_emoji(None, new_transaction=new_transaction)
+
+
 def process_emoji_sim(num_transactions: int):
     """
     Example output:
@@ -352,13 +416,12 @@ def process_emoji_sim(num_transactions: int):
     ['r-emoji127', 'w-emoji(127)']
     ['r-emoji551', 'w-emoji(551)']
     """
-    for _ in range(num_transactions):
-        t = process_emoji(None)
+    for t in process_emoji_stream(num_transactions):
         print(t)
 
 
 ### Transaction 7 ###
-def create_backup():
+def create_backup(new_transaction=Transaction):
     """
     Purpose: Create a backup
     Source code: https://github.com/mastodon/mastodon/blob/main/app/controllers/settings/exports_controller.rb#L16C1-L27C6
@@ -370,12 +433,20 @@ def create_backup():
     INSERT INTO backups VALUES backup
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     backup_id = np.random.choice(1000)
     t.append_write(f"backup({backup_id})")
     return t
 
 
+def create_backup_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as create_backup_sim.
+    """
+    for _ in range(num_transactions):
+        yield create_backup(new_transaction=new_transaction)
+
+
 def create_backup_sim(num_transactions: int):
     """
     Example output:
@@ -386,13 +457,12 @@ def create_backup_sim(num_transactions: int):
     ['w-backup(261)']
     ['w-backup(101)']
     """
-    for _ in range(num_transactions):
-        t = create_backup()
+    for t in create_backup_stream(num_transactions):
         print(t)
 
 
 ### Transaction 8 ###
-def show_media_attachment(id):
+def show_media_attachment(id, new_transaction=Transaction):
     """
     Purpose: Show the media attachment with the given ID.
     Source code: https://github.com/mastodon/mastodon/blob/main/app/controllers/media_proxy_controller.rb#L18C3-L34C6
@@ -412,7 +482,7 @@ def show_media_attachment(id):
     lock_release(media_attachments)
     return
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"media_attachments({id})")
     needs_redownload = np.random.binomial(1, 0.2)
     if needs_redownload:
@@ -420,6 +490,14 @@ def show_media_attachment(id):
     return t
 
 
+def show_media_attachment_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as show_media_attachment_sim.
+    """
+    for _ in range(num_transactions):
+        yield show_media_attachment(np.random.choice(1000), new_transaction=new_transaction)
+
+
 def show_media_attachment_sim(num_transactions: int):
     """
     Example output:
@@ -430,13 +508,12 @@ def show_media_attachment_sim(num_transactions: int):
     ['r-media_attachments(231)']
     ['r-media_attachments(611)']
     """
-    for _ in range(num_transactions):
-        t = show_media_attachment(np.random.choice(1000))
+    for t in show_media_attachment_stream(num_transactions):
         print(t)
 
 
 ### Transaction 9 ###
-def create_marker(request):
+def create_marker(request, new_transaction=Transaction):
     """
     Purpose: Create a marker
     Source code: https://github.com/mastodon/mastodon/blob/main/app/controllers/api/v1/markers_controller.rb#L17C2-L31C1
@@ -449,7 +526,7 @@ def create_marker(request):
         UPDATE markers SET marker = marker WHERE timeline = timeline
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     for _ in range(request):
         marker = np.random.choice(1000)
         t.append_read(f"markers({marker})")
@@ -457,6 +534,14 @@ def create_marker(request):
     return t
 
 
+def create_marker_stream(num_transactions: int, new_transaction=Transaction):
+    """
+    Yield num_transactions transactions sampled the same way as create_marker_sim.
+    """
+    for _ in range(num_transactions):
+        yield create_marker(round(np.random.normal(2, 0.75)), new_transaction=new_transaction)
+
+
 def create_marker_sim(num_transactions: int):
     """
     Example output:
@@ -467,8 +552,7 @@ def create_marker_sim(num_transactions: int):
     ['r-markers(174)', 'w-markers(174)']
     ['r-markers(924)', 'w-markers(924)', 'r-markers(344)', 'w-markers(344)']
     """
-    for _ in range(num_transactions):
-        t = create_marker(round(np.random.normal(2, 0.75)))
+    for t in create_marker_stream(num_transactions):
         print(t)
 
 
@@ -0,0 +1,388 @@
+"""
+Deterministic partitioned simulation of a Calvin-style database, run on
+several worker processes.
+
+The key space is split into partitions by a sharding.Placement, and each
+partition has its own lock table and a pool of executors. As in Calvin
+(Thomson et al.), a sequencer fixes the order of all transactions up
+front: transaction i arrives with the epoch i // batch, and every
+partition grants its locks strictly in that order, so the run needs no
+deadlock detection and never aborts. A transaction's part on a partition
+starts once its locks there are granted and an executor is free, then:
+
+    single-partition   runs its reads and writes and commits locally
+    multi-partition    runs its local reads, and the participants exchange
+                       them (one network hop); each then runs its writes
+                       and commits, releasing its own locks, with no
+                       two-phase commit
+
+Because lock grants depend only on the order, every time in the run is a
+function of the transactions on the same partitions before it, not of
+any wall-clock interleaving. simulate() exploits that: the partitions are
+dealt out to worker processes, a process only executes the parts on its
+own partitions, and the only communication is the exchange of a
+multi-partition transaction whose participants live in different
+processes, through a shared-memory array. Every process computes the
+same times a single process would, so the run with one process is the
+sequential run of the same engine and the latencies are identical for
+any number of processes. A process only sets up the transactions it
+has a part in, and blocks only at the exchanges of the transactions
+spanning processes (the spanning column), so simulation throughput can
+grow with the processes as long as those are few.
+
+The example output comes from a machine with a single CPU, where the
+worker processes take turns and cannot show a speedup; the speedup on
+more CPUs has not been measured. The CPU seconds of the busiest process
+(max cpu s) bound how fast the run could go with a CPU per process.
+
+### EXAMPLE OUTPUT ###
+
+Simulating 100000 Saleor and Spree transactions on 16 partitions, 1 CPUs
+hash placement: 88.8% multi-partition transactions
+processes    seconds    txn/s  identical  spanning max cpu s  p50(us)  p99(us)
+1               1.31    76114  True           0.0%      1.30     2719    71679
+2               3.08    32491  True          73.1%      1.49     2719    71679
+4               6.52    15349  True          83.5%      1.61     2719    71679
+
+fennel placement: 41.3% multi-partition transactions
+processes    seconds    txn/s  identical  spanning max cpu s  p50(us)  p99(us)
+1               0.96   103967  True           0.0%      0.95     1711   123903
+2               1.91    52311  True          33.1%      0.95     1711   123903
+4               3.25    30751  True          35.7%      0.80     1711   123903
+"""
+
+import heapq
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import workloads
+from encoding import KeyEncoder, key_id
+from latency import CostModel, LatencyHistogram, LatencyReport
+from sharding import CoAccessGraph, Placement, fennel
+from transaction import Transaction
+
+class SequencedWorkload:
+    """
+    Transactions in sequence order, split into parts, one per partition
+    they touch. Parts are sorted by (transaction, partition); part j has
+    read and write service times reads[j] and writes[j], and takes the
+    locks locks[lock_offsets[j]:lock_offsets[j + 1]] (dense key indexes,
+    exclusive[...] telling write locks).
+
+    Example usage:
+    >>> placement = Placement(2, np.array([key_id("cart(1)"), key_id("order(1)")], dtype=np.uint64), np.array([0, 1]))
+    >>> a, b = Transaction(), Transaction()
+    >>> a.append_read("cart(1)")
+    >>> a.append_write("order(1)")
+    >>> b.append_write("cart(1)")
+    >>> sequenced = SequencedWorkload.build([("a", a), ("b", b)], placement)
+    >>> sequenced.part_txn.tolist(), sequenced.part_partition.tolist()
+    ([0, 0, 1], [0, 1, 0])
+    >>> sequenced.reads.tolist(), sequenced.writes.tolist(), sequenced.exclusive.tolist()
+    ([100, 0, 0], [0, 200, 200], [False, True, True])
+    """
+    def __init__(self, names: list[str], labels: np.ndarray, num_partitions: int, part_txn: np.ndarray,
+                 part_partition: np.ndarray, reads: np.ndarray, writes: np.ndarray, lock_offsets: np.ndarray,
+                 locks: np.ndarray, exclusive: np.ndarray, num_keys: int, commit: int):
+        self.names = names
+        self.labels = labels
+        self.num_partitions = num_partitions
+        self.part_txn = part_txn
+        self.part_partition = part_partition
+        self.reads = reads
+        self.writes = writes
+        self.lock_offsets = lock_offsets
+        self.locks = locks
+        self.exclusive = exclusive
+        self.num_keys = num_keys
+        self.commit = commit
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @classmethod
+    def build(cls, transactions: list[tuple[str, Transaction]], placement: Placement,
+              cost_model: CostModel = None) -> "SequencedWorkload":
+        """
+        Sequence (workload name, Transaction) pairs in the given order.
+        The rows of a bulk operation are planned, and partitioned, one by
+        one (see CostModel.plan).
+        """
+        cost_model = cost_model or CostModel()
+        names = sorted({name for name, _ in transactions})
+        index = {name: i for i, name in enumerate(names)}
+        keys = {}
+        op_txn, op_key, op_exclusive, op_cost, op_write = [], [], [], [], []
+        for i, (_, t) in enumerate(transactions):
+            trace = t.get_trace()
+            kinds = [op[0] for op in trace for _ in t.rows(op[2:])]
+            for kind, (key, exclusive, cost) in zip(kinds, cost_model.plan(trace, t.rows)):
+                op_txn.append(i)
+                op_key.append(keys.setdefault(key, len(keys)))
+                op_exclusive.append(exclusive)
+                op_cost.append(cost)
+                op_write.append(kind == "w")
+        labels = np.array([index[name] for name, _ in transactions], dtype=np.int32)
+        op_txn, op_key = np.array(op_txn, dtype=np.int64), np.array(op_key, dtype=np.int64)
+        op_exclusive, op_write = np.array(op_exclusive, dtype=bool), np.array(op_write, dtype=bool)
+        op_cost = np.array(op_cost, dtype=np.int64)
+        ids = np.fromiter((key_id(key) for key in keys), dtype=np.uint64, count=len(keys))
+        num_partitions = placement.num_shards
+        op_partition = placement.shard(ids)[op_key] if len(op_key) else op_key
+
+        # One part per (transaction, partition)
+        parts, op_part = np.unique(op_txn * num_partitions + op_partition, return_inverse=True)
+        reads = np.bincount(op_part, op_cost * ~op_write, minlength=len(parts)).astype(np.int64)
+        writes = np.bincount(op_part, op_cost * op_write, minlength=len(parts)).astype(np.int64)
+
+        # One lock per (part, key), exclusive if any of its ops is
+        codes, lock_of = np.unique(op_part * len(keys) + op_key, return_inverse=True)
+        exclusive = np.zeros(len(codes), dtype=bool)
+        np.logical_or.at(exclusive, lock_of, op_exclusive)
+        lock_offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes // len(keys), minlength=len(parts)), out=lock_offsets[1:])
+        return cls(names, labels, num_partitions, parts // num_partitions, parts % num_partitions, reads, writes,
+                   lock_offsets, codes % len(keys), exclusive, len(keys), cost_model.commit)
+
+
+#######################
+####     Engine    ####
+#######################
+
+def _ranges(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """
+    The concatenation of range(start, stop) for each pair.
+
+    >>> _ranges(np.array([2, 7]), np.array([4, 10])).tolist()
+    [2, 3, 7, 8, 9]
+    """
+    lengths = stops - starts
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+def execute(sequenced: SequencedWorkload, latencies: np.ndarray, processes: int = 1, process: int = 0,
+            partials: np.ndarray = None, executors: int = 4, network: int = 200, epoch: int = 10000,
+            batch: int = 20, abort=None, exchanged=None):
+    """
+    Run the parts on the partitions p with p % processes == process, in
+    sequence order, writing the latency of every transaction this
+    process coordinates (it holds the transaction's first partition) to
+    latencies. partials[i, process] carries this process's share of the
+    exchange of transaction i to the others; entries are -1 until set,
+    and the condition exchanged is notified after each one is. A waiting
+    process gives up once another sets the shared flag abort.
+    """
+    part_txn = sequenced.part_txn
+    part_partition = sequenced.part_partition
+    mine = np.flatnonzero(part_partition % processes == process)
+    # Only the transactions with a part here: all of their parts, the processes
+    # taking part in each, and its slowest write phase
+    txn_of = part_txn[mine]
+    new_txn = np.r_[True, txn_of[1:] != txn_of[:-1]] if len(mine) else np.zeros(0, dtype=bool)
+    own_txns = txn_of[new_txn]
+    first_part = np.searchsorted(part_txn, own_txns)
+    num_parts = np.searchsorted(part_txn, own_txns, side="right") - first_part
+    parts = _ranges(first_part, first_part + num_parts)
+    bounds = np.cumsum(num_parts) - num_parts
+    owner = part_partition[parts] % processes
+    involved = np.bitwise_or.reduceat(np.left_shift(1, owner), bounds) if len(bounds) else bounds
+    num_involved = np.bitwise_count(involved)
+    write_phase = np.maximum.reduceat(sequenced.writes[parts], bounds) if len(bounds) else bounds
+    coordinator = owner[bounds]
+
+    txns = txn_of.tolist()
+    groups = (np.cumsum(new_txn) - 1).tolist()
+    partitions = part_partition[mine].tolist()
+    reads, writes = sequenced.reads[mine].tolist(), sequenced.writes[mine].tolist()
+    # Locks of the parts here, their keys renumbered densely
+    lock_stop = np.cumsum(sequenced.lock_offsets[mine + 1] - sequenced.lock_offsets[mine])
+    lock_start = lock_stop - (sequenced.lock_offsets[mine + 1] - sequenced.lock_offsets[mine])
+    own_locks = _ranges(sequenced.lock_offsets[mine], sequenced.lock_offsets[mine + 1])
+    keys, locks = np.unique(sequenced.locks[own_locks], return_inverse=True)
+    locks, exclusive = locks.tolist(), sequenced.exclusive[own_locks].tolist()
+    lock_start, lock_stop = lock_start.tolist(), lock_stop.tolist()
+    num_parts, num_involved = num_parts.tolist(), num_involved.tolist()
+    write_phase, coordinator = write_phase.tolist(), coordinator.tolist()
+    commit = sequenced.commit
+
+    write_free = [0] * len(keys)      # when the last write lock on a key is released
+    read_free = [0] * len(keys)       # ... and the read locks granted after it
+    free = [[0] * executors for _ in range(sequenced.num_partitions)]
+
+    j = 0
+    while j < len(txns):
+        txn = txns[j]
+        g = groups[j]
+        arrival = (txn // batch + 1) * epoch
+        first = j
+        exchange = 0
+        begun = []
+        while j < len(txns) and txns[j] == txn:
+            ready = arrival
+            for lock in range(lock_start[j], lock_stop[j]):
+                key = locks[lock]
+                ready = max(ready, write_free[key], read_free[key]) if exclusive[lock] else max(ready, write_free[key])
+            start = max(ready, heapq.heappop(free[partitions[j]]))
+            begun.append(start)
+            exchange = max(exchange, start + reads[j])
+            j += 1
+
+        if num_parts[g] == 1:
+            finish = begun[0] + reads[first] + writes[first] + commit
+            done = [finish]
+        else:
+            if num_involved[g] > 1:
+                row = partials[txn]
+                row[process] = exchange
+                # Releasing the lock publishes the share before the others look
+                with exchanged:
+                    exchanged.notify_all()
+                    while np.count_nonzero(row >= 0) < num_involved[g]:
+                        if abort is not None and abort.value:
+                            raise RuntimeError(f"transaction {txn}: another worker process failed")
+                        exchanged.wait(0.1)
+                exchange = int(row.max())
+            exchange += network
+            finish = exchange + write_phase[g] + commit
+            done = [exchange + writes[part] + commit for part in range(first, j)]
+
+        for part, end in zip(range(first, j), done):
+            heapq.heappush(free[partitions[part]], end)
+            for lock in range(lock_start[part], lock_stop[part]):
+                key = locks[lock]
+                if exclusive[lock]:
+                    write_free[key] = read_free[key] = end
+                elif end > read_free[key]:
+                    read_free[key] = end
+        if coordinator[g] == process:
+            latencies[txn] = finish - arrival
+
+def _execute_shared(sequenced: SequencedWorkload, names: tuple[str, str], processes: int, process: int, abort,
+                    exchanged, cpu_seconds, options: dict):
+    latency_shm, partial_shm = (shared_memory.SharedMemory(name=name) for name in names)
+    latencies = np.ndarray(len(sequenced), dtype=np.int64, buffer=latency_shm.buf)
+    partials = np.ndarray((len(sequenced), processes), dtype=np.int64, buffer=partial_shm.buf)
+    try:
+        start = time.process_time()
+        execute(sequenced, latencies, processes, process, partials, abort=abort, exchanged=exchanged, **options)
+        cpu_seconds[process] = time.process_time() - start
+    except BaseException:
+        # Release the other processes before exiting with an error
+        abort.value = 1
+        raise
+    finally:
+        del latencies, partials
+        latency_shm.close()
+        partial_shm.close()
+
+def simulate(sequenced: SequencedWorkload, processes: int = 1, **options) -> tuple[np.ndarray, list[float]]:
+    """
+    Run the engine on processes worker processes (in this process if 1)
+    and return the latency of every transaction, and the CPU seconds
+    each process spent in execute(). options are passed on to
+    execute(). Raises RuntimeError if a worker process fails.
+    """
+    if processes == 1:
+        latencies = np.zeros(len(sequenced), dtype=np.int64)
+        start = time.process_time()
+        execute(sequenced, latencies, **options)
+        return latencies, [time.process_time() - start]
+    latency_shm = shared_memory.SharedMemory(create=True, size=8 * max(len(sequenced), 1))
+    partial_shm = shared_memory.SharedMemory(create=True, size=8 * max(len(sequenced), 1) * processes)
+    latencies = np.ndarray(len(sequenced), dtype=np.int64, buffer=latency_shm.buf)
+    partials = np.ndarray((len(sequenced), processes), dtype=np.int64, buffer=partial_shm.buf)
+    partials[:] = -1
+    abort = multiprocessing.RawValue("b", 0)
+    exchanged = multiprocessing.Condition()
+    cpu_seconds = multiprocessing.RawArray("d", processes)
+    workers = [multiprocessing.Process(target=_execute_shared,
+                                       args=(sequenced, (latency_shm.name, partial_shm.name), processes, process,
+                                             abort, exchanged, cpu_seconds, options))
+               for process in range(processes)]
+    try:
+        for worker in workers:
+            worker.start()
+        running = workers
+        while running:
+            multiprocessing.connection.wait([worker.sentinel for worker in running])
+            # A process that died without setting the flag would leave the others waiting on its exchanges
+            if any(worker.exitcode for worker in workers):
+                abort.value = 1
+            running = [worker for worker in running if worker.exitcode is None]
+        failed = [(process, worker.exitcode) for process, worker in enumerate(workers) if worker.exitcode]
+        if failed:
+            raise RuntimeError("worker processes failed: " +
+                               ", ".join(f"{process} exited with code {code}" for process, code in failed))
+        return latencies.copy(), list(cpu_seconds)
+    finally:
+        abort.value = 1
+        for worker in workers:
+            if worker.pid is not None:
+                worker.join()
+        del latencies, partials
+        for shm in (latency_shm, partial_shm):
+            shm.close()
+            shm.unlink()
+
+def report(sequenced: SequencedWorkload, latencies: np.ndarray, epoch: int = 10000, batch: int = 20) -> LatencyReport:
+    """
+    Per-workload latency histograms of a run; the makespan ends at the
+    last commit.
+    """
+    histograms = {}
+    for i, name in enumerate(sequenced.names):
+        histograms[name] = LatencyHistogram()
+        histograms[name].record_many(latencies[sequenced.labels == i])
+    arrivals = (np.arange(len(latencies)) // batch + 1) * epoch
+    return LatencyReport(histograms, int((arrivals + latencies).max(initial=0)), 0)
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def main():
+    """
+    Simulate a Saleor and Spree mix on 16 partitions with 1, 2 and 4
+    worker processes, under a hash and a co-access placement.
+    """
+    num_txn = 100000
+    num_partitions = 16
+    names = workloads.resolve(["saleor", "spree"])
+    np.random.seed(0)
+    transactions = list(workloads.mix(names, num_txn))
+
+    # Extra space for formatting
+    print()
+    print(f"Simulating {num_txn} Saleor and Spree transactions on {num_partitions} partitions, "
+          f"{os.cpu_count()} CPUs")
+    encoder = KeyEncoder()
+    rows = [encoder.encode_rows(t) for _, t in transactions]
+    graph = CoAccessGraph.build(np.concatenate(rows), np.cumsum([0] + [len(ops) for ops in rows]))
+    for label, placement in (("hash", Placement(num_partitions)), ("fennel", fennel(graph, num_partitions))):
+        sequenced = SequencedWorkload.build(transactions, placement)
+        distributed = np.mean(np.bincount(sequenced.part_txn, minlength=len(sequenced)) > 1)
+        print(f"{label} placement: {distributed:.1%} multi-partition transactions")
+        print(f"{'processes':<11}{'seconds':>9}{'txn/s':>9}  {'identical':<10}"
+              f"{'spanning':>9}{'max cpu s':>10}{'p50(us)':>9}{'p99(us)':>9}")
+        sequential = None
+        for processes in (1, 2, 4):
+            start = time.perf_counter()
+            latencies, cpu_seconds = simulate(sequenced, processes)
+            elapsed = time.perf_counter() - start
+            if sequential is None:
+                sequential = latencies
+            # Transactions whose parts live in more than one process, each an exchange to wait on
+            spanning = np.unique(sequenced.part_txn * processes + sequenced.part_partition % processes) // processes
+            spanning = np.mean(np.bincount(spanning, minlength=len(sequenced)) > 1)
+            result = report(sequenced, latencies).overall()
+            print(f"{processes:<11}{elapsed:>9.2f}{num_txn / elapsed:>9.0f}  {str(np.array_equal(latencies, sequential)):<10}"
+                  f"{spanning:>9.1%}{max(cpu_seconds):>10.2f}{result.value_at_percentile(50):>9}"
+                  f"{result.value_at_percentile(99):>9}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Phantom detection with an interval index over predicate reads.
+
+A predicate read (Transaction.append_predicate_read) selects the rows of
+a table by a condition on one integer attribute, e.g. SELECT * FROM
+Product WHERE category_id IN (...). A row inserted by a concurrent
+transaction that satisfies the condition is a phantom: the reader's
+result depends on whether it ran before or after the insert, although
+the two transactions share no key.
+
+PredicateIndex keeps the outstanding predicates of running transactions,
+one IntervalTree per (table, attribute), so an insert finds every
+predicate it matches in O(log n + matches) instead of testing each one.
+PhantomDetector streams a workload through it, treating every
+transaction as concurrent with the window - 1 transactions before it.
+
+### EXAMPLE OUTPUT ###
+
+Checking 100000 transactions, 1000 concurrent
+reader                          writer                          phantoms
+mastodon.deliver_votes          mastodon.call                     993714
+spree.fulfillment_changer       spree.fulfillment_changer         141706
+interval index:  2.02s
+linear scan:    19.30s (same count: True)
+"""
+
+import collections
+import random
+import time
+from transaction import Predicate, Transaction
+import workloads
+
+class _Node:
+    __slots__ = ("key", "value", "priority", "left", "right", "max_stop")
+
+    def __init__(self, key: tuple, value, priority: float):
+        self.key = key              # (start, stop, sequence number)
+        self.value = value
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.max_stop = key[1]
+
+def _update(node: _Node):
+    node.max_stop = node.key[1]
+    if node.left is not None and node.left.max_stop > node.max_stop:
+        node.max_stop = node.left.max_stop
+    if node.right is not None and node.right.max_stop > node.max_stop:
+        node.max_stop = node.right.max_stop
+
+def _insert(node: _Node, new: _Node) -> _Node:
+    if node is None:
+        return new
+    if new.key < node.key:
+        node.left = _insert(node.left, new)
+        if node.left.priority > node.priority:
+            top = node.left
+            node.left = top.right
+            _update(node)
+            top.right = node
+            node = top
+    else:
+        node.right = _insert(node.right, new)
+        if node.right.priority > node.priority:
+            top = node.right
+            node.right = top.left
+            _update(node)
+            top.left = node
+            node = top
+    _update(node)
+    return node
+
+def _merge(left: _Node, right: _Node) -> _Node:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+def _delete(node: _Node, key: tuple) -> _Node:
+    if node is None:
+        raise KeyError(key)
+    if key == node.key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _delete(node.left, key)
+    else:
+        node.right = _delete(node.right, key)
+    _update(node)
+    return node
+
+class IntervalTree:
+    """
+    Dynamic set of half-open integer intervals with values, as a treap
+    ordered by start and augmented with the largest stop of each subtree.
+    add() and remove() take O(log n) expected time, stab() O(log n + k)
+    for k results.
+
+    Example usage:
+    >>> tree = IntervalTree()
+    >>> a = tree.add(0, 10, "a")
+    >>> b = tree.add(5, 6, "b")
+    >>> c = tree.add(8, 20, "c")
+    >>> sorted(tree.stab(5)), sorted(tree.stab(9)), tree.stab(20)
+    (['a', 'b'], ['a', 'c'], [])
+    >>> tree.remove(a)
+    >>> sorted(tree.stab(9)), len(tree)
+    (['c'], 2)
+    """
+    def __init__(self, seed: int = 0):
+        self.root = None
+        self.size = 0
+        self.sequence = 0
+        self.random = random.Random(seed)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, start: int, stop: int, value) -> tuple:
+        """
+        Insert [start, stop) with value. Returns a handle for remove().
+        """
+        key = (start, stop, self.sequence)
+        self.sequence += 1
+        self.root = _insert(self.root, _Node(key, value, self.random.random()))
+        self.size += 1
+        return key
+
+    def remove(self, handle: tuple):
+        self.root = _delete(self.root, handle)
+        self.size -= 1
+
+    def stab(self, point: int) -> list:
+        """
+        Values of all intervals containing point.
+        """
+        result = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_stop <= point:
+                continue
+            stack.append(node.left)
+            start, stop, _ = node.key
+            if start <= point:
+                if point < stop:
+                    result.append(node.value)
+                stack.append(node.right)
+        return result
+
+class PredicateIndex:
+    """
+    Outstanding predicate reads, indexed for matching inserted rows.
+    Predicates without an attribute (every row of a table) are kept in a
+    plain per-table dict, since every insert into the table matches them.
+
+    Example usage:
+    >>> index = PredicateIndex()
+    >>> index.add(Predicate("product", "category_id", values=[3, 7]), "t1")
+    >>> index.add(Predicate("product", "category_id", start=5, stop=9), "t2")
+    >>> index.add(Predicate("product"), "t3")
+    >>> sorted(owner for owner, _ in index.matching("product", {"category_id": 7}))
+    ['t1', 't2', 't3']
+    >>> index.discard("t2")
+    >>> sorted(owner for owner, _ in index.matching("product", {"category_id": 8}))
+    ['t3']
+    """
+    def __init__(self):
+        self.trees = {}         # (table, attribute) -> IntervalTree of (owner, predicate)
+        self.tables = {}        # table -> {owner: [predicate]} for whole-table predicates
+        self.handles = {}       # owner -> [(tree or None, handle)]
+
+    def add(self, predicate: Predicate, owner):
+        handles = self.handles.setdefault(owner, [])
+        if predicate.attribute is None:
+            self.tables.setdefault(predicate.table, {}).setdefault(owner, []).append(predicate)
+            handles.append((None, predicate.table))
+            return
+        tree = self.trees.get((predicate.table, predicate.attribute))
+        if tree is None:
+            tree = self.trees[predicate.table, predicate.attribute] = IntervalTree()
+        for start, stop in predicate.intervals:
+            handles.append((tree, tree.add(start, stop, (owner, predicate))))
+
+    def discard(self, owner):
+        """
+        Remove every predicate of owner, e.g. when it commits.
+        """
+        for tree, handle in self.handles.pop(owner, ()):
+            if tree is None:
+                self.tables[handle].pop(owner, None)
+            else:
+                tree.remove(handle)
+
+    def matching(self, table: str, row: dict) -> list:
+        """
+        (owner, predicate) of every outstanding predicate the row matches.
+        A predicate with several intervals matches a row at most once.
+        """
+        result = [(owner, predicate) for owner, predicates in self.tables.get(table, {}).items()
+                  for predicate in predicates]
+        for attribute, value in row.items():
+            tree = self.trees.get((table, attribute))
+            if tree is not None and not isinstance(value, str):
+                result.extend(tree.stab(value))
+        return result
+
+class PhantomDetector:
+    """
+    Streams transactions through a PredicateIndex. Each transaction runs
+    concurrently with the window - 1 transactions before it; its inserts
+    are checked against their predicates, then its own predicates become
+    outstanding until window more transactions have started.
+    """
+    def __init__(self, window: int = 64):
+        self.window = window
+        self.index = PredicateIndex()
+        self.names = {}
+        self.count = 0
+        self.phantoms = {}      # (reader name, writer name) -> count
+
+    def process(self, name: str, t: Transaction) -> list[tuple]:
+        """
+        Add one transaction. Returns (reader number, predicate, inserted
+        row) for every phantom its inserts create.
+        """
+        finished = self.count - self.window
+        if finished >= 0:
+            self.index.discard(finished)
+            self.names.pop(finished, None)
+        found = []
+        for table, row in t.inserts:
+            for reader, predicate in self.index.matching(table, row):
+                found.append((reader, predicate, row))
+                pair = (self.names[reader], name)
+                self.phantoms[pair] = self.phantoms.get(pair, 0) + 1
+        if t.predicates:
+            self.names[self.count] = name
+            for predicate in t.predicates:
+                self.index.add(predicate, self.count)
+        self.count += 1
+        return found
+
+    def __str__(self):
+        lines = [f"{'reader':<32}{'writer':<32}{'phantoms':>8}"]
+        for (reader, writer), count in sorted(self.phantoms.items(), key=lambda item: -item[1]):
+            lines.append(f"{reader:<32}{writer:<32}{count:>8}")
+        return "\n".join(lines)
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def _linear_scan(transactions: list, window: int) -> int:
+    """
+    Count phantoms by testing every outstanding predicate, for comparison.
+    """
+    outstanding = collections.deque()
+    count = 0
+    for i, (_, t) in enumerate(transactions):
+        while outstanding and outstanding[0][0] <= i - window:
+            outstanding.popleft()
+        for table, row in t.inserts:
+            count += sum(predicate.matches(table, row) for _, predicate in outstanding)
+        outstanding.extend((i, predicate) for predicate in t.predicates)
+    return count
+
+def main():
+    """
+    Detect phantoms in a mix of the workloads with predicate reads and
+    the ones inserting into the same tables.
+    """
+    import numpy as np
+    names = ["saleor.delete_categories", "spree.fulfillment_changer", "mastodon.call", "mastodon.deliver_votes"]
+    # Every vote is a phantom for every concurrent whole-poll read; keep those rare
+    weights = [0.33, 0.33, 0.33, 0.01]
+    num_txn = 100000
+    window = 1000
+
+    for name in names:
+        workloads.get(name).module
+    np.random.seed(0)
+    transactions = list(workloads.mix(names, num_txn, weights))
+
+    detector = PhantomDetector(window)
+    start = time.perf_counter()
+    for name, t in transactions:
+        detector.process(name, t)
+    indexed = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = _linear_scan(transactions, window)
+    scanned = time.perf_counter() - start
+
+    # Extra space for formatting
+    print()
+    print(f"Checking {num_txn} transactions, {window} concurrent")
+    print(detector)
+    print(f"interval index: {indexed:5.2f}s")
+    print(f"linear scan:    {scanned:5.2f}s (same count: {expected == sum(detector.phantoms.values())})")
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Opt-in profiling hooks for the transaction generators.
+
+Nothing here runs unless a Profiler is enabled: enabling it swaps the
+Transaction.append_* methods (see OP_METHODS), the registered generator
+functions of the application modules and the sampling functions of the
+active np.random source (NumPy's or rng.PythonRandom) for counting
+wrappers, and disabling it puts the originals back, so the generators
+run unmodified when profiling is off.
+
+While enabled, every generator call records its wall time, the reads and
+writes it appends and the np.random calls it makes. Work done outside any
+generator (the argument sampling of the *_stream functions) is recorded
+under SAMPLING. With cprofile=True, each generator additionally gets its
+own cProfile.Profile that is only active during that generator's calls,
+so the pstats output is split per generator.
+
+Usage:
+    python profiling.py [workload or application ...] [--num-txn N]
+        [--profile DIR]
+
+### EXAMPLE OUTPUT ###
+
+generator                                         calls   ms/call    ops/txn  reads  writes    rng/txn
+scmsuite.internal_save_retail                      1000   0.00183       1.19   1000     186       0.00
+saleor.order_fulfill                               1000   0.02064      16.30   9746    6549       1.24
+...
+mastodon.create_marker                             1000   0.02604       3.93   1965    1965       1.97
+(sampling)                                            -         -          -      0       0       4.19
+"""
+
+import argparse
+import cProfile
+import functools
+import os
+import pstats
+import time
+import numpy as np
+import rng
+import transaction
+import workloads
+
+# np.random functions that are counted as RNG calls (the ones the active
+# source has)
+RNG_FUNCTIONS = ["binomial", "choice", "exponential", "normal", "poisson", "rand", "randint",
+                 "randn", "random", "random_sample", "shuffle", "permutation", "uniform", "zipf"]
+
+# Transaction methods that append one read or one write op (a bulk,
+# predicate or insert op counts once, as in the trace)
+OP_METHODS = {
+    "append_read": "reads", "append_read_many": "reads", "append_read_range": "reads",
+    "append_predicate_read": "reads",
+    "append_write": "writes", "append_write_many": "writes", "append_write_range": "writes",
+    "append_insert": "writes",
+}
+
+# Bucket for operations and RNG calls made outside of any generator
+SAMPLING = "(sampling)"
+
+
+class GeneratorStats:
+    """
+    Counters of one generator.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.nanoseconds = 0
+        self.reads = 0
+        self.writes = 0
+        self.rng_calls = 0
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class Profiler:
+    """
+    Patches the generators of the given workloads (all by default) with
+    counting wrappers while enabled.
+
+    Example usage:
+    >>> with Profiler(["broadleaf.get_next_id"]) as profiler:
+    ...     traces = list(workloads.stream("broadleaf.get_next_id", 10))
+    >>> stats = profiler.stats["broadleaf.get_next_id"]
+    >>> stats.calls, stats.reads + stats.writes == sum(len(t.trace) for t in traces)
+    (10, True)
+
+    RNG calls are counted on whichever source rng.np.random is when
+    enabled:
+    >>> rng.use_python_random(seed=1)
+    >>> with Profiler(["saleor.order_fulfill"]) as profiler:
+    ...     _ = list(workloads.stream("saleor.order_fulfill", 10))
+    >>> profiler.stats["saleor.order_fulfill"].rng_calls > 0
+    True
+    >>> rng.use_numpy_random()
+    """
+    def __init__(self, names: list[str] = None, cprofile: bool = False):
+        self.names = names or workloads.names()
+        self.cprofile = cprofile
+        self.stats = {name: GeneratorStats() for name in self.names}
+        self.stats[SAMPLING] = GeneratorStats()
+        self.profiles = {name: cProfile.Profile() for name in self.names} if cprofile else {}
+        self.stack = []         # names of the generators currently running, innermost last
+        self.patches = []       # (owner, attribute, original value)
+
+    def _patch(self, owner, attribute: str, replacement):
+        self.patches.append((owner, attribute, getattr(owner, attribute)))
+        setattr(owner, attribute, replacement)
+
+    def _current(self) -> GeneratorStats:
+        return self.stats[self.stack[-1] if self.stack else SAMPLING]
+
+    def _wrap_generator(self, name: str, generator):
+        stats = self.stats[name]
+        profile = self.profiles.get(name)
+
+        @functools.wraps(generator)
+        def wrapper(*args, **kwargs):
+            outer = self.profiles.get(self.stack[-1]) if self.stack else None
+            self.stack.append(name)
+            # Only one cProfile.Profile may be active at a time
+            if outer is not None:
+                outer.disable()
+            if profile is not None:
+                profile.enable()
+            start = time.perf_counter_ns()
+            try:
+                return generator(*args, **kwargs)
+            finally:
+                stats.nanoseconds += time.perf_counter_ns() - start
+                stats.calls += 1
+                if profile is not None:
+                    profile.disable()
+                if outer is not None:
+                    outer.enable()
+                self.stack.pop()
+        return wrapper
+
+    def _wrap_op(self, method, counter: str):
+        @functools.wraps(method)
+        def wrapper(t, *args, **kwargs):
+            stats = self._current()
+            setattr(stats, counter, getattr(stats, counter) + 1)
+            return method(t, *args, **kwargs)
+        return wrapper
+
+    def _wrap_rng(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            self._current().rng_calls += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    def enable(self):
+        if self.patches:
+            return
+        for method, counter in OP_METHODS.items():
+            self._patch(transaction.Transaction, method, self._wrap_op(getattr(transaction.Transaction, method), counter))
+        for name in self.names:
+            workload = workloads.get(name)
+            self._patch(workload.module, workload.generator_name, self._wrap_generator(name, workload.generator))
+        source = rng.np.random
+        for function in RNG_FUNCTIONS:
+            if hasattr(source, function):
+                self._patch(source, function, self._wrap_rng(getattr(source, function)))
+
+    def disable(self):
+        for owner, attribute, original in reversed(self.patches):
+            setattr(owner, attribute, original)
+        self.patches = []
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def dump(self, directory: str) -> list[str]:
+        """
+        Write one <workload>.pstats file per profiled generator that was
+        called, and return their paths.
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, profile in self.profiles.items():
+            if self.stats[name].calls:
+                path = os.path.join(directory, f"{name}.pstats")
+                profile.dump_stats(path)
+                paths.append(path)
+        return paths
+
+    def __str__(self):
+        lines = [f"{'generator':<48}{'calls':>7}{'ms/call':>10}{'ops/txn':>11}{'reads':>7}{'writes':>8}{'rng/txn':>11}"]
+        for name in self.names:
+            s = self.stats[name]
+            if not s.calls:
+                continue
+            lines.append(f"{name:<48}{s.calls:>7}{s.nanoseconds / s.calls / 1e6:>10.5f}"
+                         f"{(s.reads + s.writes) / s.calls:>11.2f}{s.reads:>7}{s.writes:>8}{s.rng_calls / s.calls:>11.2f}")
+        s = self.stats[SAMPLING]
+        total_calls = sum(self.stats[name].calls for name in self.names)
+        rng_per_txn = s.rng_calls / total_calls if total_calls else 0.0
+        lines.append(f"{SAMPLING:<48}{'-':>7}{'-':>10}{'-':>11}{s.reads:>7}{s.writes:>8}{rng_per_txn:>11.2f}")
+        return "\n".join(lines)
+
+
+#######################
+####   Simulation  ####
+#######################
+
+def main(argv: list[str] = None):
+    """
+    Profile num_txn transactions of each selected workload (all by
+    default), optionally writing per-generator pstats files.
+    """
+    parser = argparse.ArgumentParser(description="Count ops, time and RNG calls per generator.")
+    parser.add_argument("workloads", nargs="*", help="workload or application names (default: all)")
+    parser.add_argument("--num-txn", type=int, default=1000)
+    parser.add_argument("--profile", metavar="DIR", help="write cProfile output per generator to DIR")
+    args = parser.parse_args(argv)
+
+    names = workloads.resolve(args.workloads) if args.workloads else workloads.names()
+    with Profiler(names, cprofile=bool(args.profile)) as profiler:
+        for name in names:
+            for _ in workloads.stream(name, args.num_txn):
+                pass
+
+    # Extra space for formatting
+    print()
+    print(profiler)
+    if args.profile:
+        print()
+        for path in profiler.dump(args.profile):
+            print(f"wrote {path}")
+            pstats.Stats(path).sort_stats("cumulative").print_stats(3)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Lazily imported NumPy and a pure-Python fast path for small runs.
+
+The application modules import np from here instead of importing NumPy
+directly. np is a stand-in module object that only imports NumPy when one
+of its attributes is first used, so importing an application module (or
+resolving workloads by name) does not pay NumPy's import time.
+
+np.random is NumPy's global generator by default, so seeded runs produce
+exactly the same transactions as before. For short generation jobs,
+use_python_random() switches np.random to PythonRandom, which implements
+the subset of the np.random API the generators use on top of the standard
+random module and never imports NumPy. It produces transactions from the
+same distributions but a different random sequence than NumPy for the
+same seed.
+
+Example usage:
+>>> use_python_random(seed=1)
+>>> np.random.randint(1, 50), np.random.choice(["a", "b"], p=[0.2, 0.8])
+(9, 'b')
+>>> np.random.randint(1, 100, size=3).tolist()
+[98, 9, 33]
+>>> use_numpy_random()
+"""
+
+import importlib
+import itertools
+import math
+import random
+import sys
+import types
+
+
+class Sample(list):
+    """
+    Multiple values drawn at once (size=...). Supports the tolist() that
+    callers use on NumPy arrays.
+    """
+    def tolist(self) -> list:
+        return list(self)
+
+
+class PythonRandom:
+    """
+    The np.random functions used by the generators, backed by
+    random.Random. Scalars are plain Python numbers; size=n returns a
+    Sample of n values.
+    """
+    def __init__(self, seed: int = None):
+        self._random = random.Random(seed)
+
+    def seed(self, seed: int = None):
+        self._random.seed(seed)
+
+    def get_state(self):
+        return self._random.getstate()
+
+    def set_state(self, state):
+        self._random.setstate(state)
+
+    def _draw(self, draw, size):
+        if size is None:
+            return draw()
+        return Sample(draw() for _ in range(size))
+
+    def randint(self, low: int, high: int = None, size: int = None):
+        if high is None:
+            low, high = 0, low
+        return self._draw(lambda: self._random.randrange(low, high), size)
+
+    def choice(self, a, size: int = None, replace: bool = True, p: list[float] = None):
+        population = range(a) if isinstance(a, int) else a
+        if size is not None and not replace:
+            return Sample(self._random.sample(list(population), size))
+        if p is None:
+            return self._draw(lambda: population[self._random.randrange(len(population))], size)
+        cum_weights = list(itertools.accumulate(p))
+        return self._draw(lambda: self._random.choices(population, cum_weights=cum_weights)[0], size)
+
+    def binomial(self, n: int, p: float, size: int = None):
+        return self._draw(lambda: sum(self._random.random() < p for _ in range(n)), size)
+
+    def normal(self, loc: float = 0.0, scale: float = 1.0, size: int = None):
+        return self._draw(lambda: self._random.gauss(loc, scale), size)
+
+    def uniform(self, low: float = 0.0, high: float = 1.0, size: int = None):
+        return self._draw(lambda: self._random.uniform(low, high), size)
+
+    def exponential(self, scale: float = 1.0, size: int = None):
+        return self._draw(lambda: self._random.expovariate(1.0 / scale), size)
+
+    def poisson(self, lam: float = 1.0, size: int = None):
+        def draw():
+            # Knuth's method; lam is small for every caller
+            limit, k, product = math.exp(-lam), 0, self._random.random()
+            while product > limit:
+                k += 1
+                product *= self._random.random()
+            return k
+        return self._draw(draw, size)
+
+    def random(self, size: int = None):
+        return self._draw(self._random.random, size)
+
+    def rand(self, *shape):
+        return self._draw(self._random.random, shape[0] if shape else None)
+
+
+class LazyNumpy(types.ModuleType):
+    """
+    Module object that imports NumPy on first attribute access and then
+    caches every attribute it hands out.
+    """
+    def __getattr__(self, name: str):
+        numpy = importlib.import_module("numpy")
+        value = getattr(numpy, name)
+        setattr(self, name, value)
+        return value
+
+
+np = LazyNumpy("numpy")
+
+def use_python_random(seed: int = None):
+    """
+    Make np.random the pure-Python PythonRandom, seeded with seed.
+    """
+    np.random = PythonRandom(seed)
+
+def use_numpy_random(seed: int = None):
+    """
+    Make np.random NumPy's global generator again (importing NumPy), and
+    seed it if seed is given.
+    """
+    np.random = importlib.import_module("numpy").random
+    if seed is not None:
+        np.random.seed(seed)
+
+def numpy_loaded() -> bool:
+    """
+    Whether NumPy has been imported by this process.
+    """
+    return "numpy" in sys.modules
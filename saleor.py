@@ -5,91 +5,125 @@
 # Contextual note: select_for_update is used to lock rows until the end of the transaction. 
 # Django docs: https://docs.djangoproject.com/en/5.1/ref/models/querysets/#select-for-update 
 
-import numpy as np
+from rng import np
 import datetime
 from transaction import Transaction
 
-class Voucher: 
-    def __init__(self):
-        self.is_voucher_usage_increased: bool = np.random.binomial(1, 0.5)
-        self.usage_limit: int = int(np.random.normal(5, 1))
-        self.apply_once_per_customer: bool = np.random.binomial(1, 0.5)
-        self.single_use: bool = np.random.binomial(1, 0.5)
-        self.exists: bool = np.random.binomial(1, 0.5)
+class Voucher:
+    __slots__ = ("is_voucher_usage_increased", "usage_limit", "apply_once_per_customer", "single_use", "exists")
+
+    def __init__(self, state=None, voucher_id: int = None):
+        self.is_voucher_usage_increased: int = int(np.random.binomial(1, 0.5))
+        if state is not None:
+            self.usage_limit: int = state.voucher_usage_limit.get(voucher_id)
+        else:
+            self.usage_limit: int = int(np.random.normal(5, 1))
+        self.apply_once_per_customer: int = int(np.random.binomial(1, 0.5))
+        if state is not None:
+            self.single_use: int = state.voucher_single_use.get(voucher_id)
+        else:
+            self.single_use: int = int(np.random.binomial(1, 0.5))
+        self.exists: int = int(np.random.binomial(1, 0.5))
 
 class Code:
-    def __init__(self):
+    __slots__ = ("used", "is_active", "voucher_id")
+
+    def __init__(self, state=None, code: int = None):
+        if state is not None:
+            self.used: int = state.code_used.get(code)
+            self.is_active: int = state.code_is_active.get(code)
+            self.voucher_id: int = state.code_voucher_id.get(code)
+            return
         voucher_ids = list(range(100))
-        self.used: int = np.random.choice(range(10))
-        self.is_active: bool = np.random.binomial(1, 0.5)
-        self.voucher_id: int = np.random.choice(voucher_ids)
+        self.used: int = int(np.random.choice(range(10)))
+        self.is_active: int = int(np.random.binomial(1, 0.5))
+        self.voucher_id: int = int(np.random.choice(voucher_ids))
 
 class Payment:
+    __slots__ = ("pk", "id", "to_confirm", "is_active", "can_refund", "can_void", "order_id")
+
     def __init__(self):
-        self.pk: int = np.random.choice(range(100))
+        self.pk: int = int(np.random.choice(range(100)))
         self.id: int = self.pk
-        self.to_confirm: bool = np.random.binomial(1, 0.5)
-        self.is_active: bool = np.random.binomial(1, 0.8)
-        self.can_refund: bool = np.random.binomial(1, 0.5)
-        self.can_void: bool = np.random.binomial(1, 0.5)
-        self.order_id: int = np.random.choice(range(100))
-        
+        self.to_confirm: int = int(np.random.binomial(1, 0.5))
+        self.is_active: int = int(np.random.binomial(1, 0.8))
+        self.can_refund: int = int(np.random.binomial(1, 0.5))
+        self.can_void: int = int(np.random.binomial(1, 0.5))
+        self.order_id: int = int(np.random.choice(range(100)))
+
 class Checkout:
+    __slots__ = ("id", "is_voucher_usage_increased", "completing_started_at", "exists")
+
     def __init__(self):
-        self.id: int = np.random.choice(range(100))
-        self.is_voucher_usage_increased: bool = np.random.binomial(1, 0.5)
+        self.id: int = int(np.random.choice(range(100)))
+        self.is_voucher_usage_increased: int = int(np.random.binomial(1, 0.5))
         self.completing_started_at: datetime.datetime = np.random.choice([datetime.datetime.now(), None])
-        self.exists: bool = np.random.binomial(1, 0.9)
+        self.exists: int = int(np.random.binomial(1, 0.9))
 
 class StripePaymentObj:
+    __slots__ = ("payment_intent_id", "payment_active", "payment_order_exists", "payment_charge_status_pending",
+                 "checkout_exists", "payment_amount", "payment_currency")
+
     def __init__(self):
-        self.payment_intent_id: int = np.random.choice(range(100))
-        self.payment_active: bool = np.random.binomial(1, 0.5)
-        self.payment_order_exists: bool = np.random.binomial(1, 0.5)
-        self.payment_charge_status_pending: bool = np.random.binomial(1, 0.5)
-        self.checkout_exists: bool = np.random.binomial(1, 0.5)
-        self.payment_amount: int = np.random.choice(range(100))
-        self.payment_currency: str = np.random.choice(["USD", "EUR", "GBP"])
+        self.payment_intent_id: int = int(np.random.choice(range(100)))
+        self.payment_active: int = int(np.random.binomial(1, 0.5))
+        self.payment_order_exists: int = int(np.random.binomial(1, 0.5))
+        self.payment_charge_status_pending: int = int(np.random.binomial(1, 0.5))
+        self.checkout_exists: int = int(np.random.binomial(1, 0.5))
+        self.payment_amount: int = int(np.random.choice(range(100)))
+        self.payment_currency: str = str(np.random.choice(["USD", "EUR", "GBP"]))
 
 class Fulfillment:
+    __slots__ = ("lines", "warehouse")
+
     def __init__(self):
         num_lines = np.random.choice(range(1, 10))
         self.lines = [FulfillmentLine() for _ in range(num_lines)]
-        self.warehouse = np.random.choice(range(100))
+        self.warehouse = int(np.random.choice(range(100)))
 
 class FulfillmentLine:
+    __slots__ = ("order_line", "pk")
+
     def __init__(self):
         self.order_line = OrderLine()
-        self.pk = np.random.choice(range(100))
+        self.pk = int(np.random.choice(range(100)))
 
 class OrderLine:
+    __slots__ = ("variant", "track_inventory", "pk")
+
     def __init__(self):
-        self.variant: bool = np.random.binomial(1, 0.5)
-        self.track_inventory: bool = np.random.binomial(1, 0.5)
-        self.pk = np.random.choice(range(100))
+        self.variant: int = int(np.random.binomial(1, 0.5))
+        self.track_inventory: int = int(np.random.binomial(1, 0.5))
+        self.pk = int(np.random.choice(range(100)))
 
 class Order:
+    __slots__ = ("pk", "payment", "status", "exists")
+
     def __init__(self, order_pk: int):
-        self.pk: int = order_pk
+        self.pk: int = int(order_pk)
         self.payment: Payment = Payment()
         self.status: str = "pending"
-        self.exists: bool = np.random.binomial(1, 0.5)
+        self.exists: int = int(np.random.binomial(1, 0.5))
+
+class SaleorTransaction:
+    __slots__ = ("kind", "pk")
 
-class SaleorTransaction: 
     def __init__(self):
-        self.kind: str = np.random.choice(["ACTION_TO_CONFIRM", "CAPTURE", "REFUND", "VOID"])
-        self.pk: int = np.random.choice(range(100))
+        self.kind: str = str(np.random.choice(["ACTION_TO_CONFIRM", "CAPTURE", "REFUND", "VOID"]))
+        self.pk: int = int(np.random.choice(range(100)))
 
 class Site:
+    __slots__ = ("pk",)
+
     def __init__(self):
-        self.pk: int = np.random.choice(range(100))
+        self.pk: int = int(np.random.choice(range(100)))
 
 #################################
 ####   Simulator functions   ####
 #################################
 
 ### Transaction 1 (Transaction 1 from Tang et al.) ###
-def saleor_checkout_voucher_code_generator(voucher_code: int) -> list[str]:
+def saleor_checkout_voucher_code_generator(voucher_code: int, state=None, new_transaction=Transaction) -> list[str]:
     """
     Purpose: Coordinate concurrent checkout.
     saleor/checkout/complete_checkout.py#complete_checkout(with voucher code usage)
@@ -125,19 +159,24 @@ def saleor_checkout_voucher_code_generator(voucher_code: int) -> list[str]:
         from voucher_codes set is_active=False where code=checkout_info.voucher_code
 
     TRANSACTION COMMIT
+
+    If a DatabaseState is given, the code's usage, active flag and voucher
+    are read from it, an inactive code counts as not existing, a code
+    used up to its voucher's usage limit is rejected, and the usage
+    increment and deactivation are written back.
     """
-    t = Transaction()
+    t = new_transaction()
     with_lock = True
     
     if voucher_code is not None:
         # Get code using voucher_code
-        code = Code()
+        code = Code(state, voucher_code)
         t.append_read(f"voucher_id({code.voucher_id})")
-        if code.voucher_id == 0: # if the code DNE
+        if code.voucher_id == 0 or (state is not None and not code.is_active): # if the code DNE
             return t
 
         # Get voucher using code.voucher_id
-        voucher = Voucher()
+        voucher = Voucher(state, code.voucher_id)
 
         if voucher.is_voucher_usage_increased:
             voucher_invalid = np.random.binomial(1, 0.5) # Chance of voucher being invalid after fully being used (deactivated)
@@ -148,17 +187,34 @@ def saleor_checkout_voucher_code_generator(voucher_code: int) -> list[str]:
         
         if voucher.usage_limit > 0 and with_lock:
             t.append_read(f"voucher_id({code.voucher_id})")
+
+        # A fully used code fails validation (code.used >= voucher.usage_limit)
+        if state is not None and voucher.usage_limit and code.used >= voucher.usage_limit:
+            return t
         
     # Increase voucher usage
     if voucher.usage_limit:
         t.append_write(f"usage_limit({code.used + 1})")
+        if state is not None:
+            state.code_used.add(voucher_code, 1)
     if voucher.apply_once_per_customer:
         t.append_write(f"apply_once({voucher_code})")
     if voucher.single_use:
         t.append_write(f"single_use({False})")
+        if state is not None:
+            state.code_is_active.set(voucher_code, 0)
     return t
 
-def saleor_checkout_voucher_code_sim():
+def saleor_checkout_voucher_code_stream(num_txn: int, state=None, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as saleor_checkout_voucher_code_sim.
+    """
+    voucher_codes = list(range(100))
+    for _ in range(num_txn):
+        voucher_code = np.random.choice(voucher_codes)
+        yield saleor_checkout_voucher_code_generator(voucher_code, state, new_transaction=new_transaction)
+
+def saleor_checkout_voucher_code_sim(state=None):
     """
     Example output:
 
@@ -172,15 +228,12 @@ def saleor_checkout_voucher_code_sim():
     ['r-voucher_id(27)', 'r-vouncher_code(80)']
     ['r-voucher_id(55)', 'r-vouncher_code(48)']
     """
-    voucher_codes = list(range(100))
     num_t = 10
-    for _ in range(num_t):
-        voucher_code = np.random.choice(voucher_codes)
-        result = saleor_checkout_voucher_code_generator(voucher_code)
+    for result in saleor_checkout_voucher_code_stream(num_t, state):
         print(result)
 
 ### Transaction 2 (Transaction 5, 6, 16 from Tang et al.) ###
-def saleor_checkout_payment_process_generator(checkout_pk: int) -> list[str]:
+def saleor_checkout_payment_process_generator(checkout_pk: int, new_transaction=Transaction) -> list[str]:
     """
     Purpose: Coordinate concurrent checkout.
     saleor/checkout/complete_checkout.py#complete_checkout(with payment to process)
@@ -247,7 +300,7 @@ def saleor_checkout_payment_process_generator(checkout_pk: int) -> list[str]:
                 
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
 
     checkout = Checkout()
     t.append_read(f"checkout_pk({checkout_pk})")
@@ -309,6 +362,15 @@ def complete_checkout_fail_handler(checkout: Checkout, payment: Payment, t: Tran
             t.append_read(f"void")   
     return t
 
+def saleor_checkout_payment_process_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as saleor_checkout_payment_process_sim.
+    """
+    checkout_pks = list(range(100))
+    for _ in range(num_txn):
+        checkout_pk = np.random.choice(checkout_pks)
+        yield saleor_checkout_payment_process_generator(checkout_pk, new_transaction=new_transaction)
+
 def saleor_checkout_payment_process_sim():
     """
     Example output:
@@ -324,15 +386,12 @@ def saleor_checkout_payment_process_sim():
     ['r-checkout_pk(5)', 'r-payment_id(44)', 'r-ACTION_TO_CONFIRM', 'r-TRANSACTION']
     ['r-checkout_pk(44)', 'r-payment_id(83)', 'r-TRANSACTION']
     """
-    checkout_pks = list(range(100))
     num_t = 10
-    for _ in range(num_t):
-        checkout_pk = np.random.choice(checkout_pks)
-        result = saleor_checkout_payment_process_generator(checkout_pk)
+    for result in saleor_checkout_payment_process_stream(num_t):
         print(result)
 
 ### Transaction 3 (Transaction 7 from Tang et al.) ###
-def saleor_cancel_order_generator(fulfillment_pk: int) -> list[str]:
+def saleor_cancel_order_generator(fulfillment_pk: int, new_transaction=Transaction) -> list[str]:
     """
     Purpose: Coordinate concurrent order cancellation.
     saleor/order/actions.py#cancel_fulfillment
@@ -350,7 +409,7 @@ def saleor_cancel_order_generator(fulfillment_pk: int) -> list[str]:
     fulfillment_status (save) –> write
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
 
     fulfillment = Fulfillment()
     t.append_read(f"fulfillment_pk({fulfillment_pk})")
@@ -363,6 +422,15 @@ def saleor_cancel_order_generator(fulfillment_pk: int) -> list[str]:
 
     return t
 
+def saleor_cancel_order_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as saleor_cancel_order_sim.
+    """
+    fulfillment_pks = list(range(100))
+    for _ in range(num_txn):
+        fulfillment_pk = np.random.choice(fulfillment_pks)
+        yield saleor_cancel_order_generator(fulfillment_pk, new_transaction=new_transaction)
+
 def saleor_cancel_order_sim():
     """
     Example output:
@@ -378,15 +446,12 @@ def saleor_cancel_order_sim():
     ['r-fulfillment_pk(57)', 'r-order_line_pk(48)', 'r-order_line_pk(76)', 'w-fulfillment_pk(57)', 'w-lines(3)']
     ['r-fulfillment_pk(98)', 'r-order_line_pk(86)', 'r-order_line_pk(27)', 'w-fulfillment_pk(98)', 'w-lines(5)']
     """
-    fulfillment_pks = list(range(100))
     num_t = 10
-    for _ in range(num_t):
-        fulfillment_pk = np.random.choice(fulfillment_pks)
-        result = saleor_cancel_order_generator(fulfillment_pk)
+    for result in saleor_cancel_order_stream(num_t):
         print(result)
 
 ### Transaction 4 (Transaction 3 from Tang et al.) ###
-def saleor_payment_order(order_pk: int, amount: float) -> list[str]:
+def saleor_payment_order(order_pk: int, amount: float, new_transaction=Transaction) -> list[str]:
     """
     Transaction 3
     Purpose: Coordinate concurrent payment processing.
@@ -410,7 +475,7 @@ def saleor_payment_order(order_pk: int, amount: float) -> list[str]:
             UPDATE payment status -> write payment record
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
 
     # Read order row from DB and lock it for update
     order = Order(order_pk)
@@ -443,6 +508,16 @@ def saleor_payment_order(order_pk: int, amount: float) -> list[str]:
 
     return t
 
+def saleor_payment_order_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as saleor_payment_order_sim.
+    """
+    order_pks: int = list(range(100))
+    amount: float = np.random.uniform(-10, 100)
+    for _ in range(num_txn):
+        order_pk = np.random.choice(order_pks)
+        yield saleor_payment_order(order_pk, amount, new_transaction=new_transaction)
+
 def saleor_payment_order_sim():
     """
     Example output:
@@ -458,16 +533,12 @@ def saleor_payment_order_sim():
     ['r-order_pk(50)', 'r-payment_pk(66)']
     ['r-order_pk(1)', 'r-payment_pk(25)']
     """
-    order_pks: int = list(range(100))
-    amount: float = np.random.uniform(-10, 100)
     num_t = 10
-    for _ in range(num_t):
-        order_pk = np.random.choice(order_pks)
-        result = saleor_payment_order(order_pk, amount)
+    for result in saleor_payment_order_stream(num_t):
         print(result)
 
 ### Transaction 5 (Transaction 8 from Tang et al.) ###
-def saleor_order_fulfill_generator(order_id: str, input_data: dict) -> list[str]:
+def saleor_order_fulfill_generator(order_id: str, input_data: dict, new_transaction=Transaction) -> list[str]:
     """
     Transaction 8
     Purpose: Coordinate concurrent order fulfillment.
@@ -501,7 +572,7 @@ def saleor_order_fulfill_generator(order_id: str, input_data: dict) -> list[str]
       t.append("w-{order_id}")  # update order record with new status
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     
     # Read order record and lock for update
     t.append_read(f"order_id({order_id})")
@@ -532,6 +603,21 @@ def saleor_order_fulfill_generator(order_id: str, input_data: dict) -> list[str]
     
     return t
 
+def saleor_order_fulfill_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as saleor_order_fulfill_sim.
+    """
+    order_ids = list(range(100))
+    for _ in range(num_txn):
+        num_lines = np.random.choice(range(1, 5))
+        input_data = {
+            "order_line_ids": [np.random.choice(order_ids) for _ in range(num_lines)],
+            # NOTE: "fulfill" being random choice between True/False IS in the original code
+            "lines": [{"warehouse": np.random.choice(order_ids), "fulfill": np.random.binomial(1, 0.5)} for _ in range(num_lines)]
+        }
+        order_id = np.random.choice(order_ids)
+        yield saleor_order_fulfill_generator(order_id, input_data, new_transaction=new_transaction)
+
 def saleor_order_fulfill_sim():
     """
     Example output:
@@ -547,21 +633,12 @@ def saleor_order_fulfill_sim():
     ['r-order_id(17)', 'r-line_id(20)', 'r-line_id(46)', 'r-warehouse_id(38)', 'r-warehouse_id(18)', 'w-order_id(17)']
     ['r-order_id(88)', 'r-line_id(30)', 'r-line_id(95)', 'r-line_id(36)', 'r-line_id(4)', 'r-warehouse_id(27)', 'r-warehouse_id(32)', 'r-warehouse_id(64)', 'r-r-fulfillment', 'w-fulfillment', 'r-alloc', 'r-stock', 'w-fulfillment_line', 'w-order_line', 'w-alloc', 'w-stock', 'r-warehouse_id(35)', 'r-r-fulfillment', 'r-alloc', 'r-stock', 'w-fulfillment_line', 'w-order_line', 'w-alloc', 'w-stock', 'w-order_id(88)']
     """
-    order_ids = list(range(100))
     num_t = 10
-    for _ in range(num_t):
-        num_lines = np.random.choice(range(1, 5))
-        input_data = {
-            "order_line_ids": [np.random.choice(order_ids) for _ in range(num_lines)],
-            # NOTE: "fulfill" being random choice between True/False IS in the original code
-            "lines": [{"warehouse": np.random.choice(order_ids), "fulfill": np.random.binomial(1, 0.5)} for _ in range(num_lines)]
-        }
-        order_id = np.random.choice(order_ids)
-        result = saleor_order_fulfill_generator(order_id, input_data)
+    for result in saleor_order_fulfill_stream(num_t):
         print(result)
 
 ### Transaction 6 (Transaction 15 from Tang et al.) ###
-def saleor_order_lines_create_generator(order_id: str, input_data: dict) -> list[str]:
+def saleor_order_lines_create_generator(order_id: str, input_data: dict, new_transaction=Transaction) -> list[str]:
     """
     Transaction 15
     Purpose: Coordinate concurrent order updating.
@@ -586,7 +663,7 @@ def saleor_order_lines_create_generator(order_id: str, input_data: dict) -> list
         Trigger order status event –> write order_event_status
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
 
     # Read order record (lock for update)
     t.append_read(f"order_id({order_id})")
@@ -617,6 +694,19 @@ def saleor_order_lines_create_generator(order_id: str, input_data: dict) -> list
 
     return t
 
+def saleor_order_lines_create_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as saleor_order_lines_create_sim.
+    """
+    order_ids = list(range(100))
+    for _ in range(num_txn):
+        num_lines = np.random.choice(range(1, 10))
+        input_data = {
+            "lines": [{"variant_id": np.random.choice(order_ids)} for _ in range(num_lines)]
+        }
+        order_id = np.random.choice(order_ids)
+        yield saleor_order_lines_create_generator(order_id, input_data, new_transaction=new_transaction)
+
 def saleor_order_lines_create_sim():
     """
     Example output:
@@ -632,19 +722,12 @@ def saleor_order_lines_create_sim():
     ['r-order_id(23)', 'r-variant_id(63)', 'w-order_line_id(line_63)', 'r-variant_id(68)', 'w-order_line_id(line_68)', 'r-variant_id(80)', 'w-order_line_id(line_80)', 'r-variant_id(94)', 'w-order_line_id(line_94)', 'w-order_event', 'w-order_id(23)', 'r-order_line_id(line_63)', 'r-order_line_id(line_68)', 'r-order_line_id(line_80)', 'r-order_line_id(line_94)', 'w-order_weight(23)', 'w-search_vector(23)', 'w-order_id(23)', 'w-order_event_status']
     ['r-order_id(48)', 'r-variant_id(98)', 'w-order_line_id(line_98)', 'r-variant_id(1)', 'w-order_line_id(line_1)', 'r-variant_id(92)', 'w-order_line_id(line_92)', 'r-variant_id(8)', 'w-order_line_id(line_8)', 'r-variant_id(40)', 'w-order_line_id(line_40)', 'r-variant_id(5)', 'w-order_line_id(line_5)', 'w-order_event', 'w-order_id(48)', 'r-order_line_id(line_98)', 'r-order_line_id(line_1)', 'r-order_line_id(line_92)', 'r-order_line_id(line_8)', 'r-order_line_id(line_40)', 'r-order_line_id(line_5)', 'w-order_weight(48)', 'w-search_vector(48)', 'w-order_id(48)', 'w-order_event_status']
     """
-    order_ids = list(range(100))
     num_t = 10
-    for _ in range(num_t):
-        num_lines = np.random.choice(range(1, 10))
-        input_data = {
-            "lines": [{"variant_id": np.random.choice(order_ids)} for _ in range(num_lines)]
-        }
-        order_id = np.random.choice(order_ids)
-        result = saleor_order_lines_create_generator(order_id, input_data)
+    for result in saleor_order_lines_create_stream(num_t):
         print(result)
 
 ### Transaction 7 (Transaction 11, 12 from Tang et al.) ###
-def saleor_stripe_handle_authorized_payment_intent_generator(payment_intent: StripePaymentObj) -> list[str]:
+def saleor_stripe_handle_authorized_payment_intent_generator(payment_intent: StripePaymentObj, new_transaction=Transaction) -> list[str]:
     """
     Purpose: Coordinate concurrent payment processing.
     saleor/payment/gateways/stripe/webhooks.py#handle_authorized_payment_intent
@@ -675,7 +758,7 @@ def saleor_stripe_handle_authorized_payment_intent_generator(payment_intent: Str
             SELECT * FROM Checkout WHERE id = checkout_id FOR UPDATE
             INSERT INTO Order (order_data) VALUES ('order_info')
     """
-    t = Transaction()
+    t = new_transaction()
     payment = Payment()
     checkout = Checkout()
 
@@ -706,6 +789,14 @@ def saleor_stripe_handle_authorized_payment_intent_generator(payment_intent: Str
 
     return t
 
+def saleor_stripe_handle_authorized_payment_intent_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as saleor_stripe_handle_authorized_payment_intent_sim.
+    """
+    for _ in range(num_txn):
+        payment_intent = StripePaymentObj()
+        yield saleor_stripe_handle_authorized_payment_intent_generator(payment_intent, new_transaction=new_transaction)
+
 def saleor_stripe_handle_authorized_payment_intent_sim():
     """
     Example output:
@@ -722,13 +813,11 @@ def saleor_stripe_handle_authorized_payment_intent_sim():
     ['r-payment_intent_id(67)', 'r-payment_intent_id(67)', 'w-update_pmt_details(60)', 'r-transaction(60)', 'w-insert_into_transaction(60)', 'w-update_payment(60)']
     """
     num_t = 10
-    for _ in range(num_t):
-        payment_intent = StripePaymentObj()
-        result = saleor_stripe_handle_authorized_payment_intent_generator(payment_intent)
+    for result in saleor_stripe_handle_authorized_payment_intent_stream(num_t):
         print(result)
 
 ### Transaction 8 (Transaction 14 from Tang et al.) ###
-def saleor_stock_bulk_update_generator(stocks: list[dict], fields_to_update: list[str]) -> list[str]:
+def saleor_stock_bulk_update_generator(stocks: list[dict], fields_to_update: list[str], new_transaction=Transaction) -> list[str]:
     """
     Transaction 14
     Purpose: Coordinate concurrent order updating.
@@ -741,44 +830,52 @@ def saleor_stock_bulk_update_generator(stocks: list[dict], fields_to_update: lis
       SELECT id FROM Stock WHERE id IN ([stock_ids]) FOR UPDATE
       BULK UPDATE Stock SET <fields_to_update> WHERE id IN ([stock_ids])
     TRANSACTION COMMIT
+
+    Both statements are single bulk operations on the stock rows, however
+    many there are; locks are row-level, so fields_to_update does not
+    change the trace.
     """
-    t = Transaction()
+    t = new_transaction()
 
     stock_ids = [stock["id"] for stock in stocks]
-    stock_ids_str = ", ".join([str(stock_id) for stock_id in stock_ids])
-    t.append_read(f"stock_ids({stock_ids_str})")
-    fields_to_update_str = ", ".join(fields_to_update)
-    t.append_write(f"fields_to_update({fields_to_update_str})") # Bulk update the stocks with the given fields
+    t.append_read_many("stock", stock_ids)
+    t.append_write_many("stock", stock_ids) # Bulk update the stocks with the given fields
     
     return t
 
-def saleor_stock_bulk_update_sim():
+def saleor_stock_bulk_update_stream(num_txn: int, new_transaction=Transaction):
     """
-    Example output:
-
-    ['r-stock_ids(61)', 'w-fields_to_update(quantity, price)']
-    ['r-stock_ids(34, 13, 8)', 'w-fields_to_update(quantity, price)']
-    ['r-stock_ids(15)', 'w-fields_to_update(quantity, price)']
-    ['r-stock_ids(34, 30, 12, 40, 22)', 'w-fields_to_update(quantity, price)']
-    ['r-stock_ids(30, 13, 68, 56)', 'w-fields_to_update(quantity, price)']
-    ['r-stock_ids(65, 63, 0, 42, 38, 18, 25, 38)', 'w-fields_to_update(quantity, price)']
-    ['r-stock_ids(99, 61, 71, 83, 61, 74, 2, 34, 56)', 'w-fields_to_update(quantity, price)']
-    ['r-stock_ids(94, 23, 56, 67, 56, 65, 52, 77)', 'w-fields_to_update(quantity, price)']
-    ['r-stock_ids(70, 4, 86, 55)', 'w-fields_to_update(quantity, price)']
-    ['r-stock_ids(61)', 'w-fields_to_update(quantity, price)']
+    Yield num_txn transactions sampled the same way as saleor_stock_bulk_update_sim.
     """
-    num_t = 10
-    for _ in range(num_t):
+    for _ in range(num_txn):
         stocks = [
             {"id": np.random.choice(range(100)), "quantity": np.random.randint(1, 100), "price": np.random.uniform(10, 100)}
             for _ in range(np.random.randint(1, 10))
         ]
         fields_to_update = ["quantity", "price"]
-        result = saleor_stock_bulk_update_generator(stocks, fields_to_update)
+        yield saleor_stock_bulk_update_generator(stocks, fields_to_update, new_transaction=new_transaction)
+
+def saleor_stock_bulk_update_sim():
+    """
+    Example output:
+
+    ['r-stock(61)', 'w-stock(61)']
+    ['r-stock(8, 13, 34)', 'w-stock(8, 13, 34)']
+    ['r-stock(15)', 'w-stock(15)']
+    ['r-stock(12, 22, 30, 34, 40)', 'w-stock(12, 22, 30, 34, 40)']
+    ['r-stock(13, 30, 56, 68)', 'w-stock(13, 30, 56, 68)']
+    ['r-stock(0, 18, 25, 38, 42, 63, 65)', 'w-stock(0, 18, 25, 38, 42, 63, 65)']
+    ['r-stock(2, 34, 56, 61, 71, 74, 83, 99)', 'w-stock(2, 34, 56, 61, 71, 74, 83, 99)']
+    ['r-stock(23, 52, 56, 65, 67, 77, 94)', 'w-stock(23, 52, 56, 65, 67, 77, 94)']
+    ['r-stock(4, 55, 70, 86)', 'w-stock(4, 55, 70, 86)']
+    ['r-stock(61)', 'w-stock(61)']
+    """
+    num_t = 10
+    for result in saleor_stock_bulk_update_stream(num_t):
         print(result)
 
 ### Transaction 9 (Transaction 13 from Tang et al.) ###
-def saleor_delete_categories_generator(categories_ids: list) -> list[str]:
+def saleor_delete_categories_generator(categories_ids: list, new_transaction=Transaction) -> list[str]:
     """
     Purpose: Coordinate concurrent categories updating.
     saleor/product/utils/__init__.py#delete_categories
@@ -797,47 +894,53 @@ def saleor_delete_categories_generator(categories_ids: list) -> list[str]:
         channel_ids = SELECT DISTINCT channel_id FROM ProductChannelListing WHERE product_id IN products
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     
-    t.append_read(f"categories({categories_ids})")
+    t.append_read_many("category", categories_ids)
 
     all_product_ids = []
     
     for category_id in categories_ids:
         num_products = np.random.randint(1, 6)
         product_ids = np.random.randint(100, 1000, size=num_products).tolist()
-        all_product_ids.append(product_ids)
-    t.append_read(f"prefetch_products({all_product_ids})")
+        all_product_ids.extend(product_ids)
+    t.append_predicate_read("product", "category_id", values=categories_ids)
     
-    t.append_read(f"product_channel_listing({product_ids})")
+    t.append_read_many("product_channel_listing", all_product_ids)
     
     t.append_write(f"product_channel_listing")
     
-    t.append_write(f"delete_categories({categories_ids})")
+    t.append_write_many("category", categories_ids)
     
-    t.append_read(f"channel_id({product_ids})")
+    t.append_read_many("product_channel_listing", all_product_ids) # SELECT DISTINCT channel_id
     
     return t
 
+def saleor_delete_categories_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as saleor_delete_categories_sim.
+    """
+    for _ in range(num_txn):
+        categories_ids = np.random.randint(1, 1000, size=np.random.randint(1, 5)).tolist()
+        yield saleor_delete_categories_generator(categories_ids, new_transaction=new_transaction)
+
 def saleor_delete_categories_sim():
     """
     Example output:
 
-    ['r-categories([550, 79])', 'r-prefetch_products([[206, 847, 866, 679, 400], [486, 174, 186, 630, 462]])', 'r-product_channel_listing([486, 174, 186, 630, 462])', 'w-product_channel_listing', 'w-delete_categories([550, 79])', 'r-channel_id([486, 174, 186, 630, 462])']
-    ['r-categories([843, 228])', 'r-prefetch_products([[457, 529, 905, 255, 946], [627, 374, 559]])', 'r-product_channel_listing([627, 374, 559])', 'w-product_channel_listing', 'w-delete_categories([843, 228])', 'r-channel_id([627, 374, 559])']
-    ['r-categories([562, 32, 431, 157])', 'r-prefetch_products([[572], [347, 410, 738], [361, 420, 571, 289], [120, 424, 513]])', 'r-product_channel_listing([120, 424, 513])', 'w-product_channel_listing', 'w-delete_categories([562, 32, 431, 157])', 'r-channel_id([120, 424, 513])']
-    ['r-categories([651, 64, 631])', 'r-prefetch_products([[780, 232], [396, 778, 904, 494], [852, 963, 520, 587]])', 'r-product_channel_listing([852, 963, 520, 587])', 'w-product_channel_listing', 'w-delete_categories([651, 64, 631])', 'r-channel_id([852, 963, 520, 587])']
-    ['r-categories([282])', 'r-prefetch_products([[321, 429, 979, 616]])', 'r-product_channel_listing([321, 429, 979, 616])', 'w-product_channel_listing', 'w-delete_categories([282])', 'r-channel_id([321, 429, 979, 616])']
-    ['r-categories([530, 892])', 'r-prefetch_products([[365], [238, 334, 334]])', 'r-product_channel_listing([238, 334, 334])', 'w-product_channel_listing', 'w-delete_categories([530, 892])', 'r-channel_id([238, 334, 334])']
-    ['r-categories([660, 929])', 'r-prefetch_products([[707], [834]])', 'r-product_channel_listing([834])', 'w-product_channel_listing', 'w-delete_categories([660, 929])', 'r-channel_id([834])']
-    ['r-categories([566, 145, 912])', 'r-prefetch_products([[315, 446], [897], [179, 855, 439, 948, 314]])', 'r-product_channel_listing([179, 855, 439, 948, 314])', 'w-product_channel_listing', 'w-delete_categories([566, 145, 912])', 'r-channel_id([179, 855, 439, 948, 314])']
-    ['r-categories([185, 261])', 'r-prefetch_products([[596, 721, 502], [956, 927, 680]])', 'r-product_channel_listing([956, 927, 680])', 'w-product_channel_listing', 'w-delete_categories([185, 261])', 'r-channel_id([956, 927, 680])']
-    ['r-categories([538, 705, 232, 403])', 'r-prefetch_products([[948, 645, 713, 761], [133, 137, 819, 955], [617, 486, 139], [534, 669, 264, 700]])', 'r-product_channel_listing([534, 669, 264, 700])', 'w-product_channel_listing', 'w-delete_categories([538, 705, 232, 403])', 'r-channel_id([534, 669, 264, 700])']
+    ['r-category(79, 550)', 'r-product(category_id=79|550)', 'r-product_channel_listing(174, 186, 206, 400, 462, 486, 630, 679, 847, 866)', 'w-product_channel_listing', 'w-category(79, 550)', 'r-product_channel_listing(174, 186, 206, 400, 462, 486, 630, 679, 847, 866)']
+    ['r-category(228, 843)', 'r-product(category_id=228|843)', 'r-product_channel_listing(255, 374, 457, 529, 559, 627, 905, 946)', 'w-product_channel_listing', 'w-category(228, 843)', 'r-product_channel_listing(255, 374, 457, 529, 559, 627, 905, 946)']
+    ['r-category(32, 157, 431, 562)', 'r-product(category_id=32|157|431|562)', 'r-product_channel_listing(120, 289, 347, 361, 410, 420, 424, 513, 571, 572, 738)', 'w-product_channel_listing', 'w-category(32, 157, 431, 562)', 'r-product_channel_listing(120, 289, 347, 361, 410, 420, 424, 513, 571, 572, 738)']
+    ['r-category(64, 631, 651)', 'r-product(category_id=64|631|651)', 'r-product_channel_listing(232, 396, 494, 520, 587, 778, 780, 852, 904, 963)', 'w-product_channel_listing', 'w-category(64, 631, 651)', 'r-product_channel_listing(232, 396, 494, 520, 587, 778, 780, 852, 904, 963)']
+    ['r-category(282)', 'r-product(category_id=282)', 'r-product_channel_listing(321, 429, 616, 979)', 'w-product_channel_listing', 'w-category(282)', 'r-product_channel_listing(321, 429, 616, 979)']
+    ['r-category(530, 892)', 'r-product(category_id=530|892)', 'r-product_channel_listing(238, 334, 365)', 'w-product_channel_listing', 'w-category(530, 892)', 'r-product_channel_listing(238, 334, 365)']
+    ['r-category(660, 929)', 'r-product(category_id=660|929)', 'r-product_channel_listing(707, 834)', 'w-product_channel_listing', 'w-category(660, 929)', 'r-product_channel_listing(707, 834)']
+    ['r-category(145, 566, 912)', 'r-product(category_id=145|566|912)', 'r-product_channel_listing(179, 314, 315, 439, 446, 855, 897, 948)', 'w-product_channel_listing', 'w-category(145, 566, 912)', 'r-product_channel_listing(179, 314, 315, 439, 446, 855, 897, 948)']
+    ['r-category(185, 261)', 'r-product(category_id=185|261)', 'r-product_channel_listing(502, 596, 680, 721, 927, 956)', 'w-product_channel_listing', 'w-category(185, 261)', 'r-product_channel_listing(502, 596, 680, 721, 927, 956)']
+    ['r-category(232, 403, 538, 705)', 'r-product(category_id=232|403|538|705)', 'r-product_channel_listing(133, 137, 139, 264, 486, 534, 617, 645, 669, 700, 713, 761, 819, 948, 955)', 'w-product_channel_listing', 'w-category(232, 403, 538, 705)', 'r-product_channel_listing(133, 137, 139, 264, 486, 534, 617, 645, 669, 700, 713, 761, 819, 948, 955)']
     """
     num_t = 10
-    for _ in range(num_t):
-        categories_ids = np.random.randint(1, 1000, size=np.random.randint(1, 5)).tolist()
-        result = saleor_delete_categories_generator(categories_ids)
+    for result in saleor_delete_categories_stream(num_t):
         print(result)
 
 def main():
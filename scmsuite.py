@@ -8,7 +8,7 @@
 # [91] Xiaodong Zhang. 2021. The synchronized used to prevent concurrency doesn’t
 # work as expected in Chinese). 
 
-import numpy as np
+from rng import np
 from transaction import Transaction
 
 #################################
@@ -16,7 +16,7 @@ from transaction import Transaction
 #################################
 
 ### Transaction 1 (Transaction 1 from Tang et al.) ###
-def scmsuite_internal_save_retail_generator(changed: bool, retail_store_id: int) -> Transaction:
+def scmsuite_internal_save_retail_generator(changed: bool, retail_store_id: int, new_transaction=Transaction) -> Transaction:
     """
     Transaction 1.
     Lock-based transaction.
@@ -32,12 +32,21 @@ def scmsuite_internal_save_retail_generator(changed: bool, retail_store_id: int)
         INSERT INTO RetailStoreCountryCenter (id, name, ...) VALUES (:id, :name, ...) ON DUPLICATE KEY UPDATE values
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"retail_store_id({retail_store_id})")
     if changed:
         t.append_write(f"retail_store_id({retail_store_id})")
     return t
 
+def scmsuite_internal_save_retail_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as scmsuite_internal_save_retail_sim.
+    """
+    for _ in range(num_txn):
+        changed = np.random.choice([True, False], p=[0.2, 0.8])
+        retail_store_id = np.random.randint(1, 50)
+        yield scmsuite_internal_save_retail_generator(changed, retail_store_id, new_transaction=new_transaction)
+
 def scmsuite_internal_save_retail_sim(num_txn: int) -> list[str]:
     """
     Example output:
@@ -53,14 +62,11 @@ def scmsuite_internal_save_retail_sim(num_txn: int) -> list[str]:
     ['r-retail_store_id(3)']
     ['r-retail_store_id(27)']
     """
-    for _ in range(num_txn):
-        changed = np.random.choice([True, False], p=[0.2, 0.8])
-        retail_store_id = np.random.randint(1, 50)
-        result = scmsuite_internal_save_retail_generator(changed, retail_store_id)
+    for result in scmsuite_internal_save_retail_stream(num_txn):
         print(result)
 
 ### Transaction 2 (Transaction 6 from Tang et al.) ###
-def scmsuite_add_supply_order_generator(retail_store_country_center_id: int, total_amount: float) -> Transaction:
+def scmsuite_add_supply_order_generator(retail_store_country_center_id: int, total_amount: float, new_transaction=Transaction) -> Transaction:
     """
     Transaction 6.
     Lock-based transaction.
@@ -82,12 +88,21 @@ def scmsuite_add_supply_order_generator(retail_store_country_center_id: int, tot
     INSERT INTO SupplyOrder (seller_id, title, contract, total_amount, retail_store_country_center_id) VALUES (:totalAmount, :retailStoreCountryCenterId)
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"check_params({retail_store_country_center_id})")
     t.append_read(f"retail_store_country_center_id({retail_store_country_center_id})")
     t.append_write(f"total_amount({total_amount})")
     return t
 
+def scmsuite_add_supply_order_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as scmsuite_add_supply_order_sim.
+    """
+    for _ in range(num_txn):
+        retail_store_country_center_id = np.random.randint(1, 50)
+        total_amount = round(np.random.uniform(0, 100), 2)
+        yield scmsuite_add_supply_order_generator(retail_store_country_center_id, total_amount, new_transaction=new_transaction)
+
 def scmsuite_add_supply_order_sim(num_txn: int) -> list[str]:
     """
     Example output:
@@ -103,15 +118,12 @@ def scmsuite_add_supply_order_sim(num_txn: int) -> list[str]:
     ['r-check_params(43)', 'r-retail_store_country_center_id(43)', 'w-total_amount(61.11)']
     ['r-check_params(39)', 'r-retail_store_country_center_id(39)', 'w-total_amount(30.23)']
     """
-    for _ in range(num_txn):
-        retail_store_country_center_id = np.random.randint(1, 50)
-        total_amount = round(np.random.uniform(0, 100), 2)
-        result = scmsuite_add_supply_order_generator(retail_store_country_center_id, total_amount)
+    for result in scmsuite_add_supply_order_stream(num_txn):
         print(result)
 
 
 ### Transaction 3 (Transaction 2 from Tang et al.) ###
-def scmsuite_get_update_sql_generator(id: int) -> Transaction:
+def scmsuite_get_update_sql_generator(id: int, new_transaction=Transaction) -> Transaction:
     """
     Transaction 2.
     Validation-based transaction.
@@ -127,11 +139,19 @@ def scmsuite_get_update_sql_generator(id: int) -> Transaction:
     UPDATE GoodsShelf SET name = :name, position = :position, description = :description WHERE id = :id
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"goods_shelf({id})")
     t.append_write(f"goods_shelf({id})")
     return t
 
+def scmsuite_get_update_sql_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as scmsuite_get_update_sql_sim.
+    """
+    for _ in range(num_txn):
+        id = np.random.randint(1, 50)
+        yield scmsuite_get_update_sql_generator(id, new_transaction=new_transaction)
+
 def scmsuite_get_update_sql_sim(num_txn: int) -> list[str]:
     """
     Example output:
@@ -147,14 +167,12 @@ def scmsuite_get_update_sql_sim(num_txn: int) -> list[str]:
     ['r-goods_shelf(15)', 'w-goods_shelf(15)']
     ['r-goods_shelf(45)', 'w-goods_shelf(45)']
     """
-    for _ in range(num_txn):
-        id = np.random.randint(1, 50)
-        result = scmsuite_get_update_sql_generator(id)
+    for result in scmsuite_get_update_sql_stream(num_txn):
         print(result)
 
 
 ### Transaction 4 (Transaction 11 from Tang et al.) ###
-def scmsuite_copy_catalog_form_generator(retail_store_id: int, catalog_id: int, catalog_version: int) -> Transaction:
+def scmsuite_copy_catalog_form_generator(retail_store_id: int, catalog_id: int, catalog_version: int, new_transaction=Transaction) -> Transaction:
     """
     Transaction 3.
     Lock-based transaction.
@@ -171,12 +189,22 @@ def scmsuite_copy_catalog_form_generator(retail_store_id: int, catalog_id: int,
 
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"retail_store_id({retail_store_id})")
     t.append_read(f"catalog_id,catalog_version({catalog_id, catalog_version})")
     t.append_write(f"catalog_new_version({catalog_version+1})")
     return t
 
+def scmsuite_copy_catalog_form_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as scmsuite_copy_catalog_form_sim.
+    """
+    for _ in range(num_txn):
+        retail_store_id = np.random.randint(1, 50)
+        catalog_id = np.random.randint(1, 50)
+        catalog_version = np.random.randint(1, 10)
+        yield scmsuite_copy_catalog_form_generator(retail_store_id, catalog_id, catalog_version, new_transaction=new_transaction)
+
 def scmsuite_copy_catalog_form_sim(num_txn: int) -> list[str]:
     """
     Example output:
@@ -192,17 +220,12 @@ def scmsuite_copy_catalog_form_sim(num_txn: int) -> list[str]:
     ['r-retail_store_id(37)', 'r-catalog_id,catalog_version((5, 7))', 'w-catalog_new_version(8)']
     ['r-retail_store_id(32)', 'r-catalog_id,catalog_version((36, 5))', 'w-catalog_new_version(6)']
     """
-
-    for _ in range(num_txn):
-        retail_store_id = np.random.randint(1, 50)
-        catalog_id = np.random.randint(1, 50)
-        catalog_version = np.random.randint(1, 10)
-        result = scmsuite_copy_catalog_form_generator(retail_store_id, catalog_id, catalog_version)
+    for result in scmsuite_copy_catalog_form_stream(num_txn):
         print(result)
 
 
 ### Transaction 5 (Transaction 10 from Tang et al.) ### 
-def scmsuite_remove_catalog_list_generator(retail_store_id: int, catalog_id: int, catalog_version: int) -> Transaction:
+def scmsuite_remove_catalog_list_generator(retail_store_id: int, catalog_id: int, catalog_version: int, new_transaction=Transaction) -> Transaction:
     """
     Transaction 5.
     Lock-based transaction.
@@ -219,13 +242,23 @@ def scmsuite_remove_catalog_list_generator(retail_store_id: int, catalog_id: int
     DELETE FROM catalog WHERE id IN (catalogIds)
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
     t.append_read(f"retail_store_id({retail_store_id})")
     t.append_read(f"catalog_id,catalog_version({catalog_id, catalog_version})")
     t.append_write(f"catalog_new_version({catalog_version+1})")
     t.append_write("catalog_delete")
     return t
 
+def scmsuite_remove_catalog_list_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as scmsuite_remove_catalog_list_sim.
+    """
+    for _ in range(num_txn):
+        retail_store_id = np.random.randint(1, 50)
+        catalog_id = np.random.randint(1, 50)
+        catalog_version = np.random.randint(1, 10)
+        yield scmsuite_remove_catalog_list_generator(retail_store_id, catalog_id, catalog_version, new_transaction=new_transaction)
+
 def scmsuite_remove_catalog_list_sim(num_txn: int) -> list[str]:
     """
     Example output:
@@ -240,12 +273,7 @@ def scmsuite_remove_catalog_list_sim(num_txn: int) -> list[str]:
     ['r-retail_store_id(27)', 'r-catalog_id,catalog_version((19, 4))', 'w-catalog_new_version(5)', 'w-catalog_delete']
     ['r-retail_store_id(41)', 'r-catalog_id,catalog_version((46, 5))', 'w-catalog_new_version(6)', 'w-catalog_delete']
     """
-
-    for _ in range(num_txn):
-        retail_store_id = np.random.randint(1, 50)
-        catalog_id = np.random.randint(1, 50)
-        catalog_version = np.random.randint(1, 10)
-        result = scmsuite_remove_catalog_list_generator(retail_store_id, catalog_id, catalog_version)
+    for result in scmsuite_remove_catalog_list_stream(num_txn):
         print(result)
 
 
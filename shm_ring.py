@@ -0,0 +1,270 @@
+"""
+Shared-memory ring buffer carrying encoded transactions between processes.
+
+A SharedRing lives in one multiprocessing.shared_memory block laid out as
+uint64 words:
+
+    control   capacity, block size, number of consumers, closed flag,
+              write cursor, one read cursor per consumer
+    blocks    capacity fixed-size blocks; word 0 of a block is a header
+              (tag << 32 | continued << 31 | number of ops), the rest
+              holds op records (see encoding.py)
+
+Producers append one transaction per block (longer ones continue in the
+next block) and advance the write cursor under a shared lock.
+Every consumer has its own read cursor and sees every transaction, in
+order. A producer blocks while the slowest consumer is a full ring behind
+(backpressure), and a consumer blocks while it has read everything. get()
+returns a view into the shared block, with no copy or pickling, which
+stays valid until the consumer's next get().
+
+Every cursor and the closed flag are read and written only under the
+lock, so releasing it orders the blocks a producer wrote (or a consumer
+read) before the cursor that publishes them on any CPU, not only on
+x86-64. Waiting, for space or for data, sleeps outside the lock.
+
+### EXAMPLE OUTPUT ###
+
+Streaming 100000 transactions from 2 producers to 2 consumers
+transport              seconds      txn/s
+shared-memory ring       2.259      44273
+multiprocessing.Queue     5.224      19143
+consumer 0: 100000 txns, 367377 ops
+consumer 1: 100000 txns, 367377 ops
+"""
+
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import workloads
+from encoding import KeyEncoder
+
+CONTROL_WORDS = 5       # capacity, block words, consumers, closed, write cursor
+CONTINUED = 1 << 31
+
+class SharedRing:
+    """
+    Ring of capacity blocks of block_words uint64 words each, shared
+    between processes. Create it in the parent, then pass ring.name and
+    ring.lock to the children and attach() there.
+
+    Example usage:
+    >>> ring = SharedRing(capacity=4, block_words=4, num_consumers=2)
+    >>> ring.put(np.array([10, 11, 12, 13, 14], dtype=np.uint64), tag=7)
+    >>> ring.close_writer()
+    >>> tag, ops = ring.get(0)
+    >>> tag, ops.tolist()
+    (7, [10, 11, 12, 13, 14])
+    >>> ring.get(0), ring.get(1)[1].tolist(), ring.get(1)
+    (None, [10, 11, 12, 13, 14], None)
+    >>> ring.close(); ring.unlink()
+    """
+    def __init__(self, capacity: int = 4096, block_words: int = 64, num_consumers: int = 1,
+                 name: str = None, lock=None, create: bool = True):
+        if create:
+            size = 8 * (CONTROL_WORDS + num_consumers + capacity * block_words)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            header = np.ndarray(CONTROL_WORDS, dtype=np.uint64, buffer=self.shm.buf)
+            header[:] = [capacity, block_words, num_consumers, 0, 0]
+            del header
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        words = np.ndarray(self.shm.size // 8, dtype=np.uint64, buffer=self.shm.buf)
+        self.capacity, self.block_words, self.num_consumers = (int(w) for w in words[:3])
+        self.control = words[:CONTROL_WORDS + self.num_consumers]
+        data = words[CONTROL_WORDS + self.num_consumers:CONTROL_WORDS + self.num_consumers + self.capacity * self.block_words]
+        self.blocks = data.reshape(self.capacity, self.block_words)
+        self.lock = lock if lock is not None else multiprocessing.Lock()
+        self.pending = [0] * self.num_consumers     # blocks returned by the last get(), not yet released
+
+    @classmethod
+    def attach(cls, name: str, lock=None) -> "SharedRing":
+        """
+        Open a ring created by another process.
+        """
+        return cls(name=name, lock=lock, create=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def _min_read(self) -> int:
+        return int(self.control[CONTROL_WORDS:].min())
+
+    def put(self, ops: np.ndarray, tag: int = 0, poll: float = 0.0001):
+        """
+        Append one encoded transaction, waiting while the ring is full.
+        """
+        per_block = self.block_words - 1
+        num_blocks = max(1, -(-len(ops) // per_block))
+        if num_blocks > self.capacity:
+            raise ValueError(f"transaction of {len(ops)} ops does not fit in the ring")
+        while True:
+            with self.lock:
+                write = int(self.control[4])
+                if write + num_blocks - self._min_read() <= self.capacity:
+                    for i in range(num_blocks):
+                        chunk = ops[i * per_block:(i + 1) * per_block]
+                        block = self.blocks[(write + i) % self.capacity]
+                        block[1:1 + len(chunk)] = chunk
+                        block[0] = (tag << 32) | (CONTINUED if i < num_blocks - 1 else 0) | len(chunk)
+                    self.control[4] = write + num_blocks
+                    return
+            time.sleep(poll)
+
+    def get(self, consumer: int, poll: float = 0.0001):
+        """
+        Return the next (tag, ops) for consumer, waiting for a producer if
+        needed, or None once the writers are closed and everything has
+        been read. ops is a view into shared memory, valid until the next
+        get() of this consumer.
+        """
+        cursor = CONTROL_WORDS + consumer
+        while True:
+            with self.lock:
+                read = int(self.control[cursor]) + self.pending[consumer]
+                self.control[cursor] = read
+                self.pending[consumer] = 0
+                write, closed = int(self.control[4]), int(self.control[3])
+            if write != read:
+                break
+            if closed:
+                return None
+            time.sleep(poll)
+        header = int(self.blocks[read % self.capacity, 0])
+        tag, count = header >> 32, header & (CONTINUED - 1)
+        if not header & CONTINUED:
+            self.pending[consumer] = 1
+            return tag, self.blocks[read % self.capacity, 1:1 + count]
+        # Long transaction spread over several blocks; copy it out
+        chunks = []
+        used = 0
+        while True:
+            header = int(self.blocks[(read + used) % self.capacity, 0])
+            chunks.append(self.blocks[(read + used) % self.capacity, 1:1 + (header & (CONTINUED - 1))].copy())
+            used += 1
+            if not header & CONTINUED:
+                break
+        self.pending[consumer] = used
+        return tag, np.concatenate(chunks)
+
+    def close_writer(self):
+        """
+        Mark the stream as finished; consumers get None once drained.
+        """
+        with self.lock:
+            self.control[3] = 1
+
+    def close(self):
+        """
+        Detach this process from the shared memory.
+        """
+        self.control = self.blocks = None
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Free the shared memory (call once, from the creating process).
+        """
+        self.shm.unlink()
+
+
+#######################
+####   Simulation  ####
+#######################
+
+# Producers generate their transactions first and wait at a barrier, so
+# that only encoding and transport are timed
+
+def _produce_ring(name: str, lock, barrier, names: list[str], num_txn: int, seed: int):
+    np.random.seed(seed)
+    transactions = list(workloads.mix(names, num_txn))
+    ring = SharedRing.attach(name, lock)
+    encoder = KeyEncoder()
+    tags = {n: i for i, n in enumerate(workloads.names())}
+    barrier.wait()
+    for workload_name, t in transactions:
+        ring.put(encoder.encode(t.trace), tags[workload_name])
+    ring.close()
+
+def _consume_ring(name: str, lock, consumer: int, results):
+    ring = SharedRing.attach(name, lock)
+    txns = ops = 0
+    while (item := ring.get(consumer)) is not None:
+        txns += 1
+        ops += len(item[1])
+    results.put((consumer, txns, ops))
+    ring.close()
+
+def _produce_queue(queues, barrier, names: list[str], num_txn: int, seed: int):
+    np.random.seed(seed)
+    transactions = list(workloads.mix(names, num_txn))
+    barrier.wait()
+    for workload_name, t in transactions:
+        for queue in queues:
+            queue.put((workload_name, t))
+    for queue in queues:
+        queue.put(None)
+
+def _consume_queue(queue, num_producers: int):
+    finished = 0
+    while finished < num_producers:
+        if queue.get() is None:
+            finished += 1
+
+def main():
+    """
+    Stream a mix of every workload from producer to consumer processes,
+    once through a SharedRing and once by pickling Transactions over
+    multiprocessing.Queue.
+    """
+    num_producers = 2
+    num_consumers = 2
+    num_txn = 50000
+    names = workloads.names()
+
+    # Extra space for formatting
+    print()
+    print(f"Streaming {num_producers * num_txn} transactions from {num_producers} producers to {num_consumers} consumers")
+    print(f"{'transport':<20}{'seconds':>10}{'txn/s':>11}")
+
+    ring = SharedRing(capacity=4096, num_consumers=num_consumers)
+    results = multiprocessing.Queue()
+    barrier = multiprocessing.Barrier(num_producers + 1)
+    consumers = [multiprocessing.Process(target=_consume_ring, args=(ring.name, ring.lock, i, results)) for i in range(num_consumers)]
+    producers = [multiprocessing.Process(target=_produce_ring, args=(ring.name, ring.lock, barrier, names, num_txn, seed)) for seed in range(num_producers)]
+    for process in consumers + producers:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for process in producers:
+        process.join()
+    ring.close_writer()
+    counts = sorted(results.get() for _ in consumers)
+    for process in consumers:
+        process.join()
+    elapsed = time.perf_counter() - start
+    print(f"{'shared-memory ring':<20}{elapsed:>10.3f}{num_producers * num_txn / elapsed:>11.0f}")
+    ring.close()
+    ring.unlink()
+
+    queues = [multiprocessing.Queue(maxsize=4096) for _ in range(num_consumers)]
+    barrier = multiprocessing.Barrier(num_producers + 1)
+    consumers = [multiprocessing.Process(target=_consume_queue, args=(queue, num_producers)) for queue in queues]
+    producers = [multiprocessing.Process(target=_produce_queue, args=(queues, barrier, names, num_txn, seed)) for seed in range(num_producers)]
+    for process in consumers + producers:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for process in producers + consumers:
+        process.join()
+    elapsed = time.perf_counter() - start
+    print(f"{'multiprocessing.Queue':<20}{elapsed:>10.3f}{num_producers * num_txn / elapsed:>11.0f}")
+
+    for consumer, txns, ops in counts:
+        print(f"consumer {consumer}: {txns} txns, {ops} ops")
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -3,33 +3,44 @@
 # Look for ActiveRecord::Base.transaction to find transaction blocks.
 # Total of 10 transactions
 
-import numpy as np
+from rng import np
 from transaction import Transaction
 
 class Order:
+    __slots__ = ("order_id", "variant_id", "quantity")
+
     def __init__(self):
-        self.order_id = np.random.randint(1, 100)
-        self.variant_id = np.random.randint(1, 50)
-        self.quantity = np.random.randint(1, 10)
+        self.order_id = int(np.random.randint(1, 100))
+        self.variant_id = int(np.random.randint(1, 50))
+        self.quantity = int(np.random.randint(1, 10))
 
 class LineItem:
+    __slots__ = ("id", "quantity", "exists")
+
     def __init__(self):
-        self.id = np.random.randint(1, 50)
-        self.quantity = np.random.randint(1, 10)
-        self.exists: bool = np.random.binomial(1, 0.9) 
+        self.id = int(np.random.randint(1, 50))
+        self.quantity = int(np.random.randint(1, 10))
+        self.exists: int = int(np.random.binomial(1, 0.9))
 
 class StockItem:
-    def __init__(self):
-        self.id = np.random.randint(1, 500)
-        self.count_on_hand = np.random.randint(0, 10) # We assume count_on_hand is relatively small otherwise BackorderedUnit would already be fulfilled 
+    __slots__ = ("id", "count_on_hand")
+
+    def __init__(self, state=None):
+        self.id = int(np.random.randint(1, 500))
+        if state is not None:
+            self.count_on_hand = state.stock_count_on_hand.get(self.id)
+        else:
+            self.count_on_hand = int(np.random.randint(0, 10)) # We assume count_on_hand is relatively small otherwise BackorderedUnit would already be fulfilled 
 
 class BackorderedUnit:
-    def __init__(self, quantity = np.random.randint(1, 10)):
-        self.id = np.random.randint(1, 500)
-        self.quantity = quantity
+    __slots__ = ("id", "quantity")
+
+    def __init__(self, quantity=None):
+        self.id = int(np.random.randint(1, 500))
+        self.quantity = int(np.random.randint(1, 10)) if quantity is None else int(quantity)
 
 ### Transaction 1 (Transaction 5 from Tang et al.) ###
-def spree_adjustment_update_generator(adjustment: dict) -> Transaction:
+def spree_adjustment_update_generator(adjustment: dict, new_transaction=Transaction) -> Transaction:
     """
     Validation-based transaction.
     Purpose: Coordinate concurrent checkout.
@@ -47,7 +58,7 @@ def spree_adjustment_update_generator(adjustment: dict) -> Transaction:
             UPDATE promotions SET updated_at WHERE id = source.promotion_id
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
 
     # Read lock on the adjustment
     t.append_read(f"adjustment-id({adjustment['id']})")
@@ -64,6 +75,22 @@ def spree_adjustment_update_generator(adjustment: dict) -> Transaction:
 
     return t
 
+def spree_adjustment_update_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as spree_adjustment_update_sim.
+    """
+    for _ in range(num_txn):
+        source_id = np.random.randint(1, 100)
+        if np.random.rand() < 0.2:
+            source_id = None
+        adjustment = {
+            "id": np.random.randint(1, 100),
+            "state": np.random.choice(["open", "closed"], p=[0.7, 0.3]),
+            "source_id": source_id,
+            "source_type": np.random.choice(["Spree::PromotionAction", "OtherType"], p=[0.3, 0.7])
+        }
+        yield spree_adjustment_update_generator(adjustment, new_transaction=new_transaction)
+
 def spree_adjustment_update_sim(num_txn: int):
     """
     Example output:
@@ -79,21 +106,11 @@ def spree_adjustment_update_sim(num_txn: int):
     ['r-adjustment-id(2)', "w-promotion-id(55)-fields(['amount', 'updated_at', 'eligible'])", 'w-adjustment-id(2)']
     ['r-adjustment-id(52)', 'w-adjustment-id(52)']
     """
-    for _ in range(num_txn):
-        source_id = np.random.randint(1, 100)
-        if np.random.rand() < 0.2:
-            source_id = None
-        adjustment = {
-            "id": np.random.randint(1, 100),
-            "state": np.random.choice(["open", "closed"], p=[0.7, 0.3]),
-            "source_id": source_id,
-            "source_type": np.random.choice(["Spree::PromotionAction", "OtherType"], p=[0.3, 0.7])
-        }
-        result = spree_adjustment_update_generator(adjustment)
+    for result in spree_adjustment_update_stream(num_txn):
         print(result)
 
 ### Transaction 2 (Transaction 4 from Tang et al.) ###
-def spree_checkout_controller_generator(order_id: int, input_data: dict) -> Transaction:
+def spree_checkout_controller_generator(order_id: int, input_data: dict, new_transaction=Transaction) -> Transaction:
     """
     Transaction 4.
     Validation-based transaction.
@@ -115,7 +132,7 @@ def spree_checkout_controller_generator(order_id: int, input_data: dict) -> Tran
     TRANSACTION COMMIT
     """
 
-    t = Transaction()
+    t = new_transaction()
     
     t.append_read(f"lock_version-order_id({order_id})")  # Read current lock version
     input_version = input_data["state_lock_version"]
@@ -128,6 +145,17 @@ def spree_checkout_controller_generator(order_id: int, input_data: dict) -> Tran
 
     return t
 
+def spree_checkout_controller_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as spree_checkout_controller_sim.
+    """
+    for _ in range(num_txn):
+        order_id = np.random.randint(1, 100)
+        input_data = {
+            "state_lock_version": np.random.binomial(1, 0.8)
+        }
+        yield spree_checkout_controller_generator(order_id, input_data, new_transaction=new_transaction)
+
 def spree_checkout_controller_sim(num_txn: int):
     """
     Example output:
@@ -143,12 +171,7 @@ def spree_checkout_controller_sim(num_txn: int):
     ['r-lock_version-order_id(16)', 'w-order(16)', 'w-last_ip_addr(0.0.0.0)', 'w-lock_version(1)']
     ['r-lock_version-order_id(13)']
     """
-    for _ in range(num_txn):
-        order_id = np.random.randint(1, 100)
-        input_data = {
-            "state_lock_version": np.random.binomial(1, 0.8)
-        }
-        result = spree_checkout_controller_generator(order_id, input_data)
+    for result in spree_checkout_controller_stream(num_txn):
         print(result)
 
 ### Transaction 3 ###
@@ -162,6 +185,7 @@ def spree_fulfillment_changer_generator(
         new_on_hand_quantity: int,
         order_state: str,
         p: float,
+        new_transaction=Transaction,
     ) -> Transaction:
     """
     https://github.com/spree/spree/blob/249aa157ab33d94cffff779d66039c1b4580f6f4/core/app/models/spree/fulfilment_changer.rb#L41C5-L51C1
@@ -203,10 +227,10 @@ def spree_fulfillment_changer_generator(
 
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
 
     # Read current quantity in current shipment
-    t.append_read(f"shipment_id-backordered({current_shipment_id})")
+    t.append_predicate_read("inventory_units", "shipment_id", values=[current_shipment_id])
 
     # Conditionally update stock counts
     if order_state == "complete" and current_stock_location_id != desired_stock_location_id:
@@ -215,18 +239,18 @@ def spree_fulfillment_changer_generator(
 
     # Desired shipment on_hand unit update
     if p > 0.5: # Simulate a find_or_create
-        t.append_read(f"on_hand_unit-shipment({desired_shipment_id})")
+        t.append_predicate_read("inventory_units", "shipment_id", values=[desired_shipment_id])
     else:
-        t.append_write(f"on_hand_unit-shipment({desired_shipment_id})")
+        t.append_insert("inventory_units", shipment_id=desired_shipment_id, state="on_hand")
     t.append_write(f"add_on_hand_quantity({new_on_hand_quantity})")
 
     # Desired shipment backordered update (if needed)
     backorder_qty = current_on_hand_quantity - new_on_hand_quantity
     if backorder_qty > 0:
         if p > 0.5: # Simulate a find_or_create
-            t.append_read(f"backordered_unit-shipment({desired_shipment_id})")
+            t.append_predicate_read("inventory_units", "shipment_id", values=[desired_shipment_id])
         else:
-            t.append_write(f"backordered_unit-shipment({desired_shipment_id})")
+            t.append_insert("inventory_units", shipment_id=desired_shipment_id, state="backordered")
         t.append_write(f"add_backordered_quantity({backorder_qty})")
 
     # Reduce current shipment units
@@ -237,20 +261,9 @@ def spree_fulfillment_changer_generator(
 
     return t
 
-def spree_fulfillment_changer_sim(num_txn: int):
+def spree_fulfillment_changer_stream(num_txn: int, new_transaction=Transaction):
     """
-    Example output:
-
-    ['r-shipment_id-backordered(40)', 'r-on_hand_unit-shipment(25)', 'w-add_on_hand_quantity(96)', 'w-reduce_backordered_quantity(-39)', 'w-reduce_on_hand_quantity(96)']
-    ['r-shipment_id-backordered(30)', 'r-on_hand_unit-shipment(96)', 'w-add_on_hand_quantity(30)', 'r-backordered_unit-shipment(96)', 'w-add_backordered_quantity(69)', 'w-reduce_backordered_quantity(69)', 'w-reduce_on_hand_quantity(30)']
-    ['r-shipment_id-backordered(36)', 'w-restock_current_quantity(3)', 'w-unstock_desired_quantity(96)', 'r-on_hand_unit-shipment(56)', 'w-add_on_hand_quantity(18)', 'w-reduce_backordered_quantity(-15)', 'w-reduce_on_hand_quantity(18)']
-    ['r-shipment_id-backordered(36)', 'w-restock_current_quantity(71)', 'w-unstock_desired_quantity(60)', 'w-on_hand_unit-shipment(48)', 'w-add_on_hand_quantity(54)', 'w-backordered_unit-shipment(48)', 'w-add_backordered_quantity(17)', 'w-reduce_backordered_quantity(17)', 'w-reduce_on_hand_quantity(54)']
-    ['r-shipment_id-backordered(85)', 'r-on_hand_unit-shipment(35)', 'w-add_on_hand_quantity(39)', 'r-backordered_unit-shipment(35)', 'w-add_backordered_quantity(38)', 'w-reduce_backordered_quantity(38)', 'w-reduce_on_hand_quantity(39)']
-    ['r-shipment_id-backordered(36)', 'w-on_hand_unit-shipment(42)', 'w-add_on_hand_quantity(35)', 'w-reduce_backordered_quantity(-6)', 'w-reduce_on_hand_quantity(35)']
-    ['r-shipment_id-backordered(49)', 'w-restock_current_quantity(77)', 'w-unstock_desired_quantity(90)', 'w-on_hand_unit-shipment(11)', 'w-add_on_hand_quantity(2)', 'w-backordered_unit-shipment(11)', 'w-add_backordered_quantity(75)', 'w-reduce_backordered_quantity(75)', 'w-reduce_on_hand_quantity(2)']
-    ['r-shipment_id-backordered(14)', 'w-on_hand_unit-shipment(92)', 'w-add_on_hand_quantity(7)', 'w-backordered_unit-shipment(92)', 'w-add_backordered_quantity(35)', 'w-reduce_backordered_quantity(35)', 'w-reduce_on_hand_quantity(7)']
-    ['r-shipment_id-backordered(63)', 'w-on_hand_unit-shipment(39)', 'w-add_on_hand_quantity(33)', 'w-reduce_backordered_quantity(-5)', 'w-reduce_on_hand_quantity(33)']
-    ['r-shipment_id-backordered(59)', 'w-restock_current_quantity(17)', 'w-unstock_desired_quantity(74)', 'r-on_hand_unit-shipment(36)', 'w-add_on_hand_quantity(20)', 'w-reduce_backordered_quantity(-3)', 'w-reduce_on_hand_quantity(20)']
+    Yield num_txn transactions sampled the same way as spree_fulfillment_changer_sim.
     """
     for _ in range(num_txn):
         current_shipment_id = np.random.randint(1, 100)
@@ -273,11 +286,30 @@ def spree_fulfillment_changer_sim(num_txn: int):
             new_on_hand_quantity,
             order_state,
             p,
+            new_transaction=new_transaction,
         )
+        yield result
+
+def spree_fulfillment_changer_sim(num_txn: int):
+    """
+    Example output:
+
+    ['r-inventory_units(shipment_id=40)', 'r-inventory_units(shipment_id=25)', 'w-add_on_hand_quantity(96)', 'w-reduce_backordered_quantity(-39)', 'w-reduce_on_hand_quantity(96)']
+    ['r-inventory_units(shipment_id=30)', 'r-inventory_units(shipment_id=96)', 'w-add_on_hand_quantity(30)', 'r-inventory_units(shipment_id=96)', 'w-add_backordered_quantity(69)', 'w-reduce_backordered_quantity(69)', 'w-reduce_on_hand_quantity(30)']
+    ['r-inventory_units(shipment_id=36)', 'w-restock_current_quantity(3)', 'w-unstock_desired_quantity(96)', 'r-inventory_units(shipment_id=56)', 'w-add_on_hand_quantity(18)', 'w-reduce_backordered_quantity(-15)', 'w-reduce_on_hand_quantity(18)']
+    ['r-inventory_units(shipment_id=36)', 'w-restock_current_quantity(71)', 'w-unstock_desired_quantity(60)', 'w-inventory_units(shipment_id=48, state=on_hand)', 'w-add_on_hand_quantity(54)', 'w-inventory_units(shipment_id=48, state=backordered)', 'w-add_backordered_quantity(17)', 'w-reduce_backordered_quantity(17)', 'w-reduce_on_hand_quantity(54)']
+    ['r-inventory_units(shipment_id=85)', 'r-inventory_units(shipment_id=35)', 'w-add_on_hand_quantity(39)', 'r-inventory_units(shipment_id=35)', 'w-add_backordered_quantity(38)', 'w-reduce_backordered_quantity(38)', 'w-reduce_on_hand_quantity(39)']
+    ['r-inventory_units(shipment_id=36)', 'w-inventory_units(shipment_id=42, state=on_hand)', 'w-add_on_hand_quantity(35)', 'w-reduce_backordered_quantity(-6)', 'w-reduce_on_hand_quantity(35)']
+    ['r-inventory_units(shipment_id=49)', 'w-restock_current_quantity(77)', 'w-unstock_desired_quantity(90)', 'w-inventory_units(shipment_id=11, state=on_hand)', 'w-add_on_hand_quantity(2)', 'w-inventory_units(shipment_id=11, state=backordered)', 'w-add_backordered_quantity(75)', 'w-reduce_backordered_quantity(75)', 'w-reduce_on_hand_quantity(2)']
+    ['r-inventory_units(shipment_id=14)', 'w-inventory_units(shipment_id=92, state=on_hand)', 'w-add_on_hand_quantity(7)', 'w-inventory_units(shipment_id=92, state=backordered)', 'w-add_backordered_quantity(35)', 'w-reduce_backordered_quantity(35)', 'w-reduce_on_hand_quantity(7)']
+    ['r-inventory_units(shipment_id=63)', 'w-inventory_units(shipment_id=39, state=on_hand)', 'w-add_on_hand_quantity(33)', 'w-reduce_backordered_quantity(-5)', 'w-reduce_on_hand_quantity(33)']
+    ['r-inventory_units(shipment_id=59)', 'w-restock_current_quantity(17)', 'w-unstock_desired_quantity(74)', 'r-inventory_units(shipment_id=36)', 'w-add_on_hand_quantity(20)', 'w-reduce_backordered_quantity(-3)', 'w-reduce_on_hand_quantity(20)']
+    """
+    for result in spree_fulfillment_changer_stream(num_txn):
         print(result)
 
 ### Transaction 4 ###
-def spree_remove_line_item_generator(order: Order, line_item: LineItem) -> Transaction:
+def spree_remove_line_item_generator(order: Order, line_item: LineItem, new_transaction=Transaction) -> Transaction:
     """
     https://github.com/spree/spree/blob/249aa157ab33d94cffff779d66039c1b4580f6f4/core/app/services/spree/cart/remove_item.rb#L10
     remove_from_line_item
@@ -298,7 +330,7 @@ def spree_remove_line_item_generator(order: Order, line_item: LineItem) -> Trans
 
     TRANSACTION COMMIT
     """
-    t = Transaction()
+    t = new_transaction()
 
     # Read lock on the line item
     t.append_read(f"order_id-variant_id({order.order_id, order.variant_id})")
@@ -315,6 +347,15 @@ def spree_remove_line_item_generator(order: Order, line_item: LineItem) -> Trans
 
     return t
 
+def spree_remove_line_item_stream(num_txn: int, new_transaction=Transaction):
+    """
+    Yield num_txn transactions sampled the same way as spree_remove_line_item_sim.
+    """
+    for _ in range(num_txn):
+        order = Order()
+        line_item = LineItem()
+        yield spree_remove_line_item_generator(order, line_item, new_transaction=new_transaction)
+
 def spree_remove_line_item_sim(num_txn: int):
     """
     Example output:
@@ -330,14 +371,11 @@ def spree_remove_line_item_sim(num_txn: int):
     ['r-order_id-variant_id((27, 27))']
 
     """
-    for _ in range(num_txn):
-        order = Order()
-        line_item = LineItem()
-        result = spree_remove_line_item_generator(order, line_item)
+    for result in spree_remove_line_item_stream(num_txn):
         print(result)
 
 ### Transaction 5 (Transaction 10 from Tang et al.) ###
-def spree_stock_item_update_generator(value: int, stock_item: StockItem, backordered_units: list[BackorderedUnit]) -> Transaction:
+def spree_stock_item_update_generator(value: int, stock_item: StockItem, backordered_units: list[BackorderedUnit], state=None, new_transaction=Transaction) -> Transaction:
     """
     Transaction 10.
     Lock-based transaction.
@@ -376,8 +414,11 @@ def spree_stock_item_update_generator(value: int, stock_item: StockItem, backord
     UPDATE stock_items SET count_on_hand = new_count WHERE id = stock_item.id
 
     TRANSACTION COMMIT
+
+    If a DatabaseState is given, the new count is written back to its
+    stock_count_on_hand table.
     """
-    t = Transaction()
+    t = new_transaction()
 
     # Read the stock item
     t.append_read(f"stock_item_id, count_on_hand({stock_item.id, stock_item.count_on_hand})")
@@ -407,29 +448,37 @@ def spree_stock_item_update_generator(value: int, stock_item: StockItem, backord
 
     # Update the stock item count
     t.append_write(f"stock_item_new_count({new_count})")
+    if state is not None:
+        state.stock_count_on_hand.set(stock_item.id, new_count)
 
     return t
 
-def spree_stock_item_update_sim(num_txn: int):
+def spree_stock_item_update_stream(num_txn: int, state=None, new_transaction=Transaction):
     """
-    Example output:
-
-    ['r-stock_item_id, count_on_hand((487, 8))', 'r-backordered_units_num(1)', 'w-fulfilled_backordered_unit_count(3)', 'w-stock_item_new_count(82)']
-    ['r-stock_item_id, count_on_hand((252, 1))', 'r-backordered_units_num(4)', 'w-fulfilled_backordered_unit_count(3)', 'w-split_unit_id(333)', 'w-backordered_unit_new_count(2)', 'w-fulfilled_split_unit_count(3)']
-    ['r-stock_item_id, count_on_hand((306, 2))', 'r-backordered_units_num(1)', 'w-fulfilled_backordered_unit_count(3)', 'w-stock_item_new_count(39)']
-    ['r-stock_item_id, count_on_hand((169, 4))', 'r-backordered_units_num(1)', 'w-fulfilled_backordered_unit_count(3)', 'w-stock_item_new_count(23)']
-    ['r-stock_item_id, count_on_hand((290, 3))', 'r-backordered_units_num(0)', 'w-stock_item_new_count(33)']
-    ['r-stock_item_id, count_on_hand((97, 4))', 'r-backordered_units_num(0)', 'w-stock_item_new_count(74)']
-    ['r-stock_item_id, count_on_hand((313, 4))', 'r-backordered_units_num(2)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-stock_item_new_count(71)']
-    ['r-stock_item_id, count_on_hand((267, 2))', 'r-backordered_units_num(4)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-stock_item_new_count(14)']
-    ['r-stock_item_id, count_on_hand((264, 2))', 'r-backordered_units_num(2)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-stock_item_new_count(24)']
-    ['r-stock_item_id, count_on_hand((40, 6))', 'r-backordered_units_num(4)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-stock_item_new_count(69)']
+    Yield num_txn transactions sampled the same way as spree_stock_item_update_sim.
     """
     for _ in range(num_txn):
         value = np.random.randint(0, 100)
-        stock_item = StockItem()
+        stock_item = StockItem(state)
         backordered_units = [BackorderedUnit() for _ in range(np.random.randint(0, 5))]
-        result = spree_stock_item_update_generator(value, stock_item, backordered_units)
+        yield spree_stock_item_update_generator(value, stock_item, backordered_units, state, new_transaction=new_transaction)
+
+def spree_stock_item_update_sim(num_txn: int, state=None):
+    """
+    Example output:
+
+    ['r-stock_item_id, count_on_hand((48, 5))', 'r-backordered_units_num(0)', 'w-stock_item_new_count(49)']
+    ['r-stock_item_id, count_on_hand((252, 3))', 'r-backordered_units_num(1)', 'w-fulfilled_backordered_unit_count(6)', 'w-stock_item_new_count(70)']
+    ['r-stock_item_id, count_on_hand((88, 6))', 'r-backordered_units_num(0)', 'w-stock_item_new_count(42)']
+    ['r-stock_item_id, count_on_hand((397, 1))', 'r-backordered_units_num(0)', 'w-stock_item_new_count(89)']
+    ['r-stock_item_id, count_on_hand((166, 9))', 'r-backordered_units_num(0)', 'w-stock_item_new_count(90)']
+    ['r-stock_item_id, count_on_hand((405, 3))', 'r-backordered_units_num(0)', 'w-stock_item_new_count(12)']
+    ['r-stock_item_id, count_on_hand((336, 0))', 'r-backordered_units_num(2)', 'w-fulfilled_backordered_unit_count(9)', 'w-fulfilled_backordered_unit_count(4)', 'w-stock_item_new_count(69)']
+    ['r-stock_item_id, count_on_hand((148, 3))', 'r-backordered_units_num(0)', 'w-stock_item_new_count(32)']
+    ['r-stock_item_id, count_on_hand((266, 9))', 'r-backordered_units_num(0)', 'w-stock_item_new_count(74)']
+    ['r-stock_item_id, count_on_hand((203, 4))', 'r-backordered_units_num(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(3)', 'w-fulfilled_backordered_unit_count(1)', 'w-stock_item_new_count(35)']
+    """
+    for result in spree_stock_item_update_stream(num_txn, state):
         print(result)
 
 
@@ -0,0 +1,227 @@
+"""
+Stateful, array-backed database model for the transaction simulators.
+
+By default every generator invents the values it reads (e.g. a fresh
+StockItem.count_on_hand per call), so writes such as stock_item_new_count
+never reflect earlier transactions. A DatabaseState keeps one NumPy array
+per simulated table so that generators which are handed a state read the
+accumulated values, branch on them, and write their effects back.
+
+Updates are buffered per table as (index, delta) pairs and applied in
+vectorized batches with np.add.at. A table is flushed when its buffer is
+full or right before it is read, so reads always observe every earlier
+write while write-only streams (e.g. poll tallies) stay batched.
+
+Example usage:
+>>> from broadleaf import find_next_id
+>>> state = DatabaseState()
+>>> print(find_next_id(7, None, state))
+['r-id(7)', 'w-id(7)', 'w-id(7)']
+>>> print(find_next_id(7, None, state))
+['r-id(7)', 'w-id(7)']
+>>> state.next_id.get(7)
+3
+
+Counters only decrease when the row can afford it, as in the
+applications, so they never go negative:
+>>> from broadleaf import decrement_sku
+>>> state = DatabaseState(num_skus=2, initial_sku_quantity=3)
+>>> print(decrement_sku([0, 0, 1], None, state))
+['r-quantity(0, 1)', 'w-quantity(0, 1)']
+>>> print(decrement_sku([0, 0, 1], None, state))
+['r-quantity(0, 1)']
+>>> state.sku_quantity.values.tolist()
+[1, 2]
+"""
+
+import numpy as np
+
+
+class Table:
+    """
+    A single simulated table stored as a NumPy array.
+
+    Example usage:
+    >>> t = Table("tallies", np.zeros((2, 3), dtype=np.int64))
+    >>> t.add((1, 2), 5)
+    >>> t.add((1, 2), 1)
+    >>> t.get((1, 2))
+    6
+    >>> t.get_many((np.array([1, 1]), np.array([0, 2]))).tolist()
+    [0, 6]
+    >>> t.add_many(np.array([0, 0]), np.array([1, 2]))
+    >>> t.values[0].tolist()
+    [3, 0, 0]
+    """
+    def __init__(self, name: str, values: np.ndarray, batch_size: int = 4096):
+        """
+        values holds the initial contents of the table. Single-row
+        updates are buffered until batch_size of them are pending.
+        """
+        self.name = name
+        self.values = values
+        self.flat = values.reshape(-1)
+        self.batch_size = batch_size
+        self.pending_idx = []
+        self.pending_delta = []
+
+    def _flat_index(self, idx) -> int:
+        """
+        Convert a row index (an int, or a tuple for 2-D tables) into an
+        index into the flattened array.
+        """
+        if isinstance(idx, tuple):
+            return int(np.ravel_multi_index(idx, self.values.shape))
+        return int(idx)
+
+    def get(self, idx):
+        """
+        Return the current value at idx, including all buffered updates.
+        """
+        if self.pending_idx:
+            self.flush()
+        return self.flat[self._flat_index(idx)].item()
+
+    def get_many(self, idx) -> np.ndarray:
+        """
+        Return the current values at an array of row indexes (a tuple of
+        arrays for 2-D tables), including all buffered updates.
+        """
+        if self.pending_idx:
+            self.flush()
+        if isinstance(idx, tuple):
+            idx = np.ravel_multi_index(idx, self.values.shape)
+        return self.flat[idx]
+
+    def set(self, idx, value):
+        """
+        Overwrite the value at idx.
+        """
+        if self.pending_idx:
+            self.flush()
+        self.flat[self._flat_index(idx)] = value
+
+    def add(self, idx, delta=1):
+        """
+        Buffer an increment of delta at idx.
+        """
+        self.pending_idx.append(self._flat_index(idx))
+        self.pending_delta.append(delta)
+        if len(self.pending_idx) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, idx, delta):
+        """
+        Apply a whole batch of increments at once. idx is an array of row
+        indexes (a tuple of arrays for 2-D tables) and delta is either a
+        scalar or an array with one entry per index. Repeated indexes
+        accumulate.
+        """
+        if self.pending_idx:
+            self.flush()
+        if isinstance(idx, tuple):
+            idx = np.ravel_multi_index(idx, self.values.shape)
+        np.add.at(self.flat, idx, delta)
+
+    def flush(self):
+        """
+        Apply all buffered updates with a single vectorized np.add.at call.
+        """
+        if not self.pending_idx:
+            return
+        np.add.at(self.flat, np.asarray(self.pending_idx), np.asarray(self.pending_delta, dtype=self.flat.dtype))
+        self.pending_idx = []
+        self.pending_delta = []
+
+
+class DatabaseState:
+    """
+    Collection of the tables shared by the stateful generators.
+
+    Table sizes default to the id ranges used by the *_sim drivers:
+        stock_count_on_hand   spree stock items, indexed by stock item id
+        sku_quantity          broadleaf sku quantity_available, by sku id
+        stock_quantity        saleor warehouse stock quantity, by stock id
+        voucher_usage_limit   saleor voucher usage limits, by voucher id
+        voucher_single_use    saleor voucher single_use flag (0/1)
+        code_used             saleor voucher code usage, by voucher code
+        code_is_active        saleor voucher code active flag (0/1)
+        code_voucher_id       saleor voucher id each code belongs to
+        poll_tallies          mastodon cached tallies, by (poll id, choice)
+        next_id               broadleaf next id per id type (0 = no row yet)
+        id_batch_remaining    broadleaf ids left in the current batch
+
+    Initial values are drawn from the same distributions the stateless
+    generators use, so a fresh state looks like a single stateless call.
+
+    Example usage:
+    >>> state = DatabaseState()
+    >>> state.allocate_id(7, batch_size=2)
+    1
+    >>> state.allocate_id(7, batch_size=2)
+    2
+    >>> state.next_id.get(7)
+    3
+    """
+    def __init__(self,
+                 num_stock_items: int = 500,
+                 num_skus: int = 100,
+                 num_stocks: int = 100,
+                 num_vouchers: int = 100,
+                 num_voucher_codes: int = 100,
+                 num_polls: int = 200,
+                 num_choices: int = 100,
+                 num_id_types: int = 100,
+                 initial_sku_quantity: int = 100,
+                 batch_size: int = 4096):
+        self.stock_count_on_hand = Table("stock_count_on_hand", np.random.randint(0, 10, size=num_stock_items).astype(np.int64), batch_size)
+        self.sku_quantity = Table("sku_quantity", np.full(num_skus, initial_sku_quantity, dtype=np.int64), batch_size)
+        self.stock_quantity = Table("stock_quantity", np.random.randint(1, 100, size=num_stocks).astype(np.int64), batch_size)
+
+        usage_limit = np.random.normal(5, 1, size=num_vouchers).astype(np.int64)
+        self.voucher_usage_limit = Table("voucher_usage_limit", usage_limit, batch_size)
+        self.voucher_single_use = Table("voucher_single_use", np.random.binomial(1, 0.5, size=num_vouchers).astype(np.int64), batch_size)
+        self.code_used = Table("code_used", np.random.randint(0, 10, size=num_voucher_codes).astype(np.int64), batch_size)
+        self.code_is_active = Table("code_is_active", np.ones(num_voucher_codes, dtype=np.int64), batch_size)
+        self.code_voucher_id = Table("code_voucher_id", np.random.randint(1, num_vouchers, size=num_voucher_codes).astype(np.int64), batch_size)
+
+        self.poll_tallies = Table("poll_tallies", np.zeros((num_polls, num_choices), dtype=np.int64), batch_size)
+
+        self.next_id = Table("next_id", np.zeros(num_id_types, dtype=np.int64), batch_size)
+        self.id_batch_remaining = Table("id_batch_remaining", np.zeros(num_id_types, dtype=np.int64), batch_size)
+
+    def tables(self) -> list[Table]:
+        """
+        Return every table held by this state.
+        """
+        return [value for value in vars(self).values() if isinstance(value, Table)]
+
+    def flush(self):
+        """
+        Apply the buffered updates of every table.
+        """
+        for table in self.tables():
+            table.flush()
+
+    def allocate_id(self, id_type: int, batch_size: int = None) -> int:
+        """
+        Hand out the next id for id_type, mirroring broadleaf's
+        IdGenerationServiceImpl: a missing row is created with a fresh
+        batch, then nextId is incremented and the batch shrinks by one.
+        """
+        if self.next_id.get(id_type) == 0:
+            self.next_id.set(id_type, 1)
+            self.id_batch_remaining.set(id_type, batch_size or 50)
+        elif self.id_batch_remaining.get(id_type) == 0:
+            self.id_batch_remaining.set(id_type, batch_size or 50)
+        allocated = self.next_id.get(id_type)
+        self.next_id.add(id_type, 1)
+        self.id_batch_remaining.add(id_type, -1)
+        return allocated
+
+    def snapshot(self) -> dict[str, np.ndarray]:
+        """
+        Return a copy of every table, keyed by table name.
+        """
+        self.flush()
+        return {table.name: table.values.copy() for table in self.tables()}
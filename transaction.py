@@ -1,4 +1,213 @@
+import bisect
+from rng import np
 
+class KeySet:
+    """
+    Rows of one table accessed by a single bulk operation, either as a
+    sorted tuple of unique integer ids or as the half-open id range
+    [start, stop). Its string form, the key used in traces, is
+    "table(1, 5, 9)" or "table(10:20)". Membership and intersection tests
+    use bisection and set intersection, so a 1000-row bulk update stays
+    one operation and building one never imports NumPy; only contains()
+    takes arrays.
+
+    Example usage:
+    >>> a = KeySet("stock", [34, 13, 8, 13])
+    >>> str(a), len(a), 13 in a
+    ('stock(8, 13, 34)', 3, True)
+    >>> b = KeySet.range("stock", 10, 20)
+    >>> str(b), a.intersects(b), str(a.intersection(b))
+    ('stock(10:20)', True, 'stock(13)')
+    >>> KeySet.parse("stock(13)").intersects(a), KeySet.parse("cached_tallies(124, 72)")
+    (True, None)
+    >>> KeySet.range("stock", 3, 5).rows()
+    ['stock(3)', 'stock(4)']
+    """
+    __slots__ = ("table", "ids", "start", "stop")
+
+    def __init__(self, table: str, ids=None, start: int = 0, stop: int = 0):
+        """
+        A set of ids if ids is given (duplicates are dropped), otherwise
+        the range [start, stop). For sets, start and stop bound the ids.
+        """
+        self.table = table
+        if ids is None:
+            self.ids = None
+            self.start = int(start)
+            self.stop = max(int(start), int(stop))
+        else:
+            self.ids = tuple(sorted({int(i) for i in ids}))
+            if self.ids:
+                self.start, self.stop = int(self.ids[0]), int(self.ids[-1]) + 1
+            else:
+                self.start = self.stop = 0
+
+    @classmethod
+    def range(cls, table: str, start: int, stop: int) -> "KeySet":
+        return cls(table, start=start, stop=stop)
+
+    @classmethod
+    def parse(cls, key: str) -> "KeySet":
+        """
+        Return the one-row KeySet of a single-row trace key such as
+        "stock(13)", or None for any other key. Bulk operations are only
+        known from the KeySets a Transaction recorded: a composite key
+        such as "cached_tallies(124, 72)" names one row, not two.
+        """
+        table, _, rest = key.partition("(")
+        if not rest.endswith(")"):
+            return None
+        try:
+            return cls(table, [int(rest[:-1])])
+        except ValueError:
+            return None
+
+    def rows(self) -> list[str]:
+        """
+        Single-row trace keys of the rows in this set.
+        """
+        ids = range(self.start, self.stop) if self.ids is None else self.ids
+        return [f"{self.table}({i})" for i in ids]
+
+    def __len__(self) -> int:
+        return self.stop - self.start if self.ids is None else len(self.ids)
+
+    def __str__(self):
+        if self.ids is None:
+            return f"{self.table}({self.start}:{self.stop})"
+        return f"{self.table}({', '.join(map(str, self.ids))})"
+
+    def __repr__(self):
+        return f"KeySet({self})"
+
+    def contains(self, ids) -> "np.ndarray":
+        """
+        Boolean mask of which of an array of ids are in this set.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        mask = (ids >= self.start) & (ids < self.stop)
+        if self.ids:
+            members = np.array(self.ids, dtype=np.int64)
+            positions = np.minimum(np.searchsorted(members, ids), len(members) - 1)
+            mask &= members[positions] == ids
+        return mask
+
+    def __contains__(self, key_id: int) -> bool:
+        if not self.start <= key_id < self.stop:
+            return False
+        if self.ids is None:
+            return True
+        position = bisect.bisect_left(self.ids, key_id)
+        return position < len(self.ids) and self.ids[position] == key_id
+
+    def intersection(self, other: "KeySet") -> "KeySet":
+        """
+        Rows in both sets, as a KeySet of this table.
+        """
+        if self.table != other.table:
+            return KeySet(self.table, [])
+        if self.ids is None and other.ids is None:
+            return KeySet.range(self.table, max(self.start, other.start), min(self.stop, other.stop))
+        if self.ids is None:
+            return KeySet(self.table, [i for i in other.ids if i in self])
+        if other.ids is None:
+            return KeySet(self.table, [i for i in self.ids if i in other])
+        return KeySet(self.table, set(self.ids).intersection(other.ids))
+
+    def intersects(self, other: "KeySet") -> bool:
+        """
+        Whether the two sets share a row.
+        """
+        if self.table != other.table or self.start >= other.stop or other.start >= self.stop:
+            return False
+        if self.ids is None and other.ids is None:
+            return True
+        return len(self.intersection(other)) > 0
+
+def _overlap(keysets: tuple, keys: set, other_keysets: tuple) -> bool:
+    """
+    Whether any of keysets shares a row with one of other_keysets or with
+    one of the single keys in keys.
+    """
+    for keyset in keysets:
+        if any(keyset.intersects(other) for other in other_keysets):
+            return True
+        prefix = keyset.table + "("
+        for key in keys:
+            if key.startswith(prefix):
+                single = KeySet.parse(key)
+                if single is not None and keyset.intersects(single):
+                    return True
+    return False
+
+class Predicate:
+    """
+    The rows of a table selected by a condition on one integer attribute
+    rather than by key: attribute values in any of a list of half-open
+    intervals, or every row if attribute is None. Its string form, the key
+    used in traces, is "table(attribute=3|7|10:20)" or "table(*)".
+
+    Example usage:
+    >>> p = Predicate("product", "category_id", values=[550, 79])
+    >>> str(p), p.matches("product", {"category_id": 79}), p.matches("product", {"category_id": 80})
+    ('product(category_id=79|550)', True, False)
+    >>> str(Predicate("poll")), Predicate("poll").matches("poll", {"choice": 3})
+    ('poll(*)', True)
+    """
+    __slots__ = ("table", "attribute", "intervals")
+
+    def __init__(self, table: str, attribute: str = None, values=None, start: int = None, stop: int = None):
+        """
+        Select rows whose attribute equals one of values, or lies in
+        [start, stop); with neither, or without an attribute, every row.
+        """
+        self.table = table
+        self.attribute = attribute
+        if attribute is None:
+            self.intervals = []
+        elif values is not None:
+            self.intervals = [(v, v + 1) for v in sorted({int(v) for v in values})]
+        elif start is not None:
+            self.intervals = [(int(start), int(stop))]
+        else:
+            self.attribute = None
+            self.intervals = []
+
+    def matches(self, table: str, row: dict) -> bool:
+        """
+        Whether a row with the given attribute values satisfies the
+        predicate.
+        """
+        if table != self.table:
+            return False
+        if self.attribute is None:
+            return True
+        value = row.get(self.attribute)
+        return value is not None and any(start <= value < stop for start, stop in self.intervals)
+
+    def __str__(self):
+        if self.attribute is None:
+            return f"{self.table}(*)"
+        parts = [str(start) if stop == start + 1 else f"{start}:{stop}" for start, stop in self.intervals]
+        return f"{self.table}({self.attribute}={'|'.join(parts)})"
+
+    def __repr__(self):
+        return f"Predicate({self})"
+
+def _phantom(predicates: tuple, t: "Transaction") -> bool:
+    """
+    Whether t inserts a row matching one of predicates, or writes to the
+    table of one that selects every row.
+    """
+    for predicate in predicates:
+        if any(predicate.matches(table, row) for table, row in t.inserts):
+            return True
+        if predicate.attribute is None:
+            if any(key.split("(", 1)[0] == predicate.table for key in t.write_set):
+                return True
+            if any(keyset.table == predicate.table for keyset in t.write_keysets):
+                return True
+    return False
 
 class Transaction:
     """
@@ -12,17 +221,49 @@ class Transaction:
     >>> t.append_write("apple")
     >>> print(t)
     ['r-cart0', 'w-apple']
+    >>> t.reads("cart0"), t.writes("cart0")
+    (True, False)
+    >>> u = Transaction()
+    >>> u.append_write("cart0")
+    >>> t.conflicts_with(u)
+    True
+    >>> v = Transaction()
+    >>> v.append_write_many("cart", [7, 0, 3])
+    >>> v.get_trace(), v.writes("cart(3)"), t.conflicts_with(v)
+    (['w-cart(0, 3, 7)'], True, False)
+    >>> v.rows("cart(0, 3, 7)"), t.rows("apple")
+    (['cart(0)', 'cart(3)', 'cart(7)'], ['apple'])
+    >>> w = Transaction()
+    >>> w.append_predicate_read("cart", "owner", values=[5])
+    >>> x = Transaction()
+    >>> x.append_insert("cart", owner=5, item=2)
+    >>> w.get_trace(), x.get_trace(), w.conflicts_with(x)
+    (['r-cart(owner=5)'], ['w-cart(owner=5, item=2)'], True)
     >>> t.clear()
     >>> print(t)
     []
     """
+    # Transactions are created by the million; slots avoid a per-instance __dict__
+    __slots__ = ("trace", "read_set", "write_set", "read_keysets", "write_keysets", "predicates", "inserts")
+
     def __init__(self):
         """
         Initialize transaction trace, which is stored as a Python list.
         Every read/write call is added to this list which tracks the
-        operations inside the transaction.
+        operations inside the transaction. The keys read and written are
+        also kept in read_set and write_set so that membership and
+        conflict tests never re-parse the trace. Bulk operations on many
+        rows are kept as KeySets in read_keysets and write_keysets,
+        reads by predicate in predicates and the (table, row) of inserted
+        rows in inserts.
         """
         self.trace = []
+        self.read_set = set()
+        self.write_set = set()
+        self.read_keysets = ()
+        self.write_keysets = ()
+        self.predicates = ()
+        self.inserts = ()
 
     def __str__(self):
         """
@@ -36,7 +277,9 @@ class Transaction:
         Stored as a "r-item" string where item is the argument to the
         method.
         """
-        self.trace.append(f"r-{item}")
+        key = f"{item}"
+        self.trace.append("r-" + key)
+        self.read_set.add(key)
 
     def append_write(self, item: str):
         """
@@ -44,16 +287,196 @@ class Transaction:
         Stored as a "w-item" string where item is the argument to the
         method.
         """
-        self.trace.append(f"w-{item}")
+        key = f"{item}"
+        self.trace.append("w-" + key)
+        self.write_set.add(key)
+
+    def append_read_many(self, table: str, ids):
+        """
+        Append one read of the rows of table with the given integer ids
+        (a bulk SELECT ... WHERE id IN (...)), stored as a single
+        "r-table(id, ...)" operation with sorted, unique ids.
+        """
+        keyset = KeySet(table, ids)
+        self.trace.append(f"r-{keyset}")
+        self.read_keysets += (keyset,)
+
+    def append_write_many(self, table: str, ids):
+        """
+        Append one write of the rows of table with the given integer ids,
+        stored as a single "w-table(id, ...)" operation.
+        """
+        keyset = KeySet(table, ids)
+        self.trace.append(f"w-{keyset}")
+        self.write_keysets += (keyset,)
+
+    def append_read_range(self, table: str, start: int, stop: int):
+        """
+        Append one read of the rows of table with ids in [start, stop),
+        stored as a single "r-table(start:stop)" operation.
+        """
+        keyset = KeySet.range(table, start, stop)
+        self.trace.append(f"r-{keyset}")
+        self.read_keysets += (keyset,)
+
+    def append_write_range(self, table: str, start: int, stop: int):
+        """
+        Append one write of the rows of table with ids in [start, stop),
+        stored as a single "w-table(start:stop)" operation.
+        """
+        keyset = KeySet.range(table, start, stop)
+        self.trace.append(f"w-{keyset}")
+        self.write_keysets += (keyset,)
+
+    def append_predicate_read(self, table: str, attribute: str = None, values=None, start: int = None, stop: int = None):
+        """
+        Append a read of the rows of table selected by a condition on
+        attribute (see Predicate), such as SELECT ... WHERE attribute IN
+        values, stored as a single "r-table(attribute=...)" operation.
+        Rows inserted later by other transactions can match it (phantoms).
+        """
+        predicate = Predicate(table, attribute, values, start, stop)
+        self.trace.append(f"r-{predicate}")
+        self.predicates += (predicate,)
+
+    def append_insert(self, table: str, **row):
+        """
+        Append the insert of a row with the given attribute values,
+        stored as a "w-table(attribute=value, ...)" write.
+        """
+        key = f"{table}({', '.join(f'{attribute}={value}' for attribute, value in row.items())})"
+        self.trace.append("w-" + key)
+        self.write_set.add(key)
+        self.inserts += ((table, row),)
 
     def clear(self):
         """
         Reset the transaction trace to an empty list.
         """
         self.trace = []
+        self.read_set = set()
+        self.write_set = set()
+        self.read_keysets = ()
+        self.write_keysets = ()
+        self.predicates = ()
+        self.inserts = ()
 
     def get_trace(self) -> list[str]:
         """
         Return transaction trace.
         """
-        return self.trace
\ No newline at end of file
+        return self.trace
+
+    def rows(self, key: str) -> list[str]:
+        """
+        Single-row keys an operation of this transaction on key touches:
+        the rows of the bulk operation recorded as key, or key itself.
+        """
+        for keyset in self.read_keysets + self.write_keysets:
+            if str(keyset) == key:
+                return keyset.rows()
+        return [key]
+
+    def reads(self, key: str) -> bool:
+        """
+        Whether this transaction reads key, itself or as one of the rows
+        of a bulk read.
+        """
+        return key in self.read_set or (bool(self.read_keysets) and _overlap(self.read_keysets, {key}, ()))
+
+    def writes(self, key: str) -> bool:
+        """
+        Whether this transaction writes key, itself or as one of the rows
+        of a bulk write.
+        """
+        return key in self.write_set or (bool(self.write_keysets) and _overlap(self.write_keysets, {key}, ()))
+
+    def conflicts_with(self, other: "Transaction") -> bool:
+        """
+        Whether the two transactions access a common key and at least one
+        of them writes it (a read-write, write-read or write-write
+        conflict). Each test iterates over the smaller of the two sets.
+        Bulk operations conflict with each other and with single keys
+        ("table(id)") on a common row, and predicate reads with inserts of
+        matching rows.
+        """
+        writes = self.write_set
+        other_writes = other.write_set
+        if not (writes.isdisjoint(other_writes)
+                and writes.isdisjoint(other.read_set)
+                and self.read_set.isdisjoint(other_writes)):
+            return True
+        if (self.predicates or other.predicates) and (_phantom(self.predicates, other) or _phantom(other.predicates, self)):
+            return True
+        if not (self.read_keysets or self.write_keysets or other.read_keysets or other.write_keysets):
+            return False
+        return (_overlap(self.write_keysets, other_writes | other.read_set, other.write_keysets + other.read_keysets)
+                or _overlap(self.read_keysets, other_writes, other.write_keysets)
+                or _overlap(other.write_keysets, writes | self.read_set, ())
+                or _overlap(other.read_keysets, writes, ()))
+
+class TransactionPool:
+    """
+    Bounded free list of Transaction instances for streaming consumers.
+
+    Generators and streams take a new_transaction factory (Transaction by
+    default); passing pool.acquire instead makes them build recycled
+    instances whose trace and key sets have been emptied, rather than
+    allocating a new instance and list. release() returns a transaction
+    to the pool once its consumer is done with it; its trace must not be
+    used afterwards. At most size instances are kept, extra ones are left
+    to the garbage collector. The Transaction class itself is never
+    changed, so transactions built elsewhere are unaffected.
+
+    Example usage:
+    >>> pool = TransactionPool(size=2)
+    >>> t = pool.acquire()
+    >>> t.append_read("cart0")
+    >>> pool.release(t)
+    >>> u = pool.acquire()
+    >>> u is t, u.get_trace(), type(Transaction()) is Transaction
+    (True, [], True)
+    """
+    def __init__(self, size: int = 1024):
+        self.size = size
+        self.free = []
+        self.created = 0
+
+    def acquire(self) -> Transaction:
+        """
+        Return an empty Transaction, recycled if one is available.
+        """
+        if self.free:
+            return self.free.pop()
+        self.created += 1
+        return Transaction()
+
+    def release(self, t: Transaction):
+        """
+        Give t back to the pool for reuse.
+        """
+        if len(self.free) < self.size:
+            t.trace.clear()
+            t.read_set.clear()
+            t.write_set.clear()
+            t.read_keysets = ()
+            t.write_keysets = ()
+            t.predicates = ()
+            t.inserts = ()
+            self.free.append(t)
+
+def pooled(transactions, pool: TransactionPool):
+    """
+    Yield the transactions of a stream built with new_transaction=
+    pool.acquire, releasing each one back to the pool when the next one
+    is requested. Consumers must be done with a transaction (e.g. have
+    serialized it) before asking for the next.
+    """
+    previous = None
+    for t in transactions:
+        if previous is not None:
+            pool.release(previous)
+        previous = t
+        yield t
+    if previous is not None:
+        pool.release(previous)
@@ -0,0 +1,171 @@
+"""
+Registry of every simulated transaction type.
+
+Each application module exposes, per transaction type, a *_generator that
+builds one Transaction, a *_stream that yields sampled transactions and a
+*_sim driver that prints them. This module names every type as
+"<application>.<transaction>" and resolves it to those functions, so
+analyses can pull traces from any application without knowing each
+module's naming. Application modules are only imported when one of their
+workloads is used, and this module itself does not import NumPy, so
+resolving names stays cheap.
+
+Example usage:
+>>> import numpy as np
+>>> np.random.seed(0)
+>>> for t in stream("broadleaf.get_next_id", 2):
+...     print(t)
+['r-id(44)', 'w-id(44)', 'w-id(44)']
+['r-id(64)', 'w-id(64)', 'w-id(64)']
+"""
+
+import importlib
+from transaction import TransactionPool, pooled
+
+
+class Workload:
+    """
+    One transaction type of one application.
+    """
+    def __init__(self, name: str, generator: str, stream: str, sim: str):
+        self.name = name
+        self.app = name.split(".", 1)[0]
+        self.generator_name = generator
+        self.stream_name = stream
+        self.sim_name = sim
+
+    def __repr__(self):
+        return f"Workload({self.name!r})"
+
+    @property
+    def module(self):
+        """
+        The application module, imported on first use.
+        """
+        return importlib.import_module(self.app)
+
+    @property
+    def generator(self):
+        return getattr(self.module, self.generator_name)
+
+    @property
+    def sim(self):
+        return getattr(self.module, self.sim_name)
+
+    def stream(self, num_txn: int, pool: TransactionPool = None, **kwargs):
+        """
+        Yield num_txn sampled transactions of this type. With a pool, the
+        transactions are built by pool.acquire and recycled (see
+        transaction.pooled).
+        """
+        if pool is None:
+            return getattr(self.module, self.stream_name)(num_txn, **kwargs)
+        transactions = getattr(self.module, self.stream_name)(num_txn, new_transaction=pool.acquire, **kwargs)
+        return pooled(transactions, pool)
+
+
+def _register(app: str, entries: list[tuple[str, str, str]]) -> dict[str, Workload]:
+    """
+    Build registry entries from (transaction, generator, sim) names. The
+    stream function is the sim name with _sim replaced by _stream.
+    """
+    return {
+        f"{app}.{txn}": Workload(f"{app}.{txn}", generator, sim[:-len("_sim")] + "_stream", sim)
+        for txn, generator, sim in entries
+    }
+
+
+WORKLOADS = {}
+WORKLOADS.update(_register("scmsuite", [
+    ("internal_save_retail", "scmsuite_internal_save_retail_generator", "scmsuite_internal_save_retail_sim"),
+    ("add_supply_order", "scmsuite_add_supply_order_generator", "scmsuite_add_supply_order_sim"),
+    ("get_update_sql", "scmsuite_get_update_sql_generator", "scmsuite_get_update_sql_sim"),
+    ("copy_catalog_form", "scmsuite_copy_catalog_form_generator", "scmsuite_copy_catalog_form_sim"),
+    ("remove_catalog_list", "scmsuite_remove_catalog_list_generator", "scmsuite_remove_catalog_list_sim"),
+]))
+WORKLOADS.update(_register("saleor", [
+    ("checkout_voucher_code", "saleor_checkout_voucher_code_generator", "saleor_checkout_voucher_code_sim"),
+    ("checkout_payment_process", "saleor_checkout_payment_process_generator", "saleor_checkout_payment_process_sim"),
+    ("cancel_order", "saleor_cancel_order_generator", "saleor_cancel_order_sim"),
+    ("payment_order", "saleor_payment_order", "saleor_payment_order_sim"),
+    ("order_fulfill", "saleor_order_fulfill_generator", "saleor_order_fulfill_sim"),
+    ("order_lines_create", "saleor_order_lines_create_generator", "saleor_order_lines_create_sim"),
+    ("stripe_handle_authorized_payment_intent", "saleor_stripe_handle_authorized_payment_intent_generator", "saleor_stripe_handle_authorized_payment_intent_sim"),
+    ("stock_bulk_update", "saleor_stock_bulk_update_generator", "saleor_stock_bulk_update_sim"),
+    ("delete_categories", "saleor_delete_categories_generator", "saleor_delete_categories_sim"),
+]))
+WORKLOADS.update(_register("spree", [
+    ("adjustment_update", "spree_adjustment_update_generator", "spree_adjustment_update_sim"),
+    ("checkout_controller", "spree_checkout_controller_generator", "spree_checkout_controller_sim"),
+    ("fulfillment_changer", "spree_fulfillment_changer_generator", "spree_fulfillment_changer_sim"),
+    ("remove_line_item", "spree_remove_line_item_generator", "spree_remove_line_item_sim"),
+    ("stock_item_update", "spree_stock_item_update_generator", "spree_stock_item_update_sim"),
+]))
+WORKLOADS.update(_register("broadleaf", [
+    ("update_order", "do_filter_internal_unless_ignored", "update_order_sim"),
+    ("rate_item", "rate_item", "rate_item_sim"),
+    ("order_payment", "savePaymentInfo", "order_payment_sim"),
+    ("save_offer", "save_offer_code", "save_offer_sim"),
+    ("get_offer", "lookup_offer_by_code", "get_offer_sim"),
+    ("get_next_id", "find_next_id", "get_next_id_sim"),
+    ("decrement_sku", "decrement_sku", "decrement_SKU_sim"),
+]))
+WORKLOADS.update(_register("mastodon", [
+    ("increment_counter_cache", "increment_counter_cache", "increment_counter_cache_sim"),
+    ("create_account", "create_account", "create_account_sim"),
+    ("update_account", "update_account", "update_account_sim"),
+    ("call", "call", "call_sim"),
+    ("deliver_votes", "deliver_votes", "deliver_votes_sim"),
+    ("process_status", "process_status", "process_status_sim"),
+    ("find_existing_status", "find_existing_status", "find_existing_status_sim"),
+    ("process_emoji", "process_emoji", "process_emoji_sim"),
+    ("create_backup", "create_backup", "create_backup_sim"),
+    ("show_media_attachment", "show_media_attachment", "show_media_attachment_sim"),
+    ("create_marker", "create_marker", "create_marker_sim"),
+]))
+
+APPS = ["scmsuite", "saleor", "spree", "broadleaf", "mastodon"]
+
+
+def get(name: str) -> Workload:
+    """
+    Look up a workload by "<application>.<transaction>" name.
+    """
+    if name not in WORKLOADS:
+        raise KeyError(f"unknown workload {name!r}; expected one of {sorted(WORKLOADS)}")
+    return WORKLOADS[name]
+
+def names(app: str = None) -> list[str]:
+    """
+    Return all workload names, or only those of one application.
+    """
+    return [name for name, workload in WORKLOADS.items() if app is None or workload.app == app]
+
+def resolve(selectors: list[str]) -> list[str]:
+    """
+    Expand a list of workload names and application names (which stand
+    for all of their workloads) into workload names.
+    """
+    resolved = []
+    for selector in selectors:
+        resolved.extend(names(selector) if selector in APPS else [get(selector).name])
+    return resolved
+
+def stream(name: str, num_txn: int, pool: TransactionPool = None, **kwargs):
+    """
+    Yield num_txn sampled transactions of the named workload.
+    """
+    return get(name).stream(num_txn, pool, **kwargs)
+
+def mix(workload_names: list[str], num_txn: int, weights: list[float] = None):
+    """
+    Yield num_txn (workload name, Transaction) pairs drawn from several
+    workloads. Each transaction's type is chosen independently with the
+    given weights (uniform by default).
+    """
+    import numpy as np
+    labels = np.random.choice(len(workload_names), size=num_txn, p=weights)
+    counts = np.bincount(labels, minlength=len(workload_names))
+    streams = [stream(name, int(count)) for name, count in zip(workload_names, counts)]
+    for label in labels.tolist():
+        yield workload_names[label], next(streams[label])